@@ -16,10 +16,27 @@ type ApiLog = {
   status: number;
   ok: boolean;
   duration: number;
+  serverTiming?: ServerTiming[];
   payload?: unknown;
   response: unknown;
 };
 
+type ServerTiming = {
+  name: string;
+  dur: number;
+};
+
+// "db;dur=0.12, total;dur=0.4" -> [{ name: "db", dur: 0.12 }, ...]
+function parseServerTiming(header: string | null): ServerTiming[] | undefined {
+  if (!header) return undefined;
+  const entries = header.split(",").flatMap((part) => {
+    const [name, ...params] = part.trim().split(";");
+    const dur = params.map((p) => p.trim()).find((p) => p.startsWith("dur="));
+    return name && dur ? [{ name, dur: Number(dur.slice(4)) }] : [];
+  });
+  return entries.length ? entries : undefined;
+}
+
 const servers: Record<ServerKey, ServerInfo> = {
   node: {
     name: "Node.js / Express",
@@ -94,6 +111,7 @@ export default function Page() {
         status: res.status,
         ok: res.ok,
         duration,
+        serverTiming: parseServerTiming(res.headers.get("Server-Timing")),
         payload: body,
         response: data,
       };
@@ -373,6 +391,11 @@ export default function Page() {
                   <span className="server-meta">{entry.duration.toFixed(1)} ms</span>
                 </div>
                 <div className="server-meta">{entry.endpoint} · {entry.status}</div>
+                {entry.serverTiming && (
+                  <div className="server-meta">
+                    Server: {entry.serverTiming.map((t) => `${t.name} ${t.dur.toFixed(2)} ms`).join(" · ")}
+                  </div>
+                )}
                 {entry.payload && (
                   <details style={{ marginTop: 6 }}>
                     <summary className="server-meta">Payload</summary>
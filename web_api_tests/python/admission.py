@@ -0,0 +1,157 @@
+"""Admission control: bounded concurrency with a CoDel-managed wait queue.
+
+At most MAX_IN_FLIGHT requests run inside the app at once. Excess requests
+wait in one of two FIFO queues (reads before writes) and are rejected fast
+with 503 + Retry-After when
+
+  * the queue is full (ADMISSION_QUEUE),
+  * they waited longer than QUEUE_TIMEOUT_MS, or
+  * CoDel decides the queue is standing: the wait time of dequeued
+    requests stayed above QUEUE_TARGET_MS for a whole QUEUE_INTERVAL_MS.
+
+Handlers that never await finish without yielding, so on a saturated event
+loop the backlog sits in the loop's ready queue rather than in our queue.
+Event-loop lag is that backlog's wait time: above LOOP_LAG_TARGET_MS writes
+are shed, above twice the target reads as well.
+
+Shedding early keeps latency of admitted requests near the target, so
+goodput stays flat past saturation instead of collapsing.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+
+EXEMPT_PREFIXES = ("/health", "/metrics", "/debug/", "/admin/", "/internal/")
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+Waiter = Tuple[float, asyncio.Future]
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_in_flight: int = int(os.environ.get("MAX_IN_FLIGHT", "64")),
+        queue_limit: int = int(os.environ.get("ADMISSION_QUEUE", "512")),
+        target_ms: float = float(os.environ.get("QUEUE_TARGET_MS", "5")),
+        interval_ms: float = float(os.environ.get("QUEUE_INTERVAL_MS", "100")),
+        timeout_ms: float = float(os.environ.get("QUEUE_TIMEOUT_MS", "500")),
+        lag_target_ms: float = float(os.environ.get("LOOP_LAG_TARGET_MS", "50")),
+        lag_ms: Optional[Callable[[], float]] = None,
+    ):
+        self.max_in_flight = max_in_flight
+        self.queue_limit = queue_limit
+        self.target = target_ms / 1000
+        self.interval = interval_ms / 1000
+        self.timeout = timeout_ms / 1000
+        self.lag_target_ms = lag_target_ms
+        self.lag_ms = lag_ms
+        self.in_flight = 0
+        self.reads: Deque[Waiter] = deque()
+        self.writes: Deque[Waiter] = deque()
+        self.first_above = 0.0  # CoDel: deadline after which a standing queue is shed
+        self.admitted = 0
+        self.rejected = {"loop_lag": 0, "queue_full": 0, "timeout": 0, "codel": 0}
+
+    @property
+    def queued(self) -> int:
+        return len(self.reads) + len(self.writes)
+
+    async def acquire(self, is_read: bool) -> Optional[str]:
+        """Wait for a slot; returns None when admitted, else the rejection reason"""
+        if self.lag_ms is not None and self.lag_target_ms > 0:
+            if self.lag_ms() > self.lag_target_ms * (2 if is_read else 1):
+                self.rejected["loop_lag"] += 1
+                return "loop_lag"
+        if self.in_flight < self.max_in_flight and not self.reads and not self.writes:
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+        if self.queued >= self.queue_limit:
+            self.rejected["queue_full"] += 1
+            return "queue_full"
+
+        fut = asyncio.get_running_loop().create_future()
+        (self.reads if is_read else self.writes).append((time.perf_counter(), fut))
+        try:
+            await asyncio.wait((fut,), timeout=self.timeout)
+        except asyncio.CancelledError:
+            if not fut.done():
+                fut.cancel()
+            elif fut.result() is None:
+                self.release()  # admitted just as we gave up
+            raise
+        if not fut.done():
+            fut.cancel()  # release() skips cancelled waiters
+            self.rejected["timeout"] += 1
+            return "timeout"
+        return fut.result()
+
+    def release(self):
+        """Free a slot and hand it to the next waiter that is still worth serving"""
+        self.in_flight -= 1
+        now = time.perf_counter()
+        while self.in_flight < self.max_in_flight:
+            queue = self.reads or self.writes
+            if not queue:
+                break
+            enqueued, fut = queue.popleft()
+            if fut.done():
+                continue
+            if self._codel_drop(now - enqueued, now):
+                self.rejected["codel"] += 1
+                fut.set_result("codel")
+                continue
+            self.in_flight += 1
+            self.admitted += 1
+            fut.set_result(None)
+
+    def _codel_drop(self, sojourn: float, now: float) -> bool:
+        if sojourn < self.target:
+            self.first_above = 0.0
+            return False
+        if self.first_above == 0.0:
+            self.first_above = now + self.interval
+            return False
+        return now >= self.first_above
+
+    def stats(self) -> dict:
+        """Gauges for /metrics"""
+        return {
+            "in_flight": self.in_flight,
+            "queued_reads": len(self.reads),
+            "queued_writes": len(self.writes),
+            "admitted_total": self.admitted,
+            **{f"rejected_{reason}_total": n for reason, n in self.rejected.items()},
+        }
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller: Optional[AdmissionController] = None,
+                 retry_after: int = int(os.environ.get("RETRY_AFTER_S", "1"))):
+        self.app = app
+        self.controller = controller or AdmissionController()
+        self.retry_after = str(retry_after).encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        reason = await self.controller.acquire(scope["method"] in READ_METHODS)
+        if reason is not None:
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", self.retry_after)],
+            })
+            await send({"type": "http.response.body",
+                        "body": b'{"detail":"Server overloaded (%s), retry later"}' % reason.encode()})
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
@@ -0,0 +1,280 @@
+"""Idempotency keys and in-flight request coalescing for writes and reads.
+
+`IdempotencyMiddleware` handles writes in two ways:
+
+  * With an `Idempotency-Key` header the response is remembered per
+    (client, method, path, key) for IDEMPOTENCY_TTL seconds, at most
+    IDEMPOTENCY_MAX_KEYS entries. The client is identified as the rate
+    limiter does it (ratelimit.py), so behind a proxy by X-Forwarded-For
+    when RATE_LIMIT_TRUST_FORWARDED=1. A retry gets the stored response replayed
+    (`Idempotent-Replayed: true`) without touching the Database; the same key
+    with a different body is a 422, a retry while the original is still
+    running waits for it.
+  * Without a key, identical concurrent submissions to the coalesced paths
+    (like, follow, comment) collapse: the first one runs, the others wait
+    and receive a copy of its response (`X-Coalesced: true`). The first one
+    yields to the event loop once before running (COALESCE_LINGER=0 turns
+    that off) so duplicates already queued behind it can join.
+
+5xx responses are never stored, so retries after server errors run again.
+
+`SingleFlightMiddleware` does the same for hot reads: identical in-flight
+GETs (same path and query) to the feed, comment and post list endpoints
+share one computation and one serialized body; every caller gets its own
+copy of the response (`X-Single-Flight: shared`). Requests only share if
+they started at the same data version (`scope["data_version"]`, set by
+replication.py), so X-Min-Version and X-Data-Version hold for shared
+responses too.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ratelimit import client_id
+
+COALESCE_PATHS = frozenset({"/api/likes", "/api/follow", "/api/comments"})
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+MAX_BODY = 64 * 1024
+SINGLE_FLIGHT_PATHS = (
+    r"/api/users/\d+/feed",
+    r"/api/users/\d+/posts",
+    r"/api/posts/\d+/comments",
+)
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class CapturedResponse:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: Headers, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    async def replay(self, send, extra_headers: Headers = ()):
+        await send({"type": "http.response.start", "status": self.status,
+                    "headers": self.headers + list(extra_headers)})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+async def capture(app, scope, receive, send) -> CapturedResponse:
+    """Run `app`, passing the response through to `send` and keeping a copy"""
+    status = 500
+    headers: Headers = []
+    chunks: List[bytes] = []
+
+    async def send_wrapper(message):
+        nonlocal status, headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+        await send(message)
+
+    await app(scope, receive, send_wrapper)
+    return CapturedResponse(status, headers, b"".join(chunks))
+
+
+async def read_body(receive, limit: int = MAX_BODY):
+    """Buffer the request body; returns (body or None if over `limit`, receive for the app)"""
+    chunks: List[dict] = []
+    size = 0
+    more = True
+    while more and size <= limit:
+        message = await receive()
+        chunks.append(message)
+        if message["type"] != "http.request":
+            break
+        size += len(message.get("body", b""))
+        more = message.get("more_body", False)
+
+    complete = not more and chunks[-1]["type"] == "http.request"
+    body = b"".join(m.get("body", b"") for m in chunks) if complete else None
+
+    async def replay_receive():
+        if chunks:
+            return chunks.pop(0)
+        return await receive()
+
+    return body, replay_receive
+
+
+def header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+class IdempotencyCache:
+    """Stored responses by idempotency key plus the requests currently running"""
+
+    def __init__(
+        self,
+        max_keys: int = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", "10000")),
+        ttl: float = float(os.environ.get("IDEMPOTENCY_TTL", "3600")),
+    ):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        # key -> (expires, body fingerprint, response); insertion order == expiry order
+        self.results: "OrderedDict[tuple, Tuple[float, bytes, CapturedResponse]]" = OrderedDict()
+        self.in_flight: Dict[tuple, Tuple[bytes, asyncio.Future]] = {}
+        self.counters = {"replayed": 0, "coalesced": 0, "conflicts": 0, "executed": 0}
+
+    def lookup(self, key):
+        stored = self.results.get(key)
+        if stored is not None and stored[0] < time.monotonic():
+            del self.results[key]
+            return None
+        return stored
+
+    def store(self, key, fingerprint: bytes, captured: CapturedResponse):
+        now = time.monotonic()
+        results = self.results
+        results[key] = (now + self.ttl, fingerprint, captured)
+        while len(results) > self.max_keys:
+            results.popitem(last=False)
+        while results:
+            expires = next(iter(results.values()))[0]
+            if expires >= now:
+                break
+            results.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Gauges for /metrics"""
+        return {"stored": len(self.results), "in_flight": len(self.in_flight),
+                **{f"{name}_total": n for name, n in self.counters.items()}}
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, cache: Optional[IdempotencyCache] = None, coalesce_paths=COALESCE_PATHS,
+                 linger: bool = os.environ.get("COALESCE_LINGER", "1") != "0",
+                 identify: Callable[[dict], str] = client_id):
+        self.app = app
+        self.cache = cache or IdempotencyCache()
+        self.identify = identify  # scope -> client; RateLimiter.client in main.py
+        self.coalesce_paths = coalesce_paths
+        self.linger = linger
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = header(scope, b"idempotency-key")
+        if idempotency_key is None and scope["path"] not in self.coalesce_paths:
+            await self.app(scope, receive, send)
+            return
+
+        body, receive = await read_body(receive)
+        if body is None:
+            await self.app(scope, receive, send)
+            return
+        fingerprint = hashlib.blake2b(body, digest_size=16).digest()
+        cache = self.cache
+
+        if idempotency_key is not None:
+            key = (self.identify(scope), scope["method"], scope["path"], idempotency_key)
+            stored = cache.lookup(key)
+            if stored is not None:
+                if stored[1] != fingerprint:
+                    await self._conflict(send, 422, b"Idempotency-Key reused with a different request body")
+                    return
+                cache.counters["replayed"] += 1
+                await stored[2].replay(send, [(b"idempotent-replayed", b"true")])
+                return
+            replay_header = (b"idempotent-replayed", b"true")
+        else:
+            key = ("coalesce", scope["method"], scope["path"], fingerprint)
+            replay_header = (b"x-coalesced", b"true")
+
+        flight = cache.in_flight.get(key)
+        if flight is not None:
+            if flight[0] != fingerprint:
+                await self._conflict(send, 409, b"A request with this Idempotency-Key is still in progress")
+                return
+            captured = await asyncio.shield(flight[1])
+            if captured is not None:
+                cache.counters["coalesced"] += 1
+                await captured.replay(send, [replay_header])
+                return
+            # The leader failed or was cancelled: run this request on its own
+            await self.app(scope, receive, send)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        cache.in_flight[key] = (fingerprint, future)
+        captured = None
+        try:
+            if idempotency_key is None and self.linger:
+                # Handlers never yield, so without this duplicates that are
+                # already scheduled would run one after another, not join
+                await asyncio.sleep(0)
+            cache.counters["executed"] += 1
+            captured = await capture(self.app, scope, receive, send)
+        finally:
+            del cache.in_flight[key]
+            future.set_result(captured)
+        if idempotency_key is not None and captured.status < 500:
+            cache.store(key, fingerprint, captured)
+
+    async def _conflict(self, send, status: int, detail: bytes):
+        self.cache.counters["conflicts"] += 1
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"detail":"%s"}' % detail})
+
+
+class SingleFlight:
+    """Computations currently running, keyed by request"""
+
+    def __init__(self):
+        self.in_flight: Dict[tuple, asyncio.Future] = {}
+        self.counters = {"executed": 0, "shared": 0}
+
+    def stats(self) -> dict:
+        """Gauges for /metrics"""
+        return {"in_flight": len(self.in_flight), **{f"{name}_total": n for name, n in self.counters.items()}}
+
+
+class SingleFlightMiddleware:
+    def __init__(self, app, group: Optional[SingleFlight] = None, paths=SINGLE_FLIGHT_PATHS,
+                 linger: bool = os.environ.get("COALESCE_LINGER", "1") != "0"):
+        self.app = app
+        self.group = group or SingleFlight()
+        self.pattern = re.compile("|".join(f"(?:{p})" for p in paths))
+        self.linger = linger
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not self.pattern.fullmatch(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        group = self.group
+        key = (scope["path"], scope["query_string"], scope.get("data_version"))
+        future = group.in_flight.get(key)
+        if future is not None:
+            captured = await asyncio.shield(future)
+            if captured is not None and captured.status < 500:
+                group.counters["shared"] += 1
+                await captured.replay(send, [(b"x-single-flight", b"shared")])
+                return
+            await self.app(scope, receive, send)
+            return
+
+        future = group.in_flight[key] = asyncio.get_running_loop().create_future()
+        captured = None
+        try:
+            if self.linger:
+                await asyncio.sleep(0)  # let identical requests already queued join
+            group.counters["executed"] += 1
+            captured = await capture(self.app, scope, receive, send)
+        finally:
+            del group.in_flight[key]
+            future.set_result(captured)
@@ -1,8 +1,11 @@
 import asyncio
 import aiohttp
 import time
+import uuid
 
 BASE_URL = "http://localhost:3001"
+# Keeps this run's concurrent{i} users apart from earlier runs' users
+RUN_ID = uuid.uuid4().hex[:6]
 
 async def make_request(session, method, path, json=None):
     async with session.request(method, f"{BASE_URL}{path}", json=json) as resp:
@@ -25,8 +28,8 @@ async def run_concurrent_test():
         user_ids = []
         for i in range(50):
             res = await make_request(session, "POST", "/api/users", {
-                "username": f"concurrent{i}",
-                "email": f"concurrent{i}@example.com",
+                "username": f"concurrent{i}_{RUN_ID}",
+                "email": f"concurrent{i}_{RUN_ID}@example.com",
                 "displayName": f"Concurrent User {i}",
             })
             user_ids.append(res["data"]["id"])
@@ -0,0 +1,98 @@
+import gc
+import itertools
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from edges import EdgeStore
+
+# In-process memory benchmark of the edge store against the previous
+# representations: likes as a set of (post_id, user_id) tuples and followers
+# as a defaultdict(set). Likes per post and followers per user are Zipf
+# distributed, so a few keys are huge and most have a handful of members.
+
+EDGES = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+KEYS = 200_000
+USERS = 1_000_000
+LOOKUPS = 200_000
+
+def generate_edges():
+    random.seed(42)
+    cumulative = list(itertools.accumulate(1 / (i + 1) for i in range(KEYS)))
+    keys = random.choices(range(1, KEYS + 1), cum_weights=cumulative, k=EDGES)
+    return [(key, random.randrange(1, USERS)) for key in keys]
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    structure = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return structure, size, elapsed
+
+def build_tuple_set(edges):
+    # int() copies, as ids parsed from request bodies are separate objects
+    return lambda: {(int(str(key)), int(str(member))) for key, member in edges}
+
+def build_set_dict(edges):
+    def build():
+        sets = defaultdict(set)
+        for key, member in edges:
+            sets[int(str(key))].add(int(str(member)))
+        return sets
+    return build
+
+def build_edge_store(edges):
+    def build():
+        store = EdgeStore()
+        for key, member in edges:
+            store.add(key, member)
+        return store
+    return build
+
+def time_lookups(contains, probes):
+    start = time.perf_counter()
+    for key, member in probes:
+        contains(key, member)
+    return (time.perf_counter() - start) / len(probes) * 1e9
+
+def run_edge_store_benchmark():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - EDGE STORE BENCHMARK")
+    print("========================================\n")
+
+    print(f"Generating {EDGES} edges over {KEYS} keys...")
+    edges = generate_edges()
+    probes = random.sample(edges, LOOKUPS // 2) + [(random.randrange(1, KEYS), random.randrange(1, USERS))
+                                                   for _ in range(LOOKUPS // 2)]
+
+    tuples, tuples_bytes, tuples_time = measure(build_tuple_set(edges))
+    tuples_lookup = time_lookups(lambda key, member: (key, member) in tuples, probes)
+    del tuples
+    sets, sets_bytes, sets_time = measure(build_set_dict(edges))
+    sets_lookup = time_lookups(lambda key, member: member in sets.get(key, ()), probes)
+    del sets
+    store, store_bytes, store_time = measure(build_edge_store(edges))
+    store_lookup = time_lookups(store.contains, probes)
+    count = len(store)
+
+    print(f"  ✓ {count} distinct edges\n")
+    print("========================================")
+    print(f"{'Structure':<22} {'MB':>8} {'B/edge':>8} {'Build s':>8} {'Lookup ns':>10}")
+    for name, size, elapsed, lookup in (
+        ("set of tuples", tuples_bytes, tuples_time, tuples_lookup),
+        ("defaultdict(set)", sets_bytes, sets_time, sets_lookup),
+        ("EdgeStore", store_bytes, store_time, store_lookup),
+    ):
+        print(f"{name:<22} {size / 1e6:>8.1f} {size / count:>8.1f} {elapsed:>8.1f} {lookup:>10.0f}")
+    print("========================================")
+    print(f"Reduction: {tuples_bytes / store_bytes:.1f}x vs set of tuples (likes), "
+          f"{sets_bytes / store_bytes:.1f}x vs defaultdict(set) (followers)")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    run_edge_store_benchmark()
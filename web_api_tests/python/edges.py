@@ -0,0 +1,249 @@
+"""Compact adjacency sets for likes and follow edges.
+
+A set of (post_id, user_id) tuples costs over 100 bytes per edge: the tuple,
+its int objects and the hash slot. `EdgeStore` maps a key (post or followed
+user) to its members, packed by size:
+
+  1 member           the int itself
+  up to ARRAY_MAX    sorted array('I'), 4 bytes per member
+  more               `Bitmap`: roaring-style containers per high 16 bits,
+                     either a sorted array('H') (2 bytes per member) or a
+                     fixed 8 KB bitmap once a container gets dense
+
+Membership is a bisect or a bit test. Inserting into an array is a memmove
+of at most ARRAY_MAX * 4 bytes. Members must fit in an unsigned 32-bit int.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Union
+
+MAX_MEMBER = 2 ** 32 - 1
+
+
+class Bitmap:
+    CONTAINER_MAX = 4096  # array('H') above this is bigger than the 8 KB bitmap
+
+    __slots__ = ("containers", "counts", "size")
+
+    def __init__(self, members=()):
+        self.containers: Dict[int, Union[array, bytearray]] = {}
+        self.counts: Dict[int, int] = {}
+        self.size = 0
+        for member in members:
+            self.add(member)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, member: int) -> bool:
+        container = self.containers.get(member >> 16)
+        if container is None:
+            return False
+        low = member & 0xFFFF
+        if type(container) is bytearray:
+            return bool(container[low >> 3] & (1 << (low & 7)))
+        i = bisect_left(container, low)
+        return i < len(container) and container[i] == low
+
+    def add(self, member: int) -> bool:
+        high, low = member >> 16, member & 0xFFFF
+        container = self.containers.get(high)
+        if container is None:
+            self.containers[high] = array("H", (low,))
+            self.counts[high] = 1
+            self.size += 1
+            return True
+        if type(container) is bytearray:
+            bit = 1 << (low & 7)
+            if container[low >> 3] & bit:
+                return False
+            container[low >> 3] |= bit
+        else:
+            i = bisect_left(container, low)
+            if i < len(container) and container[i] == low:
+                return False
+            container.insert(i, low)
+            if len(container) > self.CONTAINER_MAX:
+                bits = bytearray(8192)
+                for value in container:
+                    bits[value >> 3] |= 1 << (value & 7)
+                self.containers[high] = bits
+        self.counts[high] += 1
+        self.size += 1
+        return True
+
+    def remove(self, member: int) -> bool:
+        high, low = member >> 16, member & 0xFFFF
+        container = self.containers.get(high)
+        if container is None:
+            return False
+        if type(container) is bytearray:
+            bit = 1 << (low & 7)
+            if not container[low >> 3] & bit:
+                return False
+            container[low >> 3] &= ~bit
+        else:
+            i = bisect_left(container, low)
+            if i == len(container) or container[i] != low:
+                return False
+            del container[i]
+        self.size -= 1
+        count = self.counts[high] = self.counts[high] - 1
+        if count == 0:
+            del self.containers[high]
+            del self.counts[high]
+        elif type(container) is bytearray and count <= self.CONTAINER_MAX // 2:
+            self.containers[high] = array("H", self._bits(container))
+        return True
+
+    @staticmethod
+    def _bits(bits: bytearray) -> Iterator[int]:
+        for byte_index, byte in enumerate(bits):
+            while byte:
+                lowest = byte & -byte
+                yield byte_index << 3 | (lowest.bit_length() - 1)
+                byte ^= lowest
+
+    def __iter__(self) -> Iterator[int]:
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            values = self._bits(container) if type(container) is bytearray else container
+            base = high << 16
+            for low in values:
+                yield base | low
+
+    def page(self, after: int, limit: int) -> List[int]:
+        result: List[int] = []
+        for high in sorted(h for h in self.containers if h >= after >> 16):
+            container = self.containers[high]
+            base = high << 16
+            if type(container) is bytearray:
+                values = self._bits(container)
+            else:
+                values = container[bisect_right(container, after - base):] if after >= base else container
+            for low in values:
+                if base | low > after:
+                    result.append(base | low)
+                    if len(result) == limit:
+                        return result
+        return result
+
+    def nbytes(self) -> int:
+        return sum(len(c) if type(c) is bytearray else c.itemsize * len(c)
+                   for c in self.containers.values())
+
+
+class EdgeStore:
+    ARRAY_MAX = 4096
+
+    def __init__(self):
+        self.sets: Dict[int, Union[int, array, Bitmap]] = {}
+        self.edges = 0
+
+    def __len__(self) -> int:
+        return self.edges
+
+    def contains(self, key: int, member: int) -> bool:
+        members = self.sets.get(key)
+        if members is None:
+            return False
+        if type(members) is int:
+            return members == member
+        if type(members) is array:
+            i = bisect_left(members, member)
+            return i < len(members) and members[i] == member
+        return member in members
+
+    def add(self, key: int, member: int) -> bool:
+        if not 0 <= member <= MAX_MEMBER:
+            raise ValueError(f"member {member} out of range")
+        members = self.sets.get(key)
+        if members is None:
+            self.sets[key] = member
+        elif type(members) is int:
+            if members == member:
+                return False
+            self.sets[key] = array("I", sorted((members, member)))
+        elif type(members) is array:
+            i = bisect_left(members, member)
+            if i < len(members) and members[i] == member:
+                return False
+            members.insert(i, member)
+            if len(members) > self.ARRAY_MAX:
+                self.sets[key] = Bitmap(members)
+        elif not members.add(member):
+            return False
+        self.edges += 1
+        return True
+
+    def remove(self, key: int, member: int) -> bool:
+        members = self.sets.get(key)
+        if members is None:
+            return False
+        if type(members) is int:
+            if members != member:
+                return False
+            del self.sets[key]
+        elif type(members) is array:
+            i = bisect_left(members, member)
+            if i == len(members) or members[i] != member:
+                return False
+            del members[i]
+            if len(members) == 1:
+                self.sets[key] = members[0]
+        else:
+            if not members.remove(member):
+                return False
+            if len(members) <= self.ARRAY_MAX // 2:
+                self.sets[key] = array("I", members)
+        self.edges -= 1
+        return True
+
+    def count(self, key: int) -> int:
+        members = self.sets.get(key)
+        if members is None:
+            return 0
+        return 1 if type(members) is int else len(members)
+
+    def keys(self) -> Iterator[int]:
+        return iter(self.sets)
+
+    def members(self, key: int) -> Iterator[int]:
+        """Members of `key` in ascending order"""
+        members = self.sets.get(key)
+        if members is None:
+            return iter(())
+        if type(members) is int:
+            return iter((members,))
+        return iter(members)
+
+    def page(self, key: int, after: int, limit: int) -> List[int]:
+        """Up to `limit` members of `key` greater than `after`, ascending"""
+        members = self.sets.get(key)
+        if members is None:
+            return []
+        if type(members) is int:
+            return [members] if members > after and limit > 0 else []
+        if type(members) is array:
+            i = bisect_right(members, after)
+            return members[i:i + limit].tolist()
+        return members.page(after, limit)
+
+    def last(self, key: int, limit: int) -> List[int]:
+        """Up to `limit` largest members of `key`, descending"""
+        members = self.sets.get(key)
+        if members is None or limit <= 0:
+            return []
+        if type(members) is int:
+            return [members]
+        if type(members) is array:
+            return members[:-limit - 1:-1].tolist()
+        return list(members)[:-limit - 1:-1]
+
+    def discard(self, key: int) -> List[int]:
+        """Drop all edges of `key` and return its former members"""
+        removed = list(self.members(key))
+        self.sets.pop(key, None)
+        self.edges -= len(removed)
+        return removed
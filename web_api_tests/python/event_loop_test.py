@@ -0,0 +1,109 @@
+import asyncio
+import gc
+import os
+import statistics
+import sys
+import time
+
+# Feed requests must not be shed by admission control during the inline run
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import main
+from overhead_test import call
+from process_pool import FORK_AVAILABLE, ProcessPool, WORKERS as PROCESS_POOL_WORKERS
+from ratelimit import TokenBucketStore
+from storage import OFFLOAD_THREADS, MemoryStorage
+
+# In-process check that a slow storage call no longer stalls the event loop:
+# a celebrity with FOLLOWERS followers (one post each) has an expensive feed.
+# FEED_CLIENTS tasks request it back to back while a probe calls /health
+# every PROBE_INTERVAL seconds. With the feed run inline, each probe waits
+# for the feeds ahead of it; offloaded to storage threads, /health is only
+# delayed by GIL hand-offs; in the process pool (process_pool.py) the feeds
+# also stop competing for the GIL.
+
+FOLLOWERS = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+DURATION = 5.0
+FEED_CLIENTS = 4
+PROBE_INTERVAL = 0.01
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99)], samples[-1]
+
+async def run_mode(storage):
+    main.db = storage
+    feeds = 0
+    probes = []
+    deadline = time.monotonic() + DURATION
+
+    async def feed_client():
+        nonlocal feeds
+        while time.monotonic() < deadline:
+            await call(main.app, "GET", "/api/users/1/feed")
+            feeds += 1
+
+    async def probe():
+        # Measured from when the probe was due, like a client whose request
+        # arrives then and waits for the loop to get to it
+        while time.monotonic() < deadline:
+            due = time.perf_counter() + PROBE_INTERVAL
+            await asyncio.sleep(PROBE_INTERVAL)
+            await call(main.app, "GET", "/health")
+            probes.append((time.perf_counter() - due) * 1000)
+
+    await asyncio.gather(probe(), *(feed_client() for _ in range(FEED_CLIENTS)))
+    return feeds / DURATION, percentiles(probes)
+
+async def run_event_loop_test():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - EVENT LOOP TEST")
+    print("========================================\n")
+
+    main.rate_limiter.store = TokenBucketStore(rate=1e9, burst=1e9)
+    database = main.Database()
+    celebrity = database.create_user("celebrity", "celebrity@example.com", "Celebrity")
+    for i in range(FOLLOWERS):
+        user = database.create_user(f"fan{i}", f"fan{i}@example.com", f"Fan {i}")
+        database.follow(user.id, celebrity.id)
+        database.create_post(user.id, f"Post {i}")
+    # The seeded data is long-lived like a warmed-up server's; keep it out of
+    # GC passes so the numbers show scheduling, not collection pauses
+    gc.freeze()
+    start = time.perf_counter()
+    database.get_feed(celebrity.id)
+    print(f"Feed of a user with {FOLLOWERS} followers: {(time.perf_counter() - start) * 1000:.1f}ms")
+    print(f"{FEED_CLIENTS} feed clients, /health probe every {PROBE_INTERVAL * 1000:.0f}ms, {DURATION:.0f}s per mode\n")
+
+    print("========================================")
+    print("     /health LATENCY UNDER FEED LOAD")
+    print("========================================")
+    print(f"{'Mode':<22} {'feeds/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    results = {}
+    for name, threads in (("inline", 0), (f"offloaded ({OFFLOAD_THREADS} threads)", OFFLOAD_THREADS)):
+        storage = MemoryStorage(database, threads)
+        main.process_pool = None
+        rate, (p50, p99, worst) = await run_mode(storage)
+        if storage.pool is not None:
+            storage.pool.shutdown()
+        results[threads] = p99
+        print(f"{name:<22} {rate:>8.1f} {p50:>8.2f} {p99:>8.2f} {worst:>8.2f}")
+    if FORK_AVAILABLE and PROCESS_POOL_WORKERS:
+        storage = MemoryStorage(database)
+        main.process_pool = ProcessPool(database, gate=storage.exclusive, version=lambda: 0)  # no writes here
+        await storage.exclusive(main.process_pool.refresh)
+        rate, (p50, p99, worst) = await run_mode(storage)
+        main.process_pool.close()
+        storage.pool.shutdown()
+        name = f"processes ({PROCESS_POOL_WORKERS} workers)"
+        print(f"{name:<22} {rate:>8.1f} {p50:>8.2f} {p99:>8.2f} {worst:>8.2f}")
+    print("========================================")
+    if results[OFFLOAD_THREADS] < results[0] / 2:
+        print(f"✓ Offloading cuts /health p99 {results[0] / results[OFFLOAD_THREADS]:.0f}x")
+    else:
+        print("✗ /health is still blocked by the feed queries")
+    print("========================================\n")
+    database.close()
+
+if __name__ == "__main__":
+    asyncio.run(run_event_loop_test())
@@ -0,0 +1,81 @@
+"""Follow-graph queries over the followers/following edge stores.
+
+Every query stops after GRAPH_MAX_WORK member visits and reports that it was
+truncated. In a power-law graph one celebrity account would otherwise turn
+"people you may know" into a scan of millions of edges. Degree counts are
+kept as histograms that follow/unfollow update in O(1).
+"""
+
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from edges import EdgeStore
+
+MAX_WORK = int(os.environ.get("GRAPH_MAX_WORK", "20000"))
+
+
+def intersect(a: EdgeStore, a_key: int, b: EdgeStore, b_key: int,
+              max_work: int = MAX_WORK) -> Tuple[List[int], bool]:
+    """Members of both sets: walks the smaller one and probes the larger one"""
+    if a.count(a_key) > b.count(b_key):
+        a, a_key, b, b_key = b, b_key, a, a_key
+    common = []
+    for work, member in enumerate(a.members(a_key)):
+        if work == max_work:
+            return common, True
+        if b.contains(b_key, member):
+            common.append(member)
+    return common, False
+
+
+def suggestions(following: EdgeStore, user_id: int, limit: int,
+                max_work: int = MAX_WORK) -> Tuple[List[Tuple[int, int]], bool]:
+    """Friends of friends not yet followed, as (user id, shared connections)
+
+    Each followed account may contribute at most its share of the work cap,
+    so one account with a huge following list cannot use it all up.
+    """
+    friends = following.count(user_id)
+    share = max(16, max_work // max(friends, 1))
+    counts: Counter = Counter()
+    work, truncated = 0, False
+    for friend in following.members(user_id):
+        if work >= max_work:
+            truncated = True
+            break
+        for visited, candidate in enumerate(following.members(friend)):
+            if visited == share or work >= max_work:
+                truncated = True
+                break
+            work += 1
+            if candidate != user_id and not following.contains(user_id, candidate):
+                counts[candidate] += 1
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit], truncated
+
+
+class DegreeHistogram:
+    """Number of users per degree, for users with degree > 0"""
+
+    def __init__(self):
+        self.counts: Dict[int, int] = defaultdict(int)
+
+    def move(self, old: int, new: int):
+        if old:
+            self.counts[old] -= 1
+            if not self.counts[old]:
+                del self.counts[old]
+        if new:
+            self.counts[new] += 1
+
+    def buckets(self, users: int) -> List[Tuple[int, int, int]]:
+        """(min degree, max degree, users) in power-of-two buckets, from degree 0"""
+        nonzero = sum(self.counts.values())
+        result = [(0, 0, max(users - nonzero, 0))]
+        merged: Dict[int, int] = defaultdict(int)
+        for degree, count in self.counts.items():
+            merged[degree.bit_length()] += count
+        for bits in sorted(merged):
+            result.append((1 << (bits - 1), (1 << bits) - 1, merged[bits]))
+        return result
@@ -0,0 +1,92 @@
+import itertools
+import random
+import statistics
+import sys
+import time
+
+from main import Database
+
+# In-process benchmark of the follow-graph queries on a synthetic power-law
+# graph: who follows and who gets followed are both Zipf distributed (drawn
+# from independent permutations of the user ids), so there are celebrity
+# accounts with huge follower lists and heavy users who follow thousands.
+
+EDGES = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+USERS = 100_000
+SAMPLES = 1000
+
+def zipf_sampler():
+    ids = list(range(1, USERS + 1))
+    random.shuffle(ids)
+    cumulative = list(itertools.accumulate(1 / (i + 1) for i in range(USERS)))
+    return lambda count: random.choices(ids, cum_weights=cumulative, k=count)
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (statistics.median(samples), samples[int(len(samples) * 0.99)], samples[-1])
+
+def time_query(query, user_ids):
+    timings, truncated = [], 0
+    for user_id in user_ids:
+        start = time.perf_counter()
+        result = query(user_id, 20)
+        timings.append((time.perf_counter() - start) * 1000)
+        truncated += result.truncated
+    return percentiles(timings), truncated
+
+def run_graph_benchmark():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - FOLLOW GRAPH BENCHMARK")
+    print("========================================\n")
+
+    random.seed(42)
+    db = Database()
+    for i in range(1, USERS + 1):
+        db.create_user(f"user{i}", f"user{i}@example.com", f"User {i}")
+
+    print(f"Building graph with {EDGES} follow edges over {USERS} users...")
+    follower_ids, followed_ids = zipf_sampler(), zipf_sampler()
+    attempts, elapsed = 0, 0.0
+    while len(db.followers) < EDGES:
+        # Popular pairs repeat, so draw more pairs until enough distinct edges exist
+        missing = EDGES - len(db.followers)
+        pairs = list(zip(follower_ids(missing * 2), followed_ids(missing * 2)))
+        start = time.perf_counter()
+        for follower_id, following_id in pairs:
+            attempts += 1
+            db.follow(follower_id, following_id)
+            if len(db.followers) == EDGES:
+                break
+        elapsed += time.perf_counter() - start
+    print(f"  ✓ {len(db.followers)} edges in {elapsed:.1f}s ({attempts / elapsed:.0f} follows/sec)")
+
+    random_users = random.sample(range(1, USERS + 1), SAMPLES)
+    heavy_users = sorted(range(1, USERS + 1), key=db.following.count, reverse=True)[:SAMPLES // 10]
+    print(f"  ✓ Max followers {max(db.followers.count(u) for u in range(1, USERS + 1))}, "
+          f"max following {db.following.count(heavy_users[0])}\n")
+
+    print("========================================")
+    print("      QUERY LATENCY (ms, limit 20)")
+    print("========================================")
+    print(f"{'Query':<26} {'p50':>7} {'p99':>7} {'max':>7} {'truncated':>10}")
+    for name, query, users in (
+        ("mutuals (random users)", db.get_mutuals, random_users),
+        ("mutuals (heavy users)", db.get_mutuals, heavy_users),
+        ("suggestions (random)", db.get_suggestions, random_users),
+        ("suggestions (heavy)", db.get_suggestions, heavy_users),
+    ):
+        (p50, p99, worst), truncated = time_query(query, users)
+        print(f"{name:<26} {p50:>7.2f} {p99:>7.2f} {worst:>7.2f} {truncated:>5}/{len(users)}")
+
+    start = time.perf_counter()
+    distribution = db.degree_distribution()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{'degree distribution':<26} {elapsed:>7.2f}")
+    print("========================================")
+    print("Followers per user:")
+    for bucket in distribution.followers:
+        print(f"  {bucket.min:>6}-{bucket.max:<6} {bucket.users:>7}")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    run_graph_benchmark()
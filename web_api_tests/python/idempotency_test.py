@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+
+# As in docker-compose-lb.yml: behind Traefik every request comes from the
+# proxy's IP and the client is the first X-Forwarded-For hop
+os.environ["RATE_LIMIT_TRUST_FORWARDED"] = "1"
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import main
+
+# In-process check that Idempotency-Key is scoped per client behind a proxy:
+# two clients reusing the same key each get their own response, and a retry
+# gets the stored response of the client that sent it.
+
+PROXY = ("10.0.0.2", 40000)
+KEY = "shared-key-123"
+
+async def post(path, body, forwarded_for, key=KEY):
+    payload = json.dumps(body).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode()),
+                    (b"x-forwarded-for", forwarded_for.encode()), (b"idempotency-key", key.encode())],
+        "client": PROXY, "server": ("127.0.0.1", 3001),
+    }
+    sent = False
+    response = {"body": b""}
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message["headers"])
+        else:
+            response["body"] += message.get("body", b"")
+
+    await main.app(scope, receive, send)
+    return response["status"], response["headers"].get(b"idempotent-replayed"), json.loads(response["body"])
+
+async def run_idempotency_test():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - IDEMPOTENCY TEST")
+    print("========================================\n")
+
+    user = main.database.create_user("idem", "idem@example.com", "Idem")
+    failures = []
+
+    def check(name, ok):
+        print(f"  {'✓' if ok else '✗'} {name}")
+        if not ok:
+            failures.append(name)
+
+    status_a, replayed_a, post_a = await post("/api/posts", {"userId": user.id, "content": "from A"}, "203.0.113.1")
+    check("client A creates its post", status_a == 201 and replayed_a is None)
+    status_b, replayed_b, post_b = await post("/api/posts", {"userId": user.id, "content": "from B"}, "203.0.113.2")
+    check("client B with the same key is not replayed A's post",
+          status_b == 201 and replayed_b is None and post_b["id"] != post_a["id"])
+    status, replayed, again = await post("/api/posts", {"userId": user.id, "content": "from A"}, "203.0.113.1")
+    check("client A's retry replays A's post", status == 201 and replayed == b"true" and again["id"] == post_a["id"])
+
+    print("\n========================================")
+    print("✗ Idempotency check failed" if failures else "✓ Idempotency keys are scoped per client")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    asyncio.run(run_idempotency_test())
@@ -0,0 +1,148 @@
+import asyncio
+import gc
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+# Writes must not be shed by admission control while the loop is busy
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import ingest
+import main
+from models import Post
+from overhead_test import call
+
+# In-process comparison of the write path with and without ingest.py: runs
+# the stress_test.py write phases (users, posts, comments, likes, follows)
+# through the ASGI app, twice the requests each, the lean decoding and the
+# pydantic request models (LEAN_INGEST=0) taking turns every CHUNK requests
+# so drift on a busy machine hits both. Reports throughput per phase and, under
+# tracemalloc, the memory a request allocates at its peak and the blocks it
+# leaves behind. Allocations inside pydantic-core's Rust code are not seen by
+# tracemalloc, so the pydantic side is if anything under-counted.
+
+PHASES = (("users", 500), ("posts", 2000), ("comments", 5000), ("likes", 5000), ("follows", 2000))
+CHUNK = 50  # requests per turn; the two paths take turns within each phase
+SAMPLE = 200  # requests per phase measured under tracemalloc
+
+def phase_requests(tag, scale=1):
+    """(phase, [(path, body)]) in stress_test.py order, `scale` times the requests; all writes succeed"""
+    database = main.database
+    first_user = database.user_id + 1
+    yield "users", [("/api/users", {"username": f"ingest{i}_{tag}", "email": f"ingest{i}_{tag}@example.com",
+                                    "displayName": f"Ingest User {i}"}) for i in range(PHASES[0][1] * scale)]
+    users = list(range(first_user, database.user_id + 1))
+    first_post = database.post_id + 1
+    yield "posts", [("/api/posts", {"userId": users[i % len(users)], "content": f"Stress post {i}"})
+                    for i in range(PHASES[1][1] * scale)]
+    posts = list(range(first_post, database.post_id + 1))
+    yield "comments", [("/api/comments", {"postId": posts[i % len(posts)], "userId": users[i % len(users)],
+                                          "text": f"Spam comment {i}"}) for i in range(PHASES[2][1] * scale)]
+    # Distinct pairs, so no like or follow is rejected as a duplicate
+    yield "likes", [("/api/likes", {"postId": posts[i % len(posts)], "userId": users[i // len(posts)]})
+                    for i in range(PHASES[3][1] * scale)]
+    yield "follows", [("/api/follow", {"followerId": users[i % len(users)],
+                                       "followingId": users[(i % len(users) + 1 + i // len(users)) % len(users)]})
+                      for i in range(PHASES[4][1] * scale)]
+
+async def run_phases():
+    """Per phase: {lean: requests/s}, the two paths alternating every CHUNK requests"""
+    rates = {}
+    for phase, requests in phase_requests("t", scale=2):
+        elapsed = {False: 0.0, True: 0.0}
+        for turn, first in enumerate(range(0, len(requests), CHUNK)):
+            lean = ingest.ENABLED = bool(turn % 2)
+            start = time.perf_counter()
+            for path, body in requests[first:first + CHUNK]:
+                await call(main.app, "POST", path, body)
+            elapsed[lean] += time.perf_counter() - start
+        rates[phase] = {lean: len(requests) / 2 / seconds for lean, seconds in elapsed.items()}
+        print(f"  ✓ {phase}: {len(requests)} requests")
+    return rates
+
+async def run_allocations(tag):
+    """Per phase: (peak bytes per request, blocks retained per request, bytes retained per request)"""
+    results = {}
+    tracemalloc.start()
+    for phase, requests in phase_requests(tag):
+        requests = requests[:SAMPLE]
+        peaks = []
+        gc.collect()
+        before = tracemalloc.take_snapshot()
+        for path, body in requests:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            await call(main.app, "POST", path, body)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        gc.collect()
+        diff = tracemalloc.take_snapshot().compare_to(before, "filename")
+        results[phase] = (sorted(peaks)[len(peaks) // 2], sum(stat.count_diff for stat in diff) / len(requests),
+                          sum(stat.size_diff for stat in diff) / len(requests))
+    tracemalloc.stop()
+    return results
+
+def bench_decode(iterations=50000):
+    """µs per POST /api/posts body, decode plus the stored Post, for both paths"""
+    body = json.dumps({"userId": 42, "content": "Stress post 1234"}).encode()
+    now = datetime.now()
+
+    def pydantic_path():
+        post = Post.model_validate(json.loads(body))
+        return Post(id=1, userId=post.userId, content=post.content, createdAt=now, updatedAt=now)
+
+    def lean_path():
+        user_id, content = ingest.POST.decode(body)
+        return Post(id=1, userId=user_id, content=content, createdAt=now, updatedAt=now)
+
+    results = []
+    for lean, fn in ((False, pydantic_path), (True, lean_path)):
+        ingest.ENABLED = lean
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        results.append((time.perf_counter() - start) / iterations * 1e6)
+    return results
+
+async def run_ingest_benchmark():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - INGEST BENCHMARK")
+    print("========================================\n")
+
+    gc.freeze()
+    for path, body in (("/api/users", {"username": "warm", "email": "warm@example.com", "displayName": "W"}),
+                       ("/api/posts", {"userId": 1, "content": "warm"})):
+        await call(main.app, "POST", path, body)
+
+    rates = await run_phases()
+    allocations = {}
+    for lean in (False, True):
+        ingest.ENABLED = lean
+        allocations[lean] = await run_allocations(f"a{int(lean)}")
+    pydantic_us, lean_us = bench_decode()
+
+    print("\n========================================")
+    print("      WRITE THROUGHPUT (requests/s)")
+    print("========================================")
+    print(f"{'Phase':<10} {'pydantic':>9} {'lean':>9} {'gain':>7}")
+    for phase, _ in PHASES:
+        before, after = rates[phase][False], rates[phase][True]
+        print(f"{phase:<10} {before:>9.0f} {after:>9.0f} {(after / before - 1) * 100:>6.1f}%")
+
+    print("\n========================================")
+    print("   ALLOCATIONS PER REQUEST (tracemalloc)")
+    print("========================================")
+    print(f"{'Phase':<10} {'peak B':>16} {'kept blocks':>16} {'kept B':>16}")
+    print(f"{'':<10} {'pydantic / lean':>16} {'pydantic / lean':>16} {'pydantic / lean':>16}")
+    for phase, _ in PHASES:
+        (peak0, blocks0, size0), (peak1, blocks1, size1) = allocations[False][phase], allocations[True][phase]
+        print(f"{phase:<10} {f'{peak0:.0f} / {peak1:.0f}':>16} {f'{blocks0:.1f} / {blocks1:.1f}':>16} "
+              f"{f'{size0:.0f} / {size1:.0f}':>16}")
+
+    print("\nDecode + stored Post for one POST /api/posts body:")
+    print(f"  pydantic models: {pydantic_us:.2f}µs, lean: {lean_us:.2f}µs ({pydantic_us / lean_us:.1f}x)")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    asyncio.run(run_ingest_benchmark())
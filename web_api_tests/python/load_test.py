@@ -1,11 +1,35 @@
 import asyncio
 import aiohttp
 import time
+import uuid
+from collections import defaultdict
 
 BASE_URL = "http://localhost:3001"
+# Suffix for the 100 usernames/emails, so reruns against the same server get no 409s
+RUN_ID = uuid.uuid4().hex[:6]
+
+# Server-side phase durations (ms) summed from the Server-Timing header
+phase_totals = defaultdict(float)
+phase_requests = 0
+
+def record_server_timing(header):
+    global phase_requests
+    if not header:
+        return
+    phase_requests += 1
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "dur":
+                try:
+                    phase_totals[name] += float(value)
+                except ValueError:
+                    pass
 
 async def make_request(session, method, path, json=None):
     async with session.request(method, f"{BASE_URL}{path}", json=json) as resp:
+        record_server_timing(resp.headers.get("Server-Timing"))
         try:
             data = await resp.json()
         except:
@@ -25,8 +49,8 @@ async def run_load_test():
         user_ids = []
         for i in range(100):
             res = await make_request(session, "POST", "/api/users", {
-                "username": f"user{i}",
-                "email": f"user{i}@example.com",
+                "username": f"user{i}_{RUN_ID}",
+                "email": f"user{i}_{RUN_ID}@example.com",
                 "displayName": f"User {i}",
             })
             user_ids.append(res["data"]["id"])
@@ -102,6 +126,11 @@ async def run_load_test():
     print(f"Follows Successful:   {follow_count}")
     print(f"Total Execution Time: {total_time:.0f} ms")
     print(f"Requests/sec:         {(5000 * 1000 / total_time):.2f}")
+    if phase_requests:
+        print("----------------------------------------")
+        print(f"Server-side latency by phase (avg of {phase_requests} requests):")
+        for name, total in phase_totals.items():
+            print(f"  {name:<20} {total / phase_requests:.3f} ms")
     print("========================================\n")
 
 if __name__ == "__main__":
@@ -1,294 +1,915 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from typing import Callable, Dict, Iterator, List, Literal, Optional, Tuple
 from datetime import datetime
 from collections import defaultdict
+from contextlib import asynccontextmanager
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
 import uvicorn
 
-# Models
-class User(BaseModel):
-    id: Optional[int] = None
-    username: str
-    email: str
-    displayName: str
-    bio: str = ""
-    createdAt: Optional[datetime] = None
-    updatedAt: Optional[datetime] = None
-    postCount: int = 0
-    followerCount: int = 0
-    followingCount: int = 0
-
-class Post(BaseModel):
-    id: Optional[int] = None
-    userId: int
-    content: str
-    createdAt: Optional[datetime] = None
-    updatedAt: Optional[datetime] = None
-    likeCount: int = 0
-    commentCount: int = 0
-    views: int = 0
-
-class Comment(BaseModel):
-    id: Optional[int] = None
-    postId: int
-    userId: int
-    text: str
-    createdAt: Optional[datetime] = None
-    likeCount: int = 0
-
-class Like(BaseModel):
-    postId: int
-    userId: int
-
-class Follow(BaseModel):
-    followerId: int
-    followingId: int
+from runtime_stats import gc_stats, loop_lag, runtime_snapshot
+from edges import EdgeStore
+import graph
+from graph import DegreeHistogram
+from rankings import WINDOWS, Rankings
+from search import SearchIndex
+from process_pool import FORK_AVAILABLE, ProcessPool
+from process_pool import REFRESH as PROCESS_POOL_REFRESH, WORKERS as PROCESS_POOL_WORKERS
+from segments import SegmentedStore
+from replication import REPLICA_OF, ChangeLog, Replica, ReplicationMiddleware
+from sharding import ShardError, ShardMap, ShardMiddleware
+from storage import MemoryStorage, Storage
+from storage_sqlite import SQLiteDatabase
+from user_index import SortedKeyIndex, normalize
+from admission import AdmissionController, AdmissionMiddleware
+from ratelimit import RateLimiter, RateLimitMiddleware
+from coalescing import IdempotencyCache, IdempotencyMiddleware, SingleFlight, SingleFlightMiddleware
+from metrics import MetricsMiddleware, registry as metrics
+from tracing import TracedRoute, TracingMiddleware
+import ingest
+import profiler
+import replication
+import sharding
+import tracing
+from models import (Comment, ConflictError, DegreeBucket, DegreeDistribution, Mutuals, Post, PostPage, SearchHit,
+                    SearchResults, Suggestion, Suggestions, TrendingPost, User, UserPage, UserUpdate)
 
 # In-Memory Database
 class Database:
     def __init__(self):
         self.users = {}
-        self.posts = {}
-        self.comments = {}
-        self.likes = set()
-        self.followers = defaultdict(set)
+        # Time-bucketed; older segments are spilled to disk (see segments.py)
+        self.posts = SegmentedStore("posts", Post, counters=("likeCount", "commentCount", "views"))
+        self.comments = SegmentedStore("comments", Comment, counters=("likeCount",))
+        self.user_posts = EdgeStore()  # user id -> post ids
+        self.comments_by_post = EdgeStore()  # post id -> comment ids
+        self.likes = EdgeStore()  # post id -> user ids
+        self.liked_posts = EdgeStore()  # user id -> post ids, kept in step with likes
+        self.followers = EdgeStore()  # user id -> follower ids
+        self.following = EdgeStore()  # user id -> followed ids, kept in step with followers
+        self.follower_degrees = DegreeHistogram()
+        self.following_degrees = DegreeHistogram()
         self.user_id = 0
         self.post_id = 0
         self.comment_id = 0
-
-    def create_user(self, username: str, email: str, display_name: str) -> User:
-        self.user_id += 1
+        # Ids this node may hand out; with sharding only those the hash ring assigns to it (sharding.py)
+        self.owns: Callable[[int], bool] = lambda item_id: True
+        self.search_index = SearchIndex()
+        # Trending windows and the likes leaderboard, updated on every like/comment/view flush
+        self.rankings = Rankings()
+        # Uniqueness (normalized name/email -> user id) and username prefix index
+        self.usernames = {}
+        self.emails = {}
+        self.username_prefixes = SortedKeyIndex()
+        # Write-behind view counts: reads only bump this buffer, flush_views() applies it
+        self.pending_views = defaultdict(int)
+        self.pending_view_total = 0
+        self.view_flush_size = int(os.environ.get("VIEW_FLUSH_SIZE", "1000"))
+        self.views_flushed_at = time.monotonic()
+
+    # `now` is passed by replicas replaying the primary's changes (replication.py)
+    def create_user(self, username: str, email: str, display_name: str, now: Optional[datetime] = None) -> User:
+        now = now or datetime.now()
         user = User(
-            id=self.user_id,
+            id=self._next_id("user_id"),
             username=username,
             email=email,
             displayName=display_name,
-            createdAt=datetime.now(),
-            updatedAt=datetime.now(),
+            createdAt=now,
+            updatedAt=now,
         )
         self.users[self.user_id] = user
+        self._index_user(user)
         return user
 
+    def _next_id(self, counter: str) -> int:
+        item_id = getattr(self, counter) + 1
+        while not self.owns(item_id):
+            item_id += 1
+        setattr(self, counter, item_id)
+        return item_id
+
+    def _index_user(self, user: User):
+        self.usernames[normalize(user.username)] = user.id
+        self.emails[normalize(user.email)] = user.id
+        self.username_prefixes.add(normalize(user.username))
+
+    def _unindex_user(self, user: User):
+        del self.usernames[normalize(user.username)]
+        del self.emails[normalize(user.email)]
+        self.username_prefixes.remove(normalize(user.username))
+
+    def user_conflict(self, username: Optional[str], email: Optional[str],
+                      user_id: Optional[int] = None) -> Optional[str]:
+        """'username' or 'email' if already taken by a user other than `user_id`"""
+        if isinstance(username, str) and self.usernames.get(normalize(username), user_id) != user_id:
+            return "username"
+        if isinstance(email, str) and self.emails.get(normalize(email), user_id) != user_id:
+            return "email"
+        return None
+
     def get_user(self, user_id: int) -> Optional[User]:
         return self.users.get(user_id)
 
-    def update_user(self, user_id: int, updates: dict) -> Optional[User]:
+    def get_user_by_username(self, username: str) -> Optional[User]:
+        user_id = self.usernames.get(normalize(username))
+        return self.users.get(user_id) if user_id is not None else None
+
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        user_id = self.emails.get(normalize(email))
+        return self.users.get(user_id) if user_id is not None else None
+
+    def search_users(self, prefix: str, limit: int = 10) -> List[User]:
+        keys = self.username_prefixes.prefix(normalize(prefix), limit)
+        return [self.users[self.usernames[key]] for key in keys]
+
+    def update_user(self, user_id: int, updates: dict, now: Optional[datetime] = None) -> Optional[User]:
         user = self.users.get(user_id)
         if user:
+            # Checked before unindexing, so a bad value cannot leave the user out of the indexes
+            updates = {key: value for key, value in updates.items()
+                       if key in UserUpdate.__annotations__ and isinstance(value, str)}
+            self._unindex_user(user)
             for key, value in updates.items():
-                if hasattr(user, key):
-                    setattr(user, key, value)
-            user.updatedAt = datetime.now()
+                setattr(user, key, value)
+            user.updatedAt = now or datetime.now()
+            self._index_user(user)
         return user
 
     def get_all_users(self) -> List[User]:
         return list(self.users.values())
 
-    def create_post(self, user_id: int, content: str) -> Post:
-        self.post_id += 1
+    def get_users(self, user_ids) -> List[User]:
+        """The users with these ids that exist here, in order"""
+        return [self.users[uid] for uid in user_ids if uid in self.users]
+
+    def create_post(self, user_id: int, content: str, now: Optional[datetime] = None) -> Post:
+        now = now or datetime.now()
         post = Post(
-            id=self.post_id,
+            id=self._next_id("post_id"),
             userId=user_id,
             content=content,
-            createdAt=datetime.now(),
-            updatedAt=datetime.now(),
+            createdAt=now,
+            updatedAt=now,
         )
-        self.posts[self.post_id] = post
+        self.posts.add(post)
+        self.user_posts.add(user_id, post.id)
+        self.search_index.posts.add(post.id, content)
         user = self.users.get(user_id)
         if user:
             user.postCount += 1
         return post
 
     def get_post(self, post_id: int) -> Optional[Post]:
-        post = self.posts.get(post_id)
-        if post:
-            post.views += 1
-        return post
+        return self.posts.get(post_id)
+
+    def record_view(self, post_id: int, count: int = 1) -> bool:
+        """Buffer views; True once VIEW_FLUSH_SIZE are buffered and flush_views() is due (storage.py calls it)"""
+        self.pending_views[post_id] += count
+        self.pending_view_total += count
+        return self.pending_view_total >= self.view_flush_size
+
+    def flush_views(self) -> int:
+        return self.add_views(self.take_views())
+
+    def take_views(self) -> Dict[int, int]:
+        """The buffered view counts, buffer reset"""
+        pending, self.pending_views = self.pending_views, defaultdict(int)
+        self.pending_view_total = 0
+        self.views_flushed_at = time.monotonic()
+        return pending
+
+    def add_views(self, counts: Dict[int, int]) -> int:
+        for post_id, count in counts.items():
+            if self.posts.add_to(post_id, "views", count) is not None:
+                self.rankings.record(post_id, "view", count)
+        return sum(counts.values())
+
+    def delete_post(self, post_id: int) -> bool:
+        post = self.posts.pop(post_id, None)
+        if post is None:
+            return False
+        self._forget_post(post)
+        return True
+
+    def _forget_post(self, post: Post):
+        """Remove everything referring to a deleted or expired post, O(likes + comments)"""
+        for user_id in self.likes.discard(post.id):
+            self.liked_posts.remove(user_id, post.id)
+        for comment_id in self.comments_by_post.discard(post.id):
+            comment = self.comments.pop(comment_id)
+            if comment is not None:
+                self.search_index.comments.remove(comment_id, comment.text)
+        self.user_posts.remove(post.userId, post.id)
+        self.search_index.posts.remove(post.id, post.content)
+        self.rankings.discard(post.id, post.likeCount)
+        self.pending_view_total -= self.pending_views.pop(post.id, 0)
+        user = self.users.get(post.userId)
+        if user and user.postCount > 0:
+            user.postCount -= 1
+
+    def _forget_comment(self, comment: Comment):
+        self.comments_by_post.remove(comment.postId, comment.id)
+        self.search_index.comments.remove(comment.id, comment.text)
+        self.posts.add_to(comment.postId, "commentCount", -1)
+
+    def maintain(self) -> Tuple[List[int], List[int]]:
+        """Spill old segments to disk and apply the retention policy; returns the expired post and comment ids"""
+        posts = self.posts.maintain()
+        for post in posts:
+            self._forget_post(post)
+        comments = self.comments.maintain()
+        for comment in comments:
+            self._forget_comment(comment)
+        return [post.id for post in posts], [comment.id for comment in comments]
+
+    def expire(self, post_ids: List[int], comment_ids: List[int]):
+        """Drop posts and comments the primary's retention policy expired (replication.py)"""
+        for post_id in post_ids:
+            self.delete_post(post_id)
+        for comment_id in comment_ids:
+            comment = self.comments.pop(comment_id)
+            if comment is not None:
+                self._forget_comment(comment)
+
+    def close(self):
+        self.posts.close()
+        self.comments.close()
+
+    def _get_posts(self, post_ids) -> List[Post]:
+        posts = [self.posts.get(post_id) for post_id in post_ids]
+        return [post for post in posts if post is not None]
 
     def get_posts_by_user(self, user_id: int) -> List[Post]:
-        return [p for p in self.posts.values() if p.userId == user_id]
+        return self._get_posts(self.user_posts.members(user_id))
+
+    def feed_ids(self, user_id: int, limit: int = 20) -> List[int]:
+        authors = set(self.followers.members(user_id))
+        authors.add(user_id)
+        return self.newest_post_ids(authors, limit)
+
+    def newest_post_ids(self, authors, limit: int) -> List[int]:
+        # Ids grow with createdAt: merge each author's newest ids instead of scanning all posts
+        newest = heapq.merge(*(self.user_posts.last(author, limit) for author in authors), reverse=True)
+        return list(itertools.islice(newest, limit))
+
+    def newest_posts(self, authors: List[int], limit: int) -> List[Post]:
+        return self._get_posts(self.newest_post_ids(authors, limit))
 
     def get_feed(self, user_id: int, limit: int = 20) -> List[Post]:
-        following = self.followers.get(user_id, set())
-        feed = [p for p in self.posts.values() 
-                if p.userId in following or p.userId == user_id]
-        feed.sort(key=lambda x: x.createdAt, reverse=True)
-        return feed[:limit]
-
-    def add_comment(self, post_id: int, user_id: int, text: str) -> Comment:
-        self.comment_id += 1
+        return self._get_posts(self.feed_ids(user_id, limit))
+
+    def add_comment(self, post_id: int, user_id: int, text: str, now: Optional[datetime] = None) -> Comment:
         comment = Comment(
-            id=self.comment_id,
+            id=self._next_id("comment_id"),
             postId=post_id,
             userId=user_id,
             text=text,
-            createdAt=datetime.now(),
+            createdAt=now or datetime.now(),
         )
-        self.comments[self.comment_id] = comment
-        post = self.posts.get(post_id)
-        if post:
-            post.commentCount += 1
+        self.comments.add(comment)
+        self.comments_by_post.add(post_id, comment.id)
+        self.search_index.comments.add(comment.id, text)
+        if self.posts.add_to(post_id, "commentCount", 1) is not None:
+            self.rankings.record(post_id, "comment")
         return comment
 
     def get_comments(self, post_id: int) -> List[Comment]:
-        return [c for c in self.comments.values() if c.postId == post_id]
+        comments = [self.comments.get(comment_id) for comment_id in self.comments_by_post.members(post_id)]
+        return [comment for comment in comments if comment is not None]
 
     def like_post(self, post_id: int, user_id: int) -> bool:
-        key = (post_id, user_id)
-        if key in self.likes:
+        if not self.likes.add(post_id, user_id):
             return False
-        self.likes.add(key)
-        post = self.posts.get(post_id)
-        if post:
-            post.likeCount += 1
+        self.liked_posts.add(user_id, post_id)
+        likes = self.posts.add_to(post_id, "likeCount", 1)
+        if likes is not None:
+            self.rankings.like_count_changed(post_id, likes - 1, likes)
+            self.rankings.record(post_id, "like")
         return True
 
     def unlike_post(self, post_id: int, user_id: int) -> bool:
-        key = (post_id, user_id)
-        if key not in self.likes:
+        if not self.likes.remove(post_id, user_id):
             return False
-        self.likes.remove(key)
-        post = self.posts.get(post_id)
-        if post and post.likeCount > 0:
-            post.likeCount -= 1
+        self.liked_posts.remove(user_id, post_id)
+        likes = self.posts.add_to(post_id, "likeCount", -1)
+        if likes is not None:
+            self.rankings.like_count_changed(post_id, likes + 1, likes)
         return True
 
     def is_post_liked(self, post_id: int, user_id: int) -> bool:
-        return (post_id, user_id) in self.likes
+        return self.likes.contains(post_id, user_id)
+
+    def get_post_likers(self, post_id: int, limit: int, after: int = 0) -> UserPage:
+        """Users who liked the post, by user id; `after` is the previous page's cursor"""
+        user_ids = self.liker_ids(post_id, limit, after)
+        return UserPage(results=self.get_users(user_ids),
+                        nextCursor=str(user_ids[-1]) if len(user_ids) == limit else None)
+
+    def liker_ids(self, post_id: int, limit: int, after: int = 0) -> List[int]:
+        return self.likes.page(post_id, after, limit)
+
+    def get_liked_posts(self, user_id: int, limit: int, after: int = 0) -> PostPage:
+        post_ids = self.liked_posts.page(user_id, after, limit)
+        return PostPage(results=self._get_posts(post_ids),
+                        nextCursor=str(post_ids[-1]) if len(post_ids) == limit else None)
 
     def follow(self, follower_id: int, following_id: int) -> bool:
-        if follower_id == following_id:
+        if follower_id == following_id or not self.add_follower(following_id, follower_id):
             return False
-        if follower_id not in self.followers[following_id]:
-            self.followers[following_id].add(follower_id)
-            user = self.users.get(following_id)
-            if user:
-                user.followerCount += 1
-            follower = self.users.get(follower_id)
-            if follower:
-                follower.followingCount += 1
-            return True
-        return False
+        self.add_following(follower_id, following_id)
+        return True
 
     def unfollow(self, follower_id: int, following_id: int) -> bool:
-        if follower_id in self.followers[following_id]:
-            self.followers[following_id].remove(follower_id)
-            user = self.users.get(following_id)
-            if user and user.followerCount > 0:
-                user.followerCount -= 1
-            follower = self.users.get(follower_id)
-            if follower and follower.followingCount > 0:
-                follower.followingCount -= 1
-            return True
-        return False
+        if not self.remove_follower(following_id, follower_id):
+            return False
+        self.remove_following(follower_id, following_id)
+        return True
+
+    # A follow is kept as two halves, one with each user: with sharding they
+    # live on different nodes (sharding.py)
+
+    def add_follower(self, user_id: int, follower_id: int) -> bool:
+        return self._follow_edge(self.followers, self.follower_degrees, user_id, follower_id, "followerCount", 1)
+
+    def remove_follower(self, user_id: int, follower_id: int) -> bool:
+        return self._follow_edge(self.followers, self.follower_degrees, user_id, follower_id, "followerCount", -1)
+
+    def add_following(self, user_id: int, following_id: int) -> bool:
+        return self._follow_edge(self.following, self.following_degrees, user_id, following_id, "followingCount", 1)
+
+    def remove_following(self, user_id: int, following_id: int) -> bool:
+        return self._follow_edge(self.following, self.following_degrees, user_id, following_id, "followingCount", -1)
+
+    def _follow_edge(self, edges: EdgeStore, degrees: DegreeHistogram, user_id: int, other_id: int,
+                     counter: str, delta: int) -> bool:
+        changed = edges.add(user_id, other_id) if delta > 0 else edges.remove(user_id, other_id)
+        if not changed:
+            return False
+        count = edges.count(user_id)
+        degrees.move(count - delta, count)
+        user = self.users.get(user_id)
+        if user:
+            setattr(user, counter, max(getattr(user, counter) + delta, 0))
+        return True
 
     def get_followers(self, user_id: int) -> List[User]:
-        follower_ids = self.followers.get(user_id, set())
-        return [self.users[uid] for uid in follower_ids if uid in self.users]
+        return self.get_users(self.follower_ids(user_id))
+
+    def follower_ids(self, user_id: int) -> List[int]:
+        return list(self.followers.members(user_id))
+
+    def get_mutuals(self, user_id: int, limit: int) -> Mutuals:
+        ids, truncated = self.mutual_ids(user_id)
+        return Mutuals(count=len(ids), truncated=truncated, results=self.get_users(ids[:limit]))
+
+    def mutual_ids(self, user_id: int) -> Tuple[List[int], bool]:
+        """Users that follow `user_id` and are followed back"""
+        return graph.intersect(self.followers, user_id, self.following, user_id)
+
+    def following_ids(self, user_ids: List[int], limit: int) -> Dict[int, List[int]]:
+        """Up to `limit` followed ids of each user"""
+        return {uid: list(itertools.islice(self.following.members(uid), limit)) for uid in user_ids}
+
+    def get_suggestions(self, user_id: int, limit: int) -> Suggestions:
+        ranked, truncated = graph.suggestions(self.following, user_id, limit)
+        return Suggestions(truncated=truncated, results=[
+            Suggestion(user=self.users[uid], sharedConnections=shared)
+            for uid, shared in ranked if uid in self.users])
+
+    def degree_distribution(self) -> DegreeDistribution:
+        def buckets(histogram: DegreeHistogram) -> List[DegreeBucket]:
+            return [DegreeBucket(min=lo, max=hi, users=n) for lo, hi, n in histogram.buckets(len(self.users))]
+        return DegreeDistribution(users=len(self.users), edges=len(self.followers),
+                                  followers=buckets(self.follower_degrees),
+                                  following=buckets(self.following_degrees))
+
+    def search(self, query: str, kinds, limit: int, cursor: Optional[str] = None):
+        hits, next_cursor = self.search_index.search(query, kinds, limit, cursor)
+        results = []
+        for score, kind, doc_id in hits:
+            if kind == SearchIndex.POST:
+                results.append(SearchHit(type="post", score=score, post=self.posts[doc_id]))
+            else:
+                results.append(SearchHit(type="comment", score=score, comment=self.comments[doc_id]))
+        return SearchResults(results=results, nextCursor=next_cursor)
+
+    def trending(self, window: str, limit: int) -> List[TrendingPost]:
+        return [TrendingPost(score=round(score, 4), post=self.posts[post_id])
+                for post_id, score in self.rankings.trending_posts(window, limit)]
+
+    def most_liked(self, limit: int) -> List[Post]:
+        return [self.posts[post_id] for post_id in self.rankings.most_liked(limit)]
+
+    # Replication: a replica starts from the primary's snapshot() and then
+    # replays its change stream (replication.py)
+
+    def snapshot(self, chunk: int = 1000) -> Iterator[Tuple[str, list]]:
+        """The whole state as JSON-ready (kind, records) chunks for restore()"""
+        yield "counters", [self.user_id, self.post_id, self.comment_id]
+        for kind, edges in (("likes", self.likes), ("followers", self.followers), ("following", self.following)):
+            pairs = ([key, member] for key in edges.keys() for member in edges.members(key))
+            while batch := list(itertools.islice(pairs, chunk)):
+                yield kind, batch
+        # Users last: restoring the follow halves bumps counters of users already present
+        for kind, items in (("posts", self.posts.values()), ("comments", self.comments.values()),
+                            ("users", self.users.values())):
+            items = iter(items)
+            while batch := [item.model_dump(mode="json") for item in itertools.islice(items, chunk)]:
+                yield kind, batch
+
+    def restore(self, kind: str, records: list):
+        """Load a snapshot() chunk into a Database that started empty; counters are taken as they are"""
+        if kind == "counters":
+            self.user_id, self.post_id, self.comment_id = records
+        elif kind == "users":
+            for record in records:
+                user = User.model_validate(record)
+                self.users[user.id] = user
+                self._index_user(user)
+        elif kind == "posts":
+            for record in records:
+                post = Post.model_validate(record)
+                self.posts.add(post)
+                self.user_posts.add(post.userId, post.id)
+                self.search_index.posts.add(post.id, post.content)
+                self.rankings.like_count_changed(post.id, 0, post.likeCount)
+        elif kind == "comments":
+            for record in records:
+                comment = Comment.model_validate(record)
+                self.comments.add(comment)
+                self.comments_by_post.add(comment.postId, comment.id)
+                self.search_index.comments.add(comment.id, comment.text)
+        elif kind == "likes":
+            for post_id, user_id in records:
+                self.likes.add(post_id, user_id)
+                self.liked_posts.add(user_id, post_id)
+        elif kind == "followers":
+            for user_id, follower_id in records:
+                self.add_follower(user_id, follower_id)
+        elif kind == "following":
+            for user_id, following_id in records:
+                self.add_following(user_id, following_id)
+        else:
+            raise ValueError(f"Unknown snapshot record kind {kind!r}")
+
+    def stats(self) -> dict:
+        """Entity counts, exported as gauges on /metrics"""
+        return {
+            "users": len(self.users),
+            "posts": len(self.posts),
+            "comments": len(self.comments),
+            "likes": len(self.likes),
+            "follow_edges": len(self.followers),
+            "pending_views": self.pending_view_total,
+            **{f"search_{k}": v for k, v in self.search_index.stats().items()},
+            **{f"post_store_{k}": v for k, v in self.posts.stats().items()},
+            **{f"comment_store_{k}": v for k, v in self.comments.stats().items()},
+            "view_staleness_seconds": round(time.monotonic() - self.views_flushed_at, 3),
+        }
+
+# memory (default) or sqlite, see storage_sqlite.py
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "memory")
+
+# Views are at most VIEW_FLUSH_INTERVAL seconds (or VIEW_FLUSH_SIZE views) behind
+VIEW_FLUSH_INTERVAL = float(os.environ.get("VIEW_FLUSH_INTERVAL", "1.0"))
+
+async def flush_views_periodically():
+    while True:
+        await asyncio.sleep(VIEW_FLUSH_INTERVAL)
+        db.flush_views()
+
+SEGMENT_MAINTENANCE_INTERVAL = float(os.environ.get("SEGMENT_MAINTENANCE_INTERVAL", "10"))
+
+async def maintain_periodically():
+    while True:
+        await asyncio.sleep(SEGMENT_MAINTENANCE_INTERVAL)
+        await db.maintain()
+
+async def refresh_process_pool_periodically():
+    while True:
+        await asyncio.sleep(PROCESS_POOL_REFRESH)
+        await db.exclusive(process_pool.refresh)
 
 # Initialize
-app = FastAPI(title="Social Media API - FastAPI")
-db = Database()
-
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    gc_stats.install()
+    loop_lag.start()
+    view_flusher = asyncio.create_task(flush_views_periodically())
+    segment_maintainer = asyncio.create_task(maintain_periodically())
+    if process_pool is not None:
+        await db.exclusive(process_pool.refresh)
+        pool_refresher = asyncio.create_task(refresh_process_pool_periodically())
+    if replica is not None:
+        replica.start()
+    yield
+    view_flusher.cancel()
+    segment_maintainer.cancel()
+    if process_pool is not None:
+        pool_refresher.cancel()
+        process_pool.close()
+    db.flush_views()
+    if replica is not None:
+        await replica.stop()  # ships the views flushed above to the primary
+    if shards is not None:
+        shards.close()
+    db.close()
+    await loop_lag.stop()
+    gc_stats.uninstall()
+    tracing.buffer.close()
+
+app = FastAPI(title="Social Media API - FastAPI", lifespan=lifespan)
+app.router.route_class = TracedRoute
+db: Storage
+# CPU-heavy reads in forked worker processes; memory backend only (SQLite reads already leave the GIL)
+process_pool: Optional[ProcessPool] = None
+# Change stream for read replicas (primary), or the stream being followed (REPLICA_OF); memory backend only
+changelog: Optional[ChangeLog] = None
+replica: Optional[Replica] = None
+# Users spread over SHARD_NODES by consistent hashing (sharding.py); memory backend only
+shards: Optional[ShardMap] = None
+
+def use_database(new_database):
+    """A replica reloaded its snapshot into `new_database`"""
+    global database
+    database = new_database
+    if process_pool is not None:
+        process_pool.reset(new_database)
+
+if sharding.NODES and REPLICA_OF:
+    raise RuntimeError("SHARD_NODES and REPLICA_OF cannot be combined")
+if STORAGE_BACKEND == "sqlite":
+    if REPLICA_OF or sharding.NODES:
+        raise RuntimeError("REPLICA_OF and SHARD_NODES need STORAGE_BACKEND=memory")
+    db = tracing.instrument(SQLiteDatabase(), "db")
+else:
+    database = tracing.instrument(Database(), "db")
+    if not REPLICA_OF:
+        changelog = ChangeLog()
+        replication.capture(database, changelog)
+    db = MemoryStorage(database)
+    if REPLICA_OF:
+        replica = Replica(REPLICA_OF, db, lambda: tracing.instrument(Database(), "db"), on_reset=use_database)
+    if PROCESS_POOL_WORKERS and FORK_AVAILABLE:
+        process_pool = ProcessPool(database, gate=db.exclusive, version=lambda: (changelog or replica).version)
+        metrics.register_gauges("process_pool", process_pool.stats)
+    metrics.register_gauges("replication", (changelog or replica).stats)
+    if sharding.NODES:
+        shards = ShardMap(sharding.NODES, sharding.SELF, db)
+        database.owns = shards.owns
+        metrics.register_gauges("sharding", shards.stats)
+metrics.register_gauges("db", db.stats)
+admission = AdmissionController(lag_ms=lambda: loop_lag.lag_ms_last)
+metrics.register_gauges("admission", admission.stats)
+rate_limiter = RateLimiter()
+metrics.register_gauges("ratelimit", rate_limiter.stats)
+idempotency = IdempotencyCache()
+metrics.register_gauges("idempotency", idempotency.stats)
+single_flight = SingleFlight()
+metrics.register_gauges("single_flight", single_flight.stats)
+
+# Inside CORS so CORS headers are also set on 429/503 rejections; rate
+# limiting runs first so a flooding client never occupies admission slots,
+# replays and coalesced duplicates are answered before admission as well
+if os.environ.get("ADMISSION_ENABLED", "1") != "0":
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+app.add_middleware(IdempotencyMiddleware, cache=idempotency, identify=rate_limiter.client)
+app.add_middleware(SingleFlightMiddleware, group=single_flight)
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+# Replicas forward writes (and reads they are too stale for) before any local limits apply
+if changelog is not None or replica is not None:
+    app.add_middleware(ReplicationMiddleware, log=changelog, replica=replica)
+# Requests for another node's ids go there before anything is counted here
+if shards is not None:
+    app.add_middleware(ShardMiddleware, shards=shards)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After", "Idempotent-Replayed", "X-Data-Version"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+@app.exception_handler(ShardError)
+async def shard_error(request, exc: ShardError):
+    return JSONResponse({"detail": str(exc)}, status_code=502)
 
 # Health Check
 @app.get("/health")
 async def health():
     return {"status": "ok", "timestamp": datetime.now()}
 
+# Runtime stats (GC pauses, event-loop lag) for the benchmark orchestrator
+@app.get("/debug/runtime")
+async def debug_runtime(reset: bool = False):
+    return runtime_snapshot(reset)
+
+# Prometheus text exposition
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Recent request traces (phase breakdown per request)
+@app.get("/debug/traces")
+async def debug_traces(limit: int = Query(50, ge=1, le=1000), route: Optional[str] = None):
+    return tracing.buffer.recent(limit, route)
+
+# Sampling profiler (opt-in: PROFILER_ENABLED=1, optionally guarded by ADMIN_TOKEN)
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if os.environ.get("PROFILER_ENABLED") != "1":
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = os.environ.get("ADMIN_TOKEN")
+    if token and x_admin_token != token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def capture_profile(
+    seconds: float = Query(10, gt=0, le=300),
+    interval_ms: float = Query(5, ge=1, le=100),
+    format: Literal["speedscope", "collapsed"] = "speedscope",
+):
+    # Samples the event-loop and storage threads of this worker until `seconds` pass or /admin/profile/stop
+    prof = profiler.start(threading.get_ident(), interval_ms / 1000, "storage")
+    if prof is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        await asyncio.to_thread(prof.run, seconds)
+    finally:
+        profiler.finish(prof)
+
+    headers = {"X-Profile-Samples": str(sum(prof.samples.values())),
+               "X-Profile-Duration": f"{prof.duration:.3f}"}
+    if format == "collapsed":
+        return PlainTextResponse(prof.collapsed(), headers=headers)
+    headers["Content-Disposition"] = 'attachment; filename="profile.speedscope.json"'
+    return JSONResponse(prof.speedscope(), headers=headers)
+
+@app.post("/admin/profile/stop", dependencies=[Depends(require_admin)])
+async def stop_profile():
+    return {"stopped": profiler.stop_active()}
+
+# Replication (primary side, see replication.py)
+def require_replication(x_replication_token: Optional[str] = Header(None)):
+    # Without a token the snapshot (every user's email) and views would be open to anyone
+    if changelog is None or not replication.TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_replication_token != replication.TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid replication token")
+
+@app.get("/internal/snapshot", dependencies=[Depends(require_replication)])
+async def replication_snapshot():
+    # Copied while no storage thread reads, so it is exactly at `version`; serialized on threads while streaming
+    header, chunks = await db.exclusive(changelog.snapshot, database)
+    return StreamingResponse(replication.ndjson(header, chunks), media_type="application/x-ndjson")
+
+@app.get("/internal/cdc", dependencies=[Depends(require_replication)])
+async def replication_changes(after: int = Query(..., ge=0), epoch: Optional[str] = None,
+                              replica: str = "unknown", wait: float = Query(0, ge=0, le=60)):
+    if epoch is not None and epoch != changelog.epoch:
+        raise HTTPException(status_code=410, detail="Primary restarted, reload the snapshot")
+    changelog.polled(replica, after)
+    await changelog.wait(after, wait)
+    changes = changelog.since(after)
+    if changes is None:
+        raise HTTPException(status_code=410, detail="Changes already dropped from the log, reload the snapshot")
+    return JSONResponse({"version": changelog.version, "changes": changes})
+
+@app.post("/internal/views", dependencies=[Depends(require_replication)])
+async def replication_views(views: List[Tuple[int, int]]):
+    # Views recorded on a replica; they reach every replica through the change stream
+    if any(count <= 0 for _, count in views):
+        raise HTTPException(status_code=422, detail="View counts must be positive")
+    for post_id, count in views:
+        db.record_view(post_id, count)
+    return {"recorded": len(views)}
+
+# Sharding (calls between nodes, see sharding.py)
+def cluster():
+    """Reads and follows that span nodes: the ShardMap with sharding, else the storage itself"""
+    return db if shards is None else shards
+
+def require_shard_peer(x_shard_token: Optional[str] = Header(None)):
+    if shards is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_shard_token != sharding.TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid shard token")
+
+@app.post("/internal/shard/call", dependencies=[Depends(require_shard_peer)])
+async def shard_call(call: dict):
+    body = await shards.serve(call.get("method"), call.get("args", []))
+    if body is None:
+        raise HTTPException(status_code=404, detail="Unknown shard method")
+    return Response(body, media_type="application/json")
+
 # User Routes
-@app.post("/api/users", response_model=User, status_code=201)
-async def create_user(user: User):
-    return db.create_user(user.username, user.email, user.displayName)
+# Write bodies are decoded by ingest.py straight into the storage call's arguments
+@app.post("/api/users", response_model=User, status_code=201, openapi_extra=ingest.USER.openapi)
+async def create_user(request: Request):
+    username, email, display_name = await ingest.USER.read(request)
+    conflict = await cluster().user_conflict(username, email)
+    if conflict:
+        raise HTTPException(status_code=409, detail=f"{conflict.capitalize()} already taken")
+    try:
+        return await db.create_user(username, email, display_name)
+    except ConflictError as exc:  # taken by a concurrent request since the check
+        raise HTTPException(status_code=409, detail=f"{exc.field.capitalize()} already taken")
 
 @app.get("/api/users", response_model=List[User])
 async def get_all_users():
-    return db.get_all_users()
+    if shards is None and process_pool is not None and process_pool.wants_users():
+        users = process_pool.users_json()
+        try:
+            first = await users.__anext__()  # time out here, before the status line is sent
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Query timed out")
+
+        async def stream():
+            yield first
+            async for chunk in users:
+                yield chunk
+        return StreamingResponse(stream(), media_type="application/json")
+    return await cluster().get_all_users()
+
+# Declared before /api/users/{user_id}, which would reject "lookup"/"search" as ids
+@app.get("/api/users/lookup", response_model=User)
+async def lookup_user(username: Optional[str] = None, email: Optional[str] = None):
+    if (username is None) == (email is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of username, email")
+    if username is not None:
+        user = await cluster().get_user_by_username(username)
+    else:
+        user = await cluster().get_user_by_email(email)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+@app.get("/api/users/search", response_model=List[User])
+async def search_users(prefix: str = Query(..., min_length=1, max_length=100),
+                       limit: int = Query(10, ge=1, le=100)):
+    return await cluster().search_users(prefix, limit)
 
 @app.get("/api/users/{user_id}", response_model=User)
 async def get_user(user_id: int):
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @app.put("/api/users/{user_id}", response_model=User)
-async def update_user(user_id: int, updates: dict):
-    user = db.update_user(user_id, updates)
+async def update_user(user_id: int, updates: UserUpdate):
+    conflict = await cluster().user_conflict(updates.get("username"), updates.get("email"), user_id)
+    if conflict:
+        raise HTTPException(status_code=409, detail=f"{conflict.capitalize()} already taken")
+    try:
+        user = await db.update_user(user_id, updates)
+    except ConflictError as exc:
+        raise HTTPException(status_code=409, detail=f"{exc.field.capitalize()} already taken")
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 # Post Routes
-@app.post("/api/posts", response_model=Post, status_code=201)
-async def create_post(post: Post):
-    return db.create_post(post.userId, post.content)
+@app.post("/api/posts", response_model=Post, status_code=201, openapi_extra=ingest.POST.openapi)
+async def create_post(request: Request):
+    return await db.create_post(*await ingest.POST.read(request))
 
 @app.get("/api/posts/{post_id}", response_model=Post)
 async def get_post(post_id: int):
-    post = db.get_post(post_id)
+    post = await db.get_post(post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
+    db.record_view(post_id)
     return post
 
+@app.delete("/api/posts/{post_id}")
+async def delete_post(post_id: int):
+    if await db.delete_post(post_id):
+        return {"success": True}
+    raise HTTPException(status_code=404, detail="Post not found")
+
 @app.get("/api/users/{user_id}/posts", response_model=List[Post])
 async def get_user_posts(user_id: int):
-    return db.get_posts_by_user(user_id)
+    return await db.get_posts_by_user(user_id)
 
 @app.get("/api/users/{user_id}/feed", response_model=List[Post])
-async def get_feed(user_id: int, limit: int = 20):
-    return db.get_feed(user_id, limit)
+async def get_feed(user_id: int, limit: int = Query(20, ge=1, le=100)):
+    if shards is None and process_pool is not None and process_pool.wants_feed(user_id):
+        try:
+            return await process_pool.feed(user_id, limit)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Query timed out")
+    return await cluster().get_feed(user_id, limit)
 
 # Comment Routes
-@app.post("/api/comments", response_model=Comment, status_code=201)
-async def add_comment(comment: Comment):
-    return db.add_comment(comment.postId, comment.userId, comment.text)
+@app.post("/api/comments", response_model=Comment, status_code=201, openapi_extra=ingest.COMMENT.openapi)
+async def add_comment(request: Request):
+    return await db.add_comment(*await ingest.COMMENT.read(request))
 
 @app.get("/api/posts/{post_id}/comments", response_model=List[Comment])
 async def get_comments(post_id: int):
-    return db.get_comments(post_id)
+    return await db.get_comments(post_id)
 
 # Like Routes
-@app.post("/api/likes", status_code=201)
-async def like_post(like: Like):
-    if db.like_post(like.postId, like.userId):
+@app.post("/api/likes", status_code=201, openapi_extra=ingest.LIKE.openapi)
+async def like_post(request: Request):
+    if await db.like_post(*await ingest.LIKE.read(request)):
         return {"success": True}
     raise HTTPException(status_code=400, detail="Already liked")
 
-@app.delete("/api/likes")
-async def unlike_post(like: Like):
-    if db.unlike_post(like.postId, like.userId):
+@app.delete("/api/likes", openapi_extra=ingest.LIKE.openapi)
+async def unlike_post(request: Request):
+    if await db.unlike_post(*await ingest.LIKE.read(request)):
         return {"success": True}
     raise HTTPException(status_code=400, detail="Not liked")
 
+def page_after(cursor: Optional[str]) -> int:
+    """Like pages are keyed by id; the cursor is the last id of the previous page"""
+    if cursor is None:
+        return 0
+    if not cursor.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return int(cursor)
+
+@app.get("/api/posts/{post_id}/likes", response_model=UserPage)
+async def get_post_likers(post_id: int, limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None):
+    if not await db.get_post(post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
+    return await cluster().get_post_likers(post_id, limit, page_after(cursor))
+
+@app.get("/api/users/{user_id}/likes", response_model=PostPage)
+async def get_liked_posts(user_id: int, limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None):
+    if not await db.get_user(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    return await cluster().get_liked_posts(user_id, limit, page_after(cursor))
+
 @app.get("/api/posts/{post_id}/likes/user/{user_id}")
 async def is_post_liked(post_id: int, user_id: int):
-    return {"liked": db.is_post_liked(post_id, user_id)}
+    return {"liked": await db.is_post_liked(post_id, user_id)}
 
 # Follow Routes
-@app.post("/api/follow", status_code=201)
-async def follow(follow: Follow):
-    if db.follow(follow.followerId, follow.followingId):
+@app.post("/api/follow", status_code=201, openapi_extra=ingest.FOLLOW.openapi)
+async def follow(request: Request):
+    if await cluster().follow(*await ingest.FOLLOW.read(request)):
         return {"success": True}
     raise HTTPException(status_code=400, detail="Already following")
 
-@app.delete("/api/follow")
-async def unfollow(follow: Follow):
-    if db.unfollow(follow.followerId, follow.followingId):
+@app.delete("/api/follow", openapi_extra=ingest.FOLLOW.openapi)
+async def unfollow(request: Request):
+    if await cluster().unfollow(*await ingest.FOLLOW.read(request)):
         return {"success": True}
     raise HTTPException(status_code=400, detail="Not following")
 
 @app.get("/api/users/{user_id}/followers", response_model=List[User])
 async def get_followers(user_id: int):
-    return db.get_followers(user_id)
+    return await cluster().get_followers(user_id)
+
+# Graph Routes
+@app.get("/api/users/{user_id}/mutuals", response_model=Mutuals)
+async def get_mutuals(user_id: int, limit: int = Query(20, ge=1, le=100)):
+    return await cluster().get_mutuals(user_id, limit)
+
+@app.get("/api/users/{user_id}/suggestions", response_model=Suggestions)
+async def get_suggestions(user_id: int, limit: int = Query(10, ge=1, le=100)):
+    return await cluster().get_suggestions(user_id, limit)
+
+@app.get("/api/graph/degrees", response_model=DegreeDistribution)
+async def degree_distribution():
+    return await cluster().degree_distribution()
+
+# Search Routes
+SEARCH_KINDS = {"posts": (SearchIndex.POST,), "comments": (SearchIndex.COMMENT,),
+                "all": (SearchIndex.POST, SearchIndex.COMMENT)}
+
+@app.get("/api/search", response_model=SearchResults)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Literal["posts", "comments", "all"] = "posts",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+):
+    try:
+        return await cluster().search(q, SEARCH_KINDS[type], limit, cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+# Ranking Routes
+@app.get("/api/trending", response_model=List[TrendingPost])
+async def trending(window: Literal[tuple(WINDOWS)] = "1h", limit: int = Query(20, ge=1, le=100)):
+    return await cluster().trending(window, limit)
+
+@app.get("/api/leaderboards/likes", response_model=List[Post])
+async def most_liked(limit: int = Query(20, ge=1, le=100)):
+    return await cluster().most_liked(limit)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=3001, log_level="error")
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "3001")), log_level="error")
@@ -0,0 +1,186 @@
+"""Prometheus-style request metrics for the FastAPI service.
+
+`MetricsMiddleware` (pure ASGI, no per-request allocations beyond a closure)
+counts requests, latency and response sizes per route template;
+`MetricsRoute` tracks in-flight requests per route. `render()` produces the
+text exposition format served on /metrics.
+"""
+
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str, out: List[str]):
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            out.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        out.append(f"{name}_sum{{{labels}}} {self.sum}")
+        out.append(f"{name}_count{{{labels}}} {cumulative}")
+
+
+class RouteStats:
+    __slots__ = ("statuses", "latency", "size")
+
+    def __init__(self):
+        self.statuses: Dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = os.environ.get("METRICS_ENABLED", "1") != "0"
+        self.routes: Dict[Tuple[str, str], RouteStats] = {}
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        self.gauges: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self.caches: Dict[str, Callable[[], Tuple[int, int]]] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float, size: int):
+        key = (method, route)
+        stats = self.routes.get(key)
+        if stats is None:
+            stats = self.routes[key] = RouteStats()
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.latency.observe(seconds)
+        stats.size.observe(size)
+
+    def register_gauges(self, prefix: str, collect: Callable[[], Dict[str, float]]):
+        """`collect()` returns {name: value}; exported as <prefix>_<name>"""
+        self.gauges[prefix] = collect
+
+    def register_cache(self, name: str, collect: Callable[[], Tuple[int, int]]):
+        """`collect()` returns (hits, misses) for a cache"""
+        self.caches[name] = collect
+
+    def render(self) -> str:
+        out: List[str] = []
+
+        out.append("# HELP http_requests_total Requests by route template and status")
+        out.append("# TYPE http_requests_total counter")
+        for (method, route), stats in sorted(self.routes.items()):
+            for status, n in sorted(stats.statuses.items()):
+                out.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {n}')
+
+        out.append("# HELP http_requests_in_flight Requests currently being handled")
+        out.append("# TYPE http_requests_in_flight gauge")
+        for (method, route), n in sorted(self.in_flight.items()):
+            out.append(f'http_requests_in_flight{{method="{method}",route="{route}"}} {n}')
+
+        out.append("# HELP http_request_duration_seconds Request latency")
+        out.append("# TYPE http_request_duration_seconds histogram")
+        for (method, route), stats in sorted(self.routes.items()):
+            stats.latency.render("http_request_duration_seconds", f'method="{method}",route="{route}"', out)
+
+        out.append("# HELP http_response_size_bytes Response body size")
+        out.append("# TYPE http_response_size_bytes histogram")
+        for (method, route), stats in sorted(self.routes.items()):
+            stats.size.render("http_response_size_bytes", f'method="{method}",route="{route}"', out)
+
+        for prefix, collect in self.gauges.items():
+            for name, value in collect().items():
+                out.append(f"# TYPE {prefix}_{name} gauge")
+                out.append(f"{prefix}_{name} {value}")
+
+        if self.caches:
+            out.append("# HELP cache_requests_total Cache lookups by result")
+            out.append("# TYPE cache_requests_total counter")
+            out.append("# HELP cache_hit_ratio Hits / lookups since start")
+            out.append("# TYPE cache_hit_ratio gauge")
+            for name, collect in sorted(self.caches.items()):
+                hits, misses = collect()
+                total = hits + misses
+                out.append(f'cache_requests_total{{cache="{name}",result="hit"}} {hits}')
+                out.append(f'cache_requests_total{{cache="{name}",result="miss"}} {misses}')
+                out.append(f'cache_hit_ratio{{cache="{name}"}} {hits / total if total else 0.0}')
+
+        out.append("")
+        return "\n".join(out)
+
+
+registry = MetricsRegistry()
+
+
+def route_label(scope: dict, endpoints: Optional[Dict[Callable, str]] = None) -> str:
+    """Route template of a handled request (keeps label cardinality bounded)"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None and endpoints is not None:
+        # Starlette < 0.30 only exposes the endpoint in the scope
+        path = endpoints.get(scope.get("endpoint"))
+    return path or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Records count, latency and response size per (method, route template)"""
+
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+        self._endpoints: Optional[Dict[Callable, str]] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if self._endpoints is None and "route" not in scope and "app" in scope:
+                self._endpoints = {r.endpoint: r.path for r in scope["app"].routes if hasattr(r, "endpoint")}
+            self.registry.observe(scope["method"], route_label(scope, self._endpoints),
+                                  status, time.perf_counter() - start, size)
+
+
+class MetricsRoute(APIRoute):
+    """APIRoute that maintains the per-route in-flight gauge
+
+    `handle` spans the whole request including sending the response; the
+    profiler recognises this frame on a sampled stack to attribute samples
+    to the route.
+    """
+
+    async def handle(self, scope, receive, send):
+        if not registry.enabled:
+            await super().handle(scope, receive, send)
+            return
+        key = (scope["method"], self.path)
+        registry.in_flight[key] = registry.in_flight.get(key, 0) + 1
+        try:
+            await super().handle(scope, receive, send)
+        finally:
+            registry.in_flight[key] -= 1
@@ -0,0 +1,125 @@
+"""Request/response models shared by the storage backends and the routes"""
+
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+from typing_extensions import TypedDict
+
+from edges import MAX_MEMBER
+
+
+class ConflictError(Exception):
+    """A unique field (username, email) is already taken"""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} already taken")
+        self.field = field
+
+
+class User(BaseModel):
+    id: Optional[int] = None
+    username: str
+    email: str
+    displayName: str
+    bio: str = ""
+    createdAt: Optional[datetime] = None
+    updatedAt: Optional[datetime] = None
+    postCount: int = 0
+    followerCount: int = 0
+    followingCount: int = 0
+
+
+class UserUpdate(TypedDict, total=False):
+    """Profile fields PUT /api/users/{id} may change; other keys are ignored"""
+    username: str
+    email: str
+    displayName: str
+    bio: str
+
+
+class Post(BaseModel):
+    id: Optional[int] = None
+    userId: int
+    content: str
+    createdAt: Optional[datetime] = None
+    updatedAt: Optional[datetime] = None
+    likeCount: int = 0
+    commentCount: int = 0
+    views: int = 0
+
+
+class Comment(BaseModel):
+    id: Optional[int] = None
+    postId: int
+    userId: int
+    text: str
+    createdAt: Optional[datetime] = None
+    likeCount: int = 0
+
+
+# Edge endpoints are stored as unsigned 32-bit ints (see edges.py)
+class Like(BaseModel):
+    postId: int = Field(ge=0, le=MAX_MEMBER)
+    userId: int = Field(ge=0, le=MAX_MEMBER)
+
+
+class Follow(BaseModel):
+    followerId: int = Field(ge=0, le=MAX_MEMBER)
+    followingId: int = Field(ge=0, le=MAX_MEMBER)
+
+
+class SearchHit(BaseModel):
+    type: Literal["post", "comment"]
+    score: float
+    post: Optional[Post] = None
+    comment: Optional[Comment] = None
+
+
+class SearchResults(BaseModel):
+    results: List[SearchHit]
+    nextCursor: Optional[str] = None
+
+
+class UserPage(BaseModel):
+    results: List[User]
+    nextCursor: Optional[str] = None
+
+
+class PostPage(BaseModel):
+    results: List[Post]
+    nextCursor: Optional[str] = None
+
+
+class Mutuals(BaseModel):
+    count: int
+    truncated: bool = False
+    results: List[User]
+
+
+class Suggestion(BaseModel):
+    user: User
+    sharedConnections: int
+
+
+class Suggestions(BaseModel):
+    truncated: bool = False
+    results: List[Suggestion]
+
+
+class DegreeBucket(BaseModel):
+    min: int
+    max: int
+    users: int
+
+
+class DegreeDistribution(BaseModel):
+    users: int
+    edges: int
+    followers: List[DegreeBucket]
+    following: List[DegreeBucket]
+
+
+class TrendingPost(BaseModel):
+    score: float
+    post: Post
@@ -0,0 +1,376 @@
+"""Process-pool tier for CPU-heavy reads on the in-memory backend.
+
+Storage threads (storage.py) keep the event loop responsive but share one
+GIL, so a feed over thousands of authors or a dump of every user still takes
+CPU away from request handling. This tier runs such queries in
+PROCESS_POOL_WORKERS forked processes instead.
+
+- Fork gives every worker a copy-on-write, read-only view of the Database as
+  of the fork: nothing is copied or pickled up front. `gc.freeze()` around
+  the fork keeps the child's collector from touching (and so copying) every
+  page.
+- Workers are re-forked every PROCESS_POOL_REFRESH seconds if anything
+  was written since the last fork (the change log's version, or on a replica
+  the applied version, moved). The parent adds posts and users created since
+  the fork, so new content is never missing. Follows and profile edits show
+  up after the next refresh.
+- The parent already runs thread pools (storage, replication, sharding) when
+  it forks, and a forked child has only the forking thread: a lock another
+  thread held at that moment stays locked in the child for good. Forks run
+  under the storage write gate, so no storage thread is inside the Database
+  then, and a worker only runs `_serve` over the Database. Queries must stay
+  plain reads; logging, HTTP clients or executors in a worker could hang on
+  such a lock.
+- A query is a generator in the worker. Each chunk it yields is sent back
+  when ready, so large results stream.
+- Every query has a deadline (PROCESS_QUERY_TIMEOUT). On timeout, or when
+  the client goes away, the worker is asked to stop at the next chunk. If it
+  has not stopped within CANCEL_GRACE, it is killed and replaced.
+
+Needs the fork start method (not available on Windows); otherwise the tier
+stays off.
+"""
+
+import asyncio
+import gc
+import itertools
+import multiprocessing
+import os
+import signal
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Iterator, List, Optional
+
+from models import Post
+
+WORKERS = int(os.environ.get("PROCESS_POOL_WORKERS", "2"))
+REFRESH = float(os.environ.get("PROCESS_POOL_REFRESH", "5"))
+QUERY_TIMEOUT = float(os.environ.get("PROCESS_QUERY_TIMEOUT", "10"))
+MIN_AUTHORS = int(os.environ.get("PROCESS_POOL_MIN_AUTHORS", "1000"))  # smaller feeds stay on threads
+MIN_USERS = int(os.environ.get("PROCESS_POOL_MIN_USERS", "10000"))  # smaller dumps stay on threads
+CANCEL_GRACE = 1.0
+USERS_CHUNK = 1000
+
+FORK_AVAILABLE = "fork" in multiprocessing.get_all_start_methods()
+
+
+# Queries: run in the worker against its snapshot, yield result chunks
+
+def _feed_ids(database, user_id: int, limit: int) -> Iterator[List[int]]:
+    yield database.feed_ids(user_id, limit)
+
+
+def _users_json(database, chunk: int) -> Iterator[bytes]:
+    batch = []
+    for user in database.users.values():
+        batch.append(user.model_dump_json().encode())
+        if len(batch) == chunk:
+            yield b",".join(batch)
+            batch = []
+    if batch:
+        yield b",".join(batch)
+
+
+QUERIES = {"feed_ids": _feed_ids, "users_json": _users_json}
+
+
+def _serve(conn, database):
+    """Worker main loop: one query at a time, (query id, kind, payload) replies"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # shutdown is the parent's job
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Drop inherited sockets (listener, client connections) so closing them
+    # in the parent is not delayed until this process exits
+    fd = conn.fileno()
+    os.closerange(3, fd)
+    os.closerange(fd + 1, os.sysconf("SC_OPEN_MAX"))
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        if not isinstance(message, tuple):
+            continue  # cancel for a query that already finished
+        query_id, name, args = message
+        try:
+            for chunk in QUERIES[name](database, *args):
+                if conn.poll() and conn.recv() == query_id:
+                    conn.send((query_id, "cancelled", None))
+                    break
+                conn.send((query_id, "chunk", chunk))
+            else:
+                conn.send((query_id, "done", None))
+        except Exception as exc:
+            conn.send((query_id, "error", f"{type(exc).__name__}: {exc}"))
+
+
+class Worker:
+    def __init__(self, process, conn, user_id: int, post_id: int):
+        self.process = process
+        self.conn = conn
+        # Snapshot marks: everything above these ids was created after the fork
+        self.user_id = user_id
+        self.post_id = post_id
+        self.query: Optional[int] = None
+        self.messages: Optional[asyncio.Queue] = None
+        self.retired = False
+
+
+class Query:
+    """A submitted query: iterate it for the result chunks"""
+
+    def __init__(self, pool: "ProcessPool", worker: Worker, query_id: int, deadline: float):
+        self.pool = pool
+        self.worker = worker
+        self.id = query_id
+        self.deadline = deadline
+        self.user_id = worker.user_id
+        self.post_id = worker.post_id
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        messages = self.worker.messages
+        finished = False
+        try:
+            while True:
+                try:
+                    kind, payload = await asyncio.wait_for(messages.get(), self.deadline - loop.time())
+                except asyncio.TimeoutError:
+                    self.pool.timeouts += 1
+                    raise
+                if kind == "chunk":
+                    self.pool.chunks += 1
+                    yield payload
+                    continue
+                finished = True
+                if kind == "error":
+                    raise RuntimeError(f"Query failed in worker: {payload}")
+                return
+        finally:
+            if not finished:
+                self.pool.cancel(self.worker, self.id)
+
+
+class ProcessPool:
+    def __init__(self, database, gate: Callable[[Callable], Awaitable], version: Callable[[], int],
+                 workers: int = WORKERS):
+        """`gate(fn)` runs fn while no storage thread is reading (MemoryStorage.exclusive);
+        `version()` changes with every write to the database"""
+        self.database = database
+        self.gate = gate
+        self.version = version
+        self.size = workers if FORK_AVAILABLE else 0
+        self.workers: List[Worker] = []
+        self.idle: Deque[Worker] = deque()
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.ids = itertools.count(1)
+        self.snapshot_key = None
+        self.current_at = time.monotonic()  # when the snapshot was last known to be current
+        self.queries = 0
+        self.chunks = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.killed = 0
+        self.refreshes = 0
+
+    # Workers
+
+    def _fork(self) -> Worker:
+        parent, child = multiprocessing.Pipe()
+        gc.freeze()
+        try:
+            process = multiprocessing.get_context("fork").Process(
+                target=_serve, args=(child, self.database), name="query-worker", daemon=True)
+            process.start()
+        finally:
+            gc.unfreeze()
+        child.close()
+        worker = Worker(process, parent, self.database.user_id, self.database.post_id)
+        asyncio.get_running_loop().add_reader(parent.fileno(), self._on_message, worker)
+        return worker
+
+    def refresh(self):
+        """Fork a new generation of workers if the data changed; run through the gate"""
+        key = self.version()
+        if not self.size or key == self.snapshot_key:
+            self.current_at = time.monotonic()
+            return
+        self.snapshot_key = key
+        old, self.workers = self.workers, [self._fork() for _ in range(self.size)]
+        self.current_at = time.monotonic()
+        self.refreshes += 1
+        self.idle.clear()
+        for worker in old:
+            worker.retired = True
+            if worker.query is None:
+                self._retire(worker)
+        for worker in self.workers:
+            self._release(worker)
+        multiprocessing.active_children()  # reap exited workers
+
+    def reset(self, database):
+        """Serve from another database (a replica reloading its snapshot); run through the gate"""
+        self.database = database
+        self.snapshot_key = None
+        self.refresh()
+
+    async def _replace(self):
+        def fork():
+            if len(self.workers) < self.size:
+                worker = self._fork()
+                self.workers.append(worker)
+                self._release(worker)
+        await self.gate(fork)
+
+    def _retire(self, worker: Worker):
+        asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+        try:
+            worker.conn.send(None)
+        except OSError:
+            pass
+        worker.conn.close()
+
+    def _on_message(self, worker: Worker):
+        try:
+            query_id, kind, payload = worker.conn.recv()
+        except (EOFError, OSError):
+            self._lost(worker)
+            return
+        if query_id != worker.query:
+            return
+        if worker.messages is not None:
+            worker.messages.put_nowait((kind, payload))
+        if kind != "chunk":
+            worker.query = worker.messages = None
+            if worker.retired:
+                self._retire(worker)
+            else:
+                self._release(worker)
+
+    def _lost(self, worker: Worker):
+        """The worker exited (killed after a cancel, or crashed)"""
+        asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        if worker.messages is not None:
+            worker.messages.put_nowait(("error", "worker exited"))
+        if worker in self.workers:
+            self.workers.remove(worker)
+            if worker in self.idle:
+                self.idle.remove(worker)
+            asyncio.ensure_future(self._replace())
+
+    def _release(self, worker: Worker):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(worker)
+                return
+        self.idle.append(worker)
+
+    async def _acquire(self) -> Worker:
+        if self.idle:
+            return self.idle.popleft()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(waiter.result())  # handed over just as we gave up
+            raise
+
+    # Queries
+
+    async def submit(self, name: str, *args, timeout: float = QUERY_TIMEOUT) -> Query:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            worker = await asyncio.wait_for(self._acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        query_id = next(self.ids)
+        worker.query = query_id
+        worker.messages = asyncio.Queue()
+        worker.conn.send((query_id, name, args))
+        self.queries += 1
+        return Query(self, worker, query_id, deadline)
+
+    def cancel(self, worker: Worker, query_id: int):
+        """Ask the worker to stop; kill it if it is still busy after CANCEL_GRACE"""
+        if worker.query != query_id:
+            return
+        self.cancelled += 1
+        worker.messages = None  # results of this query are no longer wanted
+        try:
+            worker.conn.send(query_id)
+        except OSError:
+            pass
+        asyncio.get_running_loop().call_later(CANCEL_GRACE, self._kill_if_busy, worker, query_id)
+
+    def _kill_if_busy(self, worker: Worker, query_id: int):
+        if worker.query == query_id and worker.process.is_alive():
+            self.killed += 1
+            worker.process.kill()  # the closed pipe then reports the worker as lost
+
+    def wants_feed(self, user_id: int) -> bool:
+        return bool(self.workers) and self.database.followers.count(user_id) >= MIN_AUTHORS
+
+    def wants_users(self) -> bool:
+        return bool(self.workers) and len(self.database.users) >= MIN_USERS
+
+    async def feed(self, user_id: int, limit: int) -> List[Post]:
+        query = await self.submit("feed_ids", user_id, limit)
+        ids: List[int] = []
+        async for chunk in query:
+            ids.extend(chunk)
+        # Posts created after the fork, newest first
+        database = self.database
+        fresh = []
+        for post_id in range(database.post_id, query.post_id, -1):
+            post = database.posts.get(post_id)
+            if post and (post.userId == user_id or database.followers.contains(user_id, post.userId)):
+                fresh.append(post_id)
+                if len(fresh) == limit:
+                    break
+        posts = (database.posts.get(post_id) for post_id in itertools.islice(fresh + ids, limit))
+        return [post for post in posts if post is not None]
+
+    async def users_json(self) -> AsyncIterator[bytes]:
+        """All users as a JSON array, in chunks"""
+        query = await self.submit("users_json", USERS_CHUNK)
+        separator = b"["
+        async for chunk in query:
+            yield separator + chunk
+            separator = b","
+        database = self.database
+        fresh = [database.users[user_id].model_dump_json().encode()
+                 for user_id in range(query.user_id + 1, database.user_id + 1) if user_id in database.users]
+        if fresh:
+            yield separator + b",".join(fresh)
+            separator = b","
+        yield b"[]" if separator == b"[" else b"]"
+
+    def close(self):
+        for worker in self.workers:
+            self._retire(worker)
+        for worker in self.workers:
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.process.kill()
+        self.workers = []
+        self.idle.clear()
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "busy": sum(worker.query is not None for worker in self.workers),
+            "queries": self.queries,
+            "chunks": self.chunks,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "killed": self.killed,
+            "refreshes": self.refreshes,
+            "snapshot_age_seconds": round(time.monotonic() - self.current_at, 3),
+        }
@@ -0,0 +1,149 @@
+"""Opt-in sampling profiler for the running worker.
+
+A background thread snapshots the event-loop thread's stack every few
+milliseconds via `sys._current_frames()` and attributes each sample to the
+FastAPI route being served (found through the `MetricsRoute.handle` frame).
+Scans offloaded to the storage threads (storage.py) are sampled too, under a
+"<storage threads>" root: their frames do not show which route they serve.
+Idle pool threads are skipped, so that profile's weight is busy thread time.
+Results export as collapsed stacks (flamegraph.pl / speedscope import) or as
+speedscope JSON with one profile per route.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from metrics import MetricsRoute
+
+IDLE = "<idle>"
+POOL_IDLE = "_worker"  # concurrent.futures worker waiting for a work item
+NO_ROUTE = "<no route>"
+MAX_DEPTH = 128
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id: int, interval: float = 0.005, pool_prefix: Optional[str] = None):
+        self.thread_id = thread_id
+        self.pool_prefix = pool_prefix  # also sample threads with this name prefix
+        self.interval = interval
+        self.samples: Counter = Counter()  # (route, stack) -> count
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, seconds: float):
+        """Sample until `seconds` elapsed or stop() was called (blocking)"""
+        handler_code = MetricsRoute.handle.__code__
+        self.started = time.perf_counter()
+        deadline = self.started + seconds
+        while not self._stop.is_set() and time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            frame = frames.get(self.thread_id)
+            if frame is not None:
+                self.samples[self._walk(frame, handler_code)] += 1
+            if self.pool_prefix is not None:
+                self._sample_pool(frames)
+            self._stop.wait(self.interval)
+        self.duration = time.perf_counter() - self.started
+
+    def _sample_pool(self, frames):
+        for thread in threading.enumerate():
+            frame = frames.get(thread.ident)
+            if frame is None or not thread.name.startswith(self.pool_prefix) or frame.f_code.co_name == POOL_IDLE:
+                continue
+            _, stack = self._walk(frame, None)
+            self.samples[(f"<{self.pool_prefix} threads>", stack)] += 1
+
+    @staticmethod
+    def _walk(frame, handler_code) -> Tuple[str, Tuple[Frame, ...]]:
+        stack: List[Frame] = []
+        route = None
+        while frame is not None and len(stack) < MAX_DEPTH:
+            code = frame.f_code
+            if code is handler_code and route is None:
+                route = getattr(frame.f_locals.get("self"), "path", None)
+            stack.append((code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+        if route is None:
+            # The loop waiting in select() is idle time, anything else is framework work
+            route = IDLE if stack and stack[-1][0] in ("select", "poll", "_run_once") else NO_ROUTE
+        return route, tuple(stack)
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format, route as the root frame"""
+        lines = []
+        for (route, stack), n in self.samples.most_common():
+            frames = ";".join(f"{name} ({file}:{line})" for name, file, line in stack)
+            lines.append(f"{route};{frames} {n}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str = "FastAPI worker") -> dict:
+        """speedscope file format, one sampled profile per route"""
+        frames: List[dict] = []
+        index: Dict[Frame, int] = {}
+        profiles: Dict[str, dict] = {}
+        weight_ms = self.interval * 1000
+
+        for (route, stack), n in self.samples.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            profile = profiles.setdefault(route, {
+                "type": "sampled", "name": route, "unit": "milliseconds",
+                "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+            })
+            profile["samples"].append(ids)
+            profile["weights"].append(n * weight_ms)
+            profile["endValue"] += n * weight_ms
+
+        ordered = sorted(profiles.values(), key=lambda p: p["endValue"], reverse=True)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": ordered,
+            "name": name,
+            "activeProfileIndex": 0,
+            "exporter": "web_api_tests/python/profiler.py",
+        }
+
+
+_active: Optional[SamplingProfiler] = None
+_lock = threading.Lock()
+
+
+def start(thread_id: int, interval: float, pool_prefix: Optional[str] = None) -> Optional[SamplingProfiler]:
+    """Claim the (single) profiler slot; None if a profile is already running"""
+    global _active
+    with _lock:
+        if _active is not None:
+            return None
+        _active = SamplingProfiler(thread_id, interval, pool_prefix)
+        return _active
+
+
+def finish(profiler: SamplingProfiler):
+    global _active
+    with _lock:
+        if _active is profiler:
+            _active = None
+
+
+def stop_active() -> bool:
+    with _lock:
+        if _active is None:
+            return False
+        _active.stop()
+        return True
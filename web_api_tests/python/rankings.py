@@ -0,0 +1,166 @@
+"""Incrementally maintained rankings: trending posts and the likes leaderboard.
+
+Trending uses exponentially decayed scores, one ranking per window (the
+window is the half-life). Decay is applied in log space: an event of weight
+w at time t adds w * 2^(t / half_life) to a post's key, stored as its
+logarithm. Every key decays by the same factor, so the order never changes
+as time passes. Only events move a post, and reading the top N needs no
+re-sorting. The current score is exp(key - rate * now).
+
+Keys only grow, so the top TRENDING_CAPACITY posts per window can be kept
+exactly in a bounded skip list: a post outside it can only get back in
+through an event, and that is when we look at it. Writes are O(log n),
+reading the top N is O(N).
+"""
+
+import math
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+WINDOWS = {"1h": 3600, "6h": 6 * 3600, "24h": 24 * 3600, "7d": 7 * 24 * 3600}
+EVENT_WEIGHTS = {"view": 1.0, "like": 5.0, "comment": 10.0}
+CAPACITY = int(os.environ.get("TRENDING_CAPACITY", "1000"))
+
+_EPOCH = time.time()
+
+
+def _logaddexp(a: float, b: float) -> float:
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+class SkipList:
+    """(key, member) pairs in descending order
+
+    Nodes are lists [key, member, next_0, next_1, ...] to keep them small.
+    """
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self.head = [math.inf, None] + [None] * self.MAX_LEVEL
+        self.level = 1
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _path(self, key: float, member: int) -> List[list]:
+        """Last node before (key, member) on every level"""
+        update = [self.head] * self.MAX_LEVEL
+        node = self.head
+        for i in range(self.level + 1, 1, -1):
+            nxt = node[i]
+            while nxt is not None and (nxt[0] > key or (nxt[0] == key and nxt[1] > member)):
+                node = nxt
+                nxt = node[i]
+            update[i - 2] = node
+        return update
+
+    def insert(self, key: float, member: int):
+        update = self._path(key, member)
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        self.level = max(self.level, level)
+        node = [key, member] + [None] * level
+        for i in range(level):
+            prev = update[i]
+            node[i + 2] = prev[i + 2]
+            prev[i + 2] = node
+        self.size += 1
+
+    def remove(self, key: float, member: int) -> bool:
+        update = self._path(key, member)
+        node = update[0][2]
+        if node is None or node[0] != key or node[1] != member:
+            return False
+        for i in range(len(node) - 2):
+            if update[i][i + 2] is node:
+                update[i][i + 2] = node[i + 2]
+        self.size -= 1
+        return True
+
+    def last(self) -> Optional[Tuple[float, int]]:
+        """Smallest pair, O(log n) via the express lanes"""
+        node = self.head
+        for i in range(self.level + 1, 1, -1):
+            while node[i] is not None:
+                node = node[i]
+        return None if node is self.head else (node[0], node[1])
+
+    def top(self, limit: int) -> List[Tuple[float, int]]:
+        result = []
+        node = self.head[2]
+        while node is not None and len(result) < limit:
+            result.append((node[0], node[1]))
+            node = node[2]
+        return result
+
+
+class DecayedTopK:
+    def __init__(self, half_life: float, capacity: int = CAPACITY):
+        self.rate = math.log(2) / half_life
+        self.capacity = capacity
+        self.keys: Dict[int, float] = {}  # post id -> log key, for every post with events
+        self.top = SkipList()
+
+    def add(self, post_id: int, weight: float, now: float):
+        increment = self.rate * now + math.log(weight)
+        old = self.keys.get(post_id)
+        key = increment if old is None else _logaddexp(old, increment)
+        self.keys[post_id] = key
+        if old is not None and self.top.remove(old, post_id):
+            self.top.insert(key, post_id)
+        elif len(self.top) < self.capacity:
+            self.top.insert(key, post_id)
+        else:
+            tail = self.top.last()
+            if (key, post_id) > tail:
+                self.top.remove(*tail)
+                self.top.insert(key, post_id)
+
+    def discard(self, post_id: int):
+        key = self.keys.pop(post_id, None)
+        if key is not None:
+            self.top.remove(key, post_id)
+
+    def ranked(self, limit: int, now: float) -> List[Tuple[int, float]]:
+        """(post id, current decayed score), best first"""
+        decay = self.rate * now
+        return [(post_id, math.exp(key - decay)) for key, post_id in self.top.top(limit)]
+
+
+class Rankings:
+    def __init__(self, capacity: int = CAPACITY):
+        self.trending = {name: DecayedTopK(seconds, capacity) for name, seconds in WINDOWS.items()}
+        self.likes = SkipList()  # (likeCount, post id) of every post with likes
+
+    def record(self, post_id: int, event: str, count: int = 1, now: Optional[float] = None):
+        if now is None:
+            now = time.time() - _EPOCH
+        weight = EVENT_WEIGHTS[event] * count
+        for ranking in self.trending.values():
+            ranking.add(post_id, weight, now)
+
+    def like_count_changed(self, post_id: int, old: int, new: int):
+        if old > 0:
+            self.likes.remove(old, post_id)
+        if new > 0:
+            self.likes.insert(new, post_id)
+
+    def discard(self, post_id: int, like_count: int):
+        for ranking in self.trending.values():
+            ranking.discard(post_id)
+        if like_count > 0:
+            self.likes.remove(like_count, post_id)
+
+    def trending_posts(self, window: str, limit: int) -> List[Tuple[int, float]]:
+        return self.trending[window].ranked(limit, time.time() - _EPOCH)
+
+    def most_liked(self, limit: int) -> List[int]:
+        return [post_id for _, post_id in self.likes.top(limit)]
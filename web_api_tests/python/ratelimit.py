@@ -0,0 +1,163 @@
+"""Per-client, per-route token-bucket rate limiting.
+
+Clients are identified by their `X-API-Key` header if it is one of
+RATE_LIMIT_API_KEYS, else by IP (the first `X-Forwarded-For` hop when
+RATE_LIMIT_TRUST_FORWARDED=1, e.g. behind Traefik). Unknown keys count as
+absent, so rotating made-up keys does not get a client fresh buckets.
+Each (client, method, route) pair gets a bucket of RATE_LIMIT_BURST tokens
+refilled at RATE_LIMIT_RPS per second; a request takes one token or is
+answered with 429 + Retry-After.
+
+Buckets live in an LRU-ordered dict capped at RATE_LIMIT_MAX_KEYS. A bucket
+idle for burst / rate seconds is full again and thus indistinguishable from
+a new one, so it is expired instead of kept around.
+
+Responses carry RateLimit-Limit / -Remaining / -Reset / -Policy headers
+(IETF draft "RateLimit header fields for HTTP"). Disabled unless
+RATE_LIMIT_RPS is set.
+"""
+
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import FrozenSet, Optional, Tuple
+
+from admission import EXEMPT_PREFIXES
+
+_NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def client_id(scope, trust_forwarded: bool = False, api_keys: Optional[FrozenSet[bytes]] = None) -> str:
+    """API key if the client sent one (and it is in `api_keys`, when given), else its IP address"""
+    forwarded = None
+    for name, value in scope["headers"]:
+        if name == b"x-api-key" and (api_keys is None or value in api_keys):
+            return "key:" + value.decode("latin-1")
+        if name == b"x-forwarded-for":
+            forwarded = value
+    if forwarded is not None and trust_forwarded:
+        return forwarded.split(b",", 1)[0].strip().decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def route_key(path: str) -> str:
+    """Collapse numeric path segments so /api/posts/17 and /api/posts/18 share a bucket"""
+    return _NUMERIC_SEGMENT.sub("/{id}", path)
+
+
+class TokenBucketStore:
+    # Buckets are [tokens, last_refill] lists: cheaper to update in place than objects
+    SWEEP = 2  # expired buckets dropped per call, keeps eviction amortised O(1)
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_ttl = burst / rate
+        self.buckets: "OrderedDict[tuple, list]" = OrderedDict()
+        self.evicted = 0
+
+    def take(self, key: tuple, now: Optional[float] = None) -> Tuple[bool, float]:
+        """Take one token; returns (allowed, tokens left afterwards)"""
+        if now is None:
+            now = time.monotonic()
+        buckets = self.buckets
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = [self.burst, now]
+            self._sweep(now)
+        else:
+            buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True, bucket[0]
+        return False, bucket[0]
+
+    def _sweep(self, now: float):
+        buckets = self.buckets
+        while len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+            self.evicted += 1
+        for _ in range(self.SWEEP):
+            oldest = next(iter(buckets.values()))
+            if now - oldest[1] < self.idle_ttl:
+                break
+            buckets.popitem(last=False)
+
+    def reset_after(self, tokens: float) -> float:
+        """Seconds until the bucket is full again"""
+        return (self.burst - tokens) / self.rate
+
+    def retry_after(self, tokens: float) -> float:
+        """Seconds until the next token is available"""
+        return max(1 - tokens, 0.0) / self.rate
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rate: float = float(os.environ.get("RATE_LIMIT_RPS", "0")),
+        burst: Optional[float] = None,
+        max_keys: int = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000")),
+        trust_forwarded: bool = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "0") == "1",
+        api_keys: str = os.environ.get("RATE_LIMIT_API_KEYS", ""),
+    ):
+        if burst is None:
+            burst = float(os.environ.get("RATE_LIMIT_BURST", str(rate * 2)))
+        self.enabled = rate > 0
+        self.store = TokenBucketStore(rate or 1.0, burst or 1.0, max_keys)
+        self.trust_forwarded = trust_forwarded
+        self.api_keys = frozenset(key.strip().encode("latin-1") for key in api_keys.split(",") if key.strip())
+        self.limited = 0
+        self.policy = f"{int(self.store.burst)};w={math.ceil(self.store.idle_ttl)}".encode()
+
+    def client(self, scope) -> str:
+        """The client a request counts against (also scopes idempotency keys, coalescing.py)"""
+        return client_id(scope, self.trust_forwarded, self.api_keys)
+
+    def stats(self) -> dict:
+        """Gauges for /metrics"""
+        return {"buckets": len(self.store.buckets), "evicted_total": self.store.evicted,
+                "limited_total": self.limited}
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiter
+        if scope["type"] != "http" or not limiter.enabled or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        store = limiter.store
+        allowed, tokens = store.take((limiter.client(scope), scope["method"], route_key(scope["path"])))
+        headers = [
+            (b"ratelimit-limit", b"%d" % store.burst),
+            (b"ratelimit-remaining", b"%d" % tokens),
+            (b"ratelimit-reset", b"%d" % math.ceil(store.reset_after(tokens))),
+            (b"ratelimit-policy", limiter.policy),
+        ]
+
+        if not allowed:
+            limiter.limited += 1
+            headers.append((b"retry-after", b"%d" % math.ceil(store.retry_after(tokens))))
+            headers.append((b"content-type", b"application/json"))
+            await send({"type": "http.response.start", "status": 429, "headers": headers})
+            await send({"type": "http.response.body", "body": b'{"detail":"Rate limit exceeded"}'})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
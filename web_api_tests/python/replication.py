@@ -0,0 +1,524 @@
+"""Read replicas fed by a change-data-capture (CDC) stream from the primary.
+
+The primary (default) appends every Database mutation to a ChangeLog in
+commit order, as (version, op, args). The args carry everything the primary
+generated (ids, timestamps), so replaying a change through the same Database
+method reproduces the primary's state exactly. The newest CDC_LOG_SIZE
+changes stay in memory and are served on
+
+- GET /internal/snapshot: the whole state at one version, as NDJSON. It is
+  copied on the event loop while no storage thread reads, so writes wait for
+  the copy (not for the serialization, which streams from threads).
+- GET /internal/cdc?after=N: up to CDC_BATCH changes after version N. If
+  there are none yet the request long-polls for up to `wait` seconds. 410 if
+  N already fell out of the log or the primary restarted (new epoch).
+- POST /internal/views: view counts recorded on replicas.
+
+A replica (REPLICA_OF=<primary URL>) loads the snapshot into a fresh
+Database, then applies the stream through the storage write gate. It answers
+reads from its copy and forwards writes to the primary. Its views are shipped
+to the primary and come back through the stream like any other change.
+
+Read-your-writes: every response carries X-Data-Version, the version the
+data in it is at least as fresh as: for a write the version after it, for a
+read the version when it started (before the response is computed; it is
+also part of the SingleFlight key in coalescing.py, so a read never shares
+a response computed at an older version). A client that sends it back as
+X-Min-Version gets an answer at least that fresh: the replica waits up to
+RYW_WAIT seconds to catch up, then forwards the read to the primary.
+
+/internal/* answers 404 unless REPLICATION_TOKEN is set (a replica refuses
+to start without it) and then requires it in X-Replication-Token: the
+snapshot holds every user's email and views feed the counters.
+
+Memory backend only. Replicas talk to the primary with urllib on a small
+thread pool, so there is no HTTP client dependency.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import socket
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from admission import READ_METHODS
+
+REPLICA_OF = os.environ.get("REPLICA_OF", "").rstrip("/") or None
+TOKEN = os.environ.get("REPLICATION_TOKEN")  # shared secret; /internal/* is only served with it
+LOG_SIZE = int(os.environ.get("CDC_LOG_SIZE", "100000"))
+BATCH = int(os.environ.get("CDC_BATCH", "500"))
+POLL_WAIT = float(os.environ.get("CDC_POLL_WAIT", "10"))
+RYW_WAIT = float(os.environ.get("RYW_WAIT", "0.5"))
+RETRY_DELAY = 1.0
+REPLICA_TTL = 30.0  # replicas that have not polled for this long are no longer counted
+SNAPSHOT_TIMEOUT = 300.0
+FORWARD_TIMEOUT = 30.0
+VIEW_SHIP_INTERVAL = 1.0
+THREADS = 16  # forwarded requests, the long poll and view shipping
+
+HOP_BY_HOP = {b"connection", b"keep-alive", b"transfer-encoding", b"upgrade", b"host", b"content-length"}
+
+Change = Tuple[int, str, list]
+
+
+class ReplicationError(Exception):
+    """The replica cannot follow the stream any more and reloads the snapshot"""
+
+
+# Capture (primary): Database method -> args of its change, from the call's
+# args and result. Nothing is recorded for a falsy result or change (no effect).
+
+CAPTURE: Dict[str, Callable] = {
+    "create_user": lambda args, user: [user.id, user.username, user.email, user.displayName,
+                                       user.createdAt.isoformat()],
+    "update_user": lambda args, user: [user.id, args[1], user.updatedAt.isoformat()],
+    "create_post": lambda args, post: [post.id, post.userId, post.content, post.createdAt.isoformat()],
+    "add_comment": lambda args, comment: [comment.id, comment.postId, comment.userId, comment.text,
+                                          comment.createdAt.isoformat()],
+    "delete_post": lambda args, deleted: list(args),
+    "like_post": lambda args, changed: list(args),
+    "unlike_post": lambda args, changed: list(args),
+    # follow()/unfollow() go through these halves (sharding.py may call them alone)
+    "add_follower": lambda args, changed: list(args),
+    "remove_follower": lambda args, changed: list(args),
+    "add_following": lambda args, changed: list(args),
+    "remove_following": lambda args, changed: list(args),
+    "add_views": lambda args, total: [[post_id, count] for post_id, count in args[0].items()],
+    # Retention: replicas drop exactly what the primary expired
+    "maintain": lambda args, expired: list(expired) if any(expired) else None,
+}
+
+
+def capture(database, log: "ChangeLog"):
+    """Record the changes made through `database`'s methods in `log` (instance-level wrappers)"""
+    def make(name, fn, change):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            result = fn(*args)
+            if result:
+                recorded = change(args, result)
+                if recorded is not None:
+                    log.append(name, recorded)
+            return result
+        return wrapper
+
+    for name, change in CAPTURE.items():
+        setattr(database, name, make(name, getattr(database, name), change))
+
+
+# Apply (replica)
+
+def _expect(item, item_id: int):
+    if item.id != item_id:
+        raise ReplicationError(f"Replayed {type(item).__name__} got id {item.id}, the primary's is {item_id}")
+
+
+def apply(database, op: str, args: list):
+    # Creates are replayed with the primary's id: with sharding, the ids it handed out are not consecutive
+    if op == "create_user":
+        user_id, username, email, display_name, now = args
+        database.user_id = user_id - 1
+        _expect(database.create_user(username, email, display_name, datetime.fromisoformat(now)), user_id)
+    elif op == "update_user":
+        user_id, updates, now = args
+        database.update_user(user_id, updates, datetime.fromisoformat(now))
+    elif op == "create_post":
+        post_id, user_id, content, now = args
+        database.post_id = post_id - 1
+        _expect(database.create_post(user_id, content, datetime.fromisoformat(now)), post_id)
+    elif op == "add_comment":
+        comment_id, post_id, user_id, text, now = args
+        database.comment_id = comment_id - 1
+        _expect(database.add_comment(post_id, user_id, text, datetime.fromisoformat(now)), comment_id)
+    elif op == "add_views":
+        database.add_views(dict(args))
+    elif op == "maintain":
+        database.expire(*args)
+    elif op in ("delete_post", "like_post", "unlike_post", "add_follower", "remove_follower", "add_following",
+                "remove_following"):
+        getattr(database, op)(*args)
+    else:
+        raise ReplicationError(f"Unknown change {op!r}")
+
+
+def ndjson(header: dict, chunks: List[Tuple[str, list]]) -> Iterator[bytes]:
+    """Snapshot body: the header line, then one [kind, records] line per chunk"""
+    yield json.dumps(header).encode() + b"\n"
+    for chunk in chunks:
+        yield json.dumps(chunk).encode() + b"\n"
+
+
+def _http(method: str, url: str, body: Optional[bytes] = None, headers: Optional[dict] = None,
+          timeout: float = FORWARD_TIMEOUT) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """(status, headers, body); HTTP error statuses are returned, connection errors raise OSError"""
+    request = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.getheaders(), response.read()
+    except urllib.error.HTTPError as exc:
+        with exc:
+            return exc.code, list(exc.headers.items()), exc.read()
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def proxy(base_url: str, scope, body: bytes, send, call: Callable, headers: Optional[dict] = None,
+                unreachable: str = "Upstream unreachable"):
+    """Send the request to `base_url` and answer with its response; `call(fn, *args)` runs fn on a thread"""
+    url = base_url + scope["path"]
+    if scope["query_string"]:
+        url += "?" + scope["query_string"].decode("latin-1")
+    request_headers = {name.decode("latin-1"): value.decode("latin-1")
+                       for name, value in scope["headers"] if name not in HOP_BY_HOP}
+    client = scope.get("client")
+    if client:
+        forwarded = request_headers.get("x-forwarded-for")
+        request_headers["x-forwarded-for"] = f"{forwarded}, {client[0]}" if forwarded else client[0]
+    request_headers.update(headers or {})
+    try:
+        status, response_headers, data = await call(_http, scope["method"], url, body or None, request_headers)
+    except OSError:
+        status, response_headers = 502, [("Content-Type", "application/json")]
+        data = json.dumps({"detail": unreachable}).encode()
+    raw = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response_headers]
+    raw = [(name, value) for name, value in raw if name not in HOP_BY_HOP]
+    raw.append((b"content-length", b"%d" % len(data)))
+    await send({"type": "http.response.start", "status": status, "headers": raw})
+    await send({"type": "http.response.body", "body": data})
+
+
+class ChangeLog:
+    """The primary's recent changes, in commit order"""
+
+    def __init__(self, size: int = LOG_SIZE):
+        self.epoch = os.urandom(8).hex()  # a restarted primary starts over at version 0
+        self.version = 0
+        self.changes: Deque[Change] = deque(maxlen=size)
+        self.waiters: List[asyncio.Future] = []
+        self.replicas: Dict[str, Tuple[int, float]] = {}  # replica id -> (applied version, last poll)
+        self.snapshots = 0
+
+    def append(self, op: str, args: list):
+        self.version += 1
+        self.changes.append((self.version, op, args))
+        for future in self.waiters:
+            if not future.done():
+                future.set_result(None)
+        self.waiters.clear()
+
+    def since(self, after: int, limit: int = BATCH) -> Optional[List[Change]]:
+        """Changes after version `after`; None if some of them were already dropped"""
+        behind = self.version - after
+        if behind < 0 or behind > len(self.changes):
+            return None
+        start = len(self.changes) - behind
+        return [self.changes[i] for i in range(start, min(start + limit, len(self.changes)))]
+
+    async def wait(self, after: int, timeout: float):
+        """Until there is a change after `after`, at most `timeout` seconds"""
+        if self.version > after or timeout <= 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def polled(self, replica: str, version: int):
+        self.replicas[replica] = (version, time.monotonic())
+
+    def snapshot(self, database) -> Tuple[dict, List[Tuple[str, list]]]:
+        """The state and the version it is at; run through the storage gate"""
+        self.snapshots += 1
+        return {"epoch": self.epoch, "version": self.version}, list(database.snapshot())
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        for replica, (_, at) in list(self.replicas.items()):
+            if now - at > REPLICA_TTL:
+                del self.replicas[replica]
+        applied = [version for version, _ in self.replicas.values()]
+        return {
+            "version": self.version,
+            "log_changes": len(self.changes),
+            "snapshots": self.snapshots,
+            "replicas": len(applied),
+            "max_replica_lag_versions": self.version - min(applied) if applied else 0,
+        }
+
+
+class Replica:
+    """Follows the primary's change stream into the local MemoryStorage"""
+
+    def __init__(self, primary: str, storage, new_database: Callable[[], object],
+                 on_reset: Optional[Callable[[object], None]] = None):
+        """`new_database()` makes an empty Database; `on_reset(database)` runs when one replaces the current one"""
+        if not TOKEN:
+            raise ValueError("REPLICA_OF needs REPLICATION_TOKEN (the primary serves /internal/* only with it)")
+        self.primary = primary
+        self.storage = storage
+        self.new_database = new_database
+        self.on_reset = on_reset
+        self.id = f"{socket.gethostname()}:{os.getpid()}"
+        self.headers = {"X-Replication-Token": TOKEN}
+        self.executor = ThreadPoolExecutor(THREADS, thread_name_prefix="replication")
+        self.tasks: List[asyncio.Task] = []
+        self.epoch: Optional[str] = None
+        self.version = 0
+        self.primary_version = 0
+        self.ready = False  # until the snapshot is loaded everything is forwarded
+        self.connected = False
+        self.caught_up_at = time.monotonic()
+        self.waiters: List[Tuple[int, asyncio.Future]] = []
+        self.views: Counter = Counter()  # recorded here, not yet shipped
+        self.last_error: Optional[str] = None
+        self.applied = 0
+        self.snapshots = 0
+        self.errors = 0
+        self.forwarded = 0
+        self.ryw_waits = 0
+        self.ryw_forwarded = 0
+        self.views_shipped = 0
+        self._intercept_views(storage.database)
+
+    def _call(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args))
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._follow()), asyncio.create_task(self._ship_views_periodically())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        try:
+            await self._ship_views()
+        except OSError:
+            pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # Stream
+
+    async def _follow(self):
+        while True:
+            try:
+                if not self.ready:
+                    await self._load_snapshot()
+                await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.errors += 1
+                self.connected = False
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                if not isinstance(exc, OSError):
+                    self.ready = False  # diverged or out of the log: start over from a snapshot
+                await asyncio.sleep(RETRY_DELAY)
+
+    def _download(self, database) -> dict:
+        request = urllib.request.Request(f"{self.primary}/internal/snapshot", headers=self.headers)
+        with urllib.request.urlopen(request, timeout=SNAPSHOT_TIMEOUT) as response:
+            header = json.loads(response.readline())
+            for line in response:
+                database.restore(*json.loads(line))
+        return header
+
+    async def _load_snapshot(self):
+        database = self.new_database()
+        self._intercept_views(database)
+        header = await self._call(self._download, database)  # restored off the loop, nobody reads it yet
+
+        def swap():
+            old = self.storage.reset(database)
+            self.views.update(old.take_views())
+            self.epoch, self.version = header["epoch"], header["version"]
+            self.primary_version = self.version
+            if self.on_reset is not None:
+                self.on_reset(database)
+            return old
+
+        (await self.storage.exclusive(swap)).close()
+        self.snapshots += 1
+        self.ready = self.connected = True
+        self.caught_up_at = time.monotonic()
+        self._wake()
+
+    async def _poll(self):
+        query = urllib.parse.urlencode({"after": self.version, "epoch": self.epoch, "replica": self.id,
+                                        "wait": POLL_WAIT})
+        status, _, body = await self._call(_http, "GET", f"{self.primary}/internal/cdc?{query}", None,
+                                           self.headers, POLL_WAIT + FORWARD_TIMEOUT)
+        if status == 410:
+            raise ReplicationError("Fell out of the primary's change log")
+        if status != 200:
+            raise ConnectionError(f"Change stream returned HTTP {status}")
+        data = json.loads(body)
+        self.connected = True
+        self.primary_version = data["version"]
+        if data["changes"]:
+            await self.storage.exclusive(self._apply, data["changes"])
+        if self.version >= self.primary_version:
+            self.caught_up_at = time.monotonic()
+
+    def _apply(self, changes: List[list]):
+        database = self.storage.database
+        try:
+            for version, op, args in changes:
+                if version != self.version + 1:
+                    raise ReplicationError(f"Expected change {self.version + 1}, got {version}")
+                apply(database, op, args)
+                self.version = version
+                self.applied += 1
+        finally:
+            self._wake()
+
+    # Read-your-writes
+
+    def _wake(self):
+        waiting = []
+        for version, future in self.waiters:
+            if future.done():
+                continue
+            if self.ready and version <= self.version:
+                future.set_result(None)
+            else:
+                waiting.append((version, future))
+        self.waiters = waiting
+
+    async def wait_for(self, version: int, timeout: float = RYW_WAIT) -> bool:
+        """Whether `version` is applied, waiting at most `timeout` seconds for it"""
+        if self.ready and self.version >= version:
+            return True
+        self.ryw_waits += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((version, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.ryw_forwarded += 1
+            return False
+
+    # Views
+
+    def _intercept_views(self, database):
+        """Flushing a replica's views sends them to the primary instead of applying them"""
+        def flush_views() -> int:
+            pending = database.take_views()
+            self.views.update(pending)
+            return sum(pending.values())
+        database.flush_views = flush_views
+
+    async def _ship_views(self):
+        if not self.views:
+            return
+        views, self.views = self.views, Counter()
+        body = json.dumps(list(views.items())).encode()
+        try:
+            status, _, _ = await self._call(_http, "POST", f"{self.primary}/internal/views", body,
+                                            {**self.headers, "Content-Type": "application/json"})
+            if status != 200:
+                raise ConnectionError(f"Shipping views returned HTTP {status}")
+        except BaseException:
+            self.views.update(views)  # retried with the next batch
+            raise
+        self.views_shipped += sum(views.values())
+
+    async def _ship_views_periodically(self):
+        while True:
+            await asyncio.sleep(VIEW_SHIP_INTERVAL)
+            try:
+                await self._ship_views()
+            except OSError:
+                self.errors += 1
+
+    # Forwarding
+
+    async def forward(self, scope, receive, send):
+        """Answer the request with the primary's response"""
+        body = await read_body(receive)
+        self.forwarded += 1
+        await proxy(self.primary, scope, body, send, self._call, unreachable="Primary unreachable")
+
+    def stats(self) -> dict:
+        lag = 0 if self.ready and self.connected and self.version >= self.primary_version \
+            else time.monotonic() - self.caught_up_at
+        return {
+            "ready": int(self.ready),
+            "version": self.version,
+            "primary_version": self.primary_version,
+            "lag_versions": max(self.primary_version - self.version, 0),
+            "lag_seconds": round(lag, 3),
+            "applied": self.applied,
+            "snapshots": self.snapshots,
+            "errors": self.errors,
+            "forwarded": self.forwarded,
+            "ryw_waits": self.ryw_waits,
+            "ryw_forwarded": self.ryw_forwarded,
+            "views_pending": sum(self.views.values()),
+            "views_shipped": self.views_shipped,
+        }
+
+
+class ReplicationMiddleware:
+    """Stamps X-Data-Version; on a replica, forwards what it cannot answer to the primary"""
+
+    def __init__(self, app, log: Optional[ChangeLog] = None, replica: Optional[Replica] = None):
+        self.app = app
+        self.log = log
+        self.replica = replica
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        replica = self.replica
+        if replica is not None and scope["path"].startswith("/api/") and not await self._local(scope):
+            await replica.forward(scope, receive, send)
+            return
+
+        read = scope["method"] in READ_METHODS
+        if read:
+            scope["data_version"] = self._version()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                version = scope["data_version"] if read else self._version()
+                message = {**message, "headers": [*message.get("headers", []), (b"x-data-version", b"%d" % version)]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _version(self) -> int:
+        return self.replica.version if self.replica is not None else self.log.version
+
+    async def _local(self, scope) -> bool:
+        """Whether the replica can answer: a read, and at least as fresh as X-Min-Version"""
+        replica = self.replica
+        if scope["method"] not in READ_METHODS or not replica.ready:
+            return False
+        for name, value in scope["headers"]:
+            if name == b"x-min-version":
+                try:
+                    version = int(value)
+                except ValueError:
+                    return True
+                return await replica.wait_for(version)
+        return True
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+# Local check of the CDC read replicas (replication.py): starts a primary and
+# REPLICAS replicas of main.py as uvicorn processes, writes to the primary and
+# measures
+#   - replication lag: write acknowledged by the primary until a replica
+#     serves it,
+#   - read-your-writes: a replica read right after a write, with and without
+#     the write's X-Data-Version sent back as X-Min-Version,
+# and checks that replicas forward writes and ship their views to the primary.
+
+REPLICAS = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+WRITES = 200
+PRIMARY_PORT = 3201
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOKEN = "replication-test"
+
+def start_server(port, **env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=dict(os.environ, REPLICATION_TOKEN=TOKEN, **env))
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+async def wait_until(session, url, predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as resp:
+                if predicate(resp.status, await resp.text()):
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+async def replication_lag(session, primary, replicas, user_ids):
+    lags = []
+    for i in range(WRITES):
+        async with session.post(f"{primary}/api/posts", json={"userId": user_ids[i % len(user_ids)],
+                                                              "content": f"Replicated post {i}"}) as resp:
+            post_id = (await resp.json())["id"]
+        acknowledged = time.perf_counter()
+        replica = replicas[i % len(replicas)]
+        while True:
+            async with session.get(f"{replica}/api/posts/{post_id}") as resp:
+                if resp.status == 200:
+                    break
+            await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - acknowledged) * 1000)
+    return lags
+
+async def read_your_writes(session, primary, replicas, post_id, user_id, send_version):
+    fresh = 0
+    for i in range(WRITES):
+        async with session.post(f"{primary}/api/comments", json={"postId": post_id, "userId": user_id,
+                                                                 "text": f"Comment {i}"}) as resp:
+            comment_id = (await resp.json())["id"]
+            headers = {"X-Min-Version": resp.headers["X-Data-Version"]} if send_version else {}
+        replica = replicas[i % len(replicas)]
+        async with session.get(f"{replica}/api/posts/{post_id}/comments", headers=headers) as resp:
+            fresh += any(comment["id"] == comment_id for comment in await resp.json())
+    return fresh
+
+async def run_replication_test():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - REPLICATION TEST")
+    print("========================================\n")
+
+    primary = f"http://127.0.0.1:{PRIMARY_PORT}"
+    replicas = [f"http://127.0.0.1:{PRIMARY_PORT + 1 + i}" for i in range(REPLICAS)]
+    processes = [start_server(PRIMARY_PORT)]
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_until(session, f"{primary}/health", lambda status, _: status == 200)
+            for i, replica in enumerate(replicas):
+                processes.append(start_server(PRIMARY_PORT + 1 + i, REPLICA_OF=primary))
+            for replica in replicas:
+                await wait_until(session, f"{replica}/metrics", lambda _, text: "replication_ready 1" in text)
+            print(f"Primary on :{PRIMARY_PORT}, {REPLICAS} replicas, {WRITES} writes per check\n")
+
+            user_ids = []
+            for i in range(20):
+                async with session.post(f"{primary}/api/users", json={
+                        "username": f"repl{i}", "email": f"repl{i}@example.com", "displayName": f"Repl {i}"}) as resp:
+                    user_ids.append((await resp.json())["id"])
+
+            lag_p50, lag_p99 = percentiles(await replication_lag(session, primary, replicas, user_ids))
+            async with session.post(f"{primary}/api/posts", json={"userId": user_ids[0], "content": "RYW"}) as resp:
+                post_id = (await resp.json())["id"]
+            await wait_until(session, f"{replicas[0]}/api/posts/{post_id}", lambda status, _: status == 200)
+            stale_ok = await read_your_writes(session, primary, replicas, post_id, user_ids[1], False)
+            ryw_ok = await read_your_writes(session, primary, replicas, post_id, user_ids[1], True)
+
+            # A write sent to a replica is forwarded to the primary
+            async with session.post(f"{replicas[0]}/api/posts", json={"userId": user_ids[2],
+                                                                      "content": "Sent to a replica"}) as resp:
+                forwarded_status = resp.status
+                forwarded_id = (await resp.json())["id"]
+            async with session.get(f"{primary}/api/posts/{forwarded_id}") as resp:
+                forwarded_ok = forwarded_status == 201 and resp.status == 200
+
+            # Views recorded on a replica end up on the primary
+            for _ in range(20):
+                async with session.get(f"{replicas[0]}/api/posts/{post_id}") as resp:
+                    await resp.read()
+            await asyncio.sleep(3)
+            async with session.get(f"{primary}/api/posts/{post_id}") as resp:
+                views = (await resp.json())["views"]
+
+            # /internal/* needs the token, and view counts must be positive
+            async with session.get(f"{primary}/internal/snapshot") as resp:
+                guarded = resp.status == 403
+            async with session.post(f"{primary}/internal/views", json=[[post_id, -500]],
+                                    headers={"X-Replication-Token": TOKEN}) as resp:
+                guarded = guarded and resp.status == 422
+
+            async with session.get(f"{replicas[0]}/metrics") as resp:
+                gauges = [line for line in (await resp.text()).splitlines() if line.startswith("replication_")]
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(10)
+
+    print("========================================")
+    print("            REPLICATION")
+    print("========================================")
+    print(f"Lag (primary ack -> replica read): p50 {lag_p50:.1f}ms, p99 {lag_p99:.1f}ms")
+    print(f"Read after write, no version:    {stale_ok}/{WRITES} saw the write")
+    print(f"Read after write, X-Min-Version: {ryw_ok}/{WRITES} saw the write")
+    print(f"Write via replica forwarded:     {'yes' if forwarded_ok else 'NO'}")
+    print(f"Replica views on the primary:    {views} (20 sent)")
+    print(f"/internal/* guarded:             {'yes' if guarded else 'NO'}")
+    print("========================================")
+    for line in gauges:
+        print(line)
+    print("========================================")
+    if ryw_ok == WRITES and forwarded_ok and views >= 20 and guarded:
+        print("✓ Replicas follow the primary with read-your-writes")
+    else:
+        print("✗ Replication check failed")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    asyncio.run(run_replication_test())
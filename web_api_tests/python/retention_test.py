@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+# Short segments and retention so the effect shows within a minute; set
+# before importing main because segments.py reads them at import time
+os.environ.setdefault("SEGMENT_SECONDS", "2")
+os.environ.setdefault("HOT_SEGMENTS", "2")
+os.environ.setdefault("RETENTION_SECONDS", "10")
+
+import psutil
+
+from main import Database
+
+# In-process check that memory stays bounded under continuous
+# stress_test.py-style ingestion (posts, comments and likes as fast as
+# possible): old segments are spilled to disk and expire after
+# RETENTION_SECONDS, so RSS levels off instead of growing with the total.
+
+DURATION = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+USERS = 1000
+REPORT_EVERY = 5
+
+def run_retention_test():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - RETENTION TEST")
+    print("========================================\n")
+    print(f"Segments of {os.environ['SEGMENT_SECONDS']}s, {os.environ['HOT_SEGMENTS']} hot, "
+          f"retention {os.environ['RETENTION_SECONDS']}s, ingesting for {DURATION:.0f}s\n")
+
+    process = psutil.Process()
+    db = Database()
+    for i in range(USERS):
+        db.create_user(f"stressuser{i}", f"stress{i}@example.com", f"Stress User {i}")
+
+    print(f"{'Time s':>7} {'Ingested':>10} {'Live posts':>11} {'Hot':>8} {'Cold MB':>8} {'RSS MB':>8}")
+    start = time.monotonic()
+    next_report = next_maintenance = start
+    i = 0
+    while time.monotonic() - start < DURATION:
+        for _ in range(1000):
+            i += 1
+            post = db.create_post(i % USERS + 1, f"Stress post {i}")
+            db.add_comment(post.id, (i + 1) % USERS + 1, f"Spam comment {i}")
+            db.like_post(post.id, (i + 2) % USERS + 1)
+            db.record_view(post.id)
+        now = time.monotonic()
+        if now >= next_maintenance:
+            db.flush_views()
+            db.maintain()
+            next_maintenance = now + 1
+        if now >= next_report:
+            stats = db.posts.stats()
+            cold = (stats["cold_bytes"] + db.comments.stats()["cold_bytes"]) / 2**20
+            print(f"{now - start:>7.0f} {i:>10} {stats['items']:>11} {stats['hot_items']:>8} "
+                  f"{cold:>8.1f} {process.memory_info().rss / 2**20:>8.1f}")
+            next_report = now + REPORT_EVERY
+    db.close()
+    print("========================================\n")
+
+if __name__ == "__main__":
+    run_retention_test()
@@ -0,0 +1,103 @@
+"""Runtime statistics of the FastAPI worker: GC pauses and event-loop lag."""
+
+import asyncio
+import gc
+import time
+from typing import Optional
+
+
+class GCStats:
+    """Counts collections per generation and measures their pause time"""
+
+    def __init__(self):
+        self.collections = [0, 0, 0]
+        self.pause_ms_total = 0.0
+        self.pause_ms_max = 0.0
+        self._started: Optional[float] = None
+
+    def install(self):
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+
+    def uninstall(self):
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+
+    def _callback(self, phase: str, info: dict):
+        if phase == "start":
+            self._started = time.perf_counter()
+        elif self._started is not None:
+            pause = (time.perf_counter() - self._started) * 1000
+            self._started = None
+            self.collections[info["generation"]] += 1
+            self.pause_ms_total += pause
+            self.pause_ms_max = max(self.pause_ms_max, pause)
+
+    def snapshot(self, reset_max: bool = False) -> dict:
+        data = {
+            "collections": list(self.collections),
+            "pause_ms_total": round(self.pause_ms_total, 3),
+            "pause_ms_max": round(self.pause_ms_max, 3),
+        }
+        if reset_max:
+            self.pause_ms_max = 0.0
+        return data
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic asyncio timer fires
+
+    The overshoot beyond the requested interval is the time the loop was
+    busy with other callbacks, i.e. how long a new request had to wait.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = 0
+        self.lag_ms_total = 0.0
+        self.lag_ms_max = 0.0
+        self.lag_ms_last = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - expected, 0.0) * 1000
+            self.samples += 1
+            self.lag_ms_total += lag
+            self.lag_ms_last = lag
+            self.lag_ms_max = max(self.lag_ms_max, lag)
+
+    def snapshot(self, reset_max: bool = False) -> dict:
+        data = {
+            "samples": self.samples,
+            "lag_ms_total": round(self.lag_ms_total, 3),
+            "lag_ms_last": round(self.lag_ms_last, 3),
+            "lag_ms_max": round(self.lag_ms_max, 3),
+        }
+        if reset_max:
+            self.lag_ms_max = 0.0
+        return data
+
+
+gc_stats = GCStats()
+loop_lag = LoopLagMonitor()
+
+
+def runtime_snapshot(reset: bool = False) -> dict:
+    """Cumulative counters plus maxima since the last reset"""
+    return {"gc": gc_stats.snapshot(reset), "loop": loop_lag.snapshot(reset)}
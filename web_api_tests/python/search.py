@@ -0,0 +1,393 @@
+"""In-memory full-text search over post content and comment text.
+
+Each index is an inverted index of term -> posting list. Posting lists are
+append-only (document ids only grow) and compressed: (doc id delta, term
+frequency) pairs as varints in a bytearray, split into blocks of BLOCK
+entries. Per block we keep the first doc id and byte offset (for skipping)
+plus the largest tf and shortest document in it, which bound the best BM25
+score any document of the block can reach.
+
+Queries match all terms (AND) and are ranked with BM25. Top-k uses those
+block bounds: blocks of the rarest term are visited best-first and the
+search stops as soon as no remaining block can beat the current k-th hit,
+so even a term occurring in millions of documents decodes only a few
+blocks (SEARCH_MAX_BLOCKS caps the rest). Results are ordered by (score, kind, id) descending; the cursor is
+the last key returned.
+"""
+
+import base64
+import heapq
+import json
+import math
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+BLOCK = 128
+K1 = 1.2
+B = 0.75
+MAX_TERM_LENGTH = 40
+# Work cap per query and index: blocks of the rarest term decoded. Only
+# queries made of very common terms hit it; they get the best hits among the
+# highest-bound blocks instead of the exact top-k.
+MAX_BLOCKS = int(os.environ.get("SEARCH_MAX_BLOCKS", "100"))
+
+_TOKEN = re.compile(r"\w+")
+
+Key = Tuple[float, int, int]  # (score, kind, doc id)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) <= MAX_TERM_LENGTH]
+
+
+def _put_varint(buf: bytearray, value: int):
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+class PostingList:
+    """Closed blocks are grouped by (max tf, min length): their BM25 bound only
+    depends on that pair, so ranking blocks costs one bound per class instead
+    of one per block."""
+
+    __slots__ = ("data", "block_docs", "block_meta", "classes", "count", "last_doc", "removed")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.block_docs = array("I")   # first doc id per block (bisect for skipping)
+        self.block_meta = array("I")   # per block: byte offset, max tf, min doc length
+        self.classes: Dict[Tuple[int, int], array] = {}
+        self.count = 0
+        self.last_doc = 0
+        self.removed = 0  # postings of removed documents still in the list
+
+    def append(self, doc_id: int, tf: int, length: int) -> int:
+        """Add a posting (doc ids must grow); returns the bytes it took"""
+        if tf > 0xFFFF:
+            tf = 0xFFFF
+        if length > 0xFFFF:
+            length = 0xFFFF
+        data = self.data
+        size = len(data)
+        meta = self.block_meta
+        added = 0
+        if self.count % BLOCK == 0:
+            if self.count:
+                closed = (meta[-2], meta[-1])
+                blocks = self.classes.get(closed)
+                if blocks is None:
+                    blocks = self.classes[closed] = array("I")
+                blocks.append(len(self.block_docs) - 1)
+            self.block_docs.append(doc_id)
+            meta.extend((size, tf, length))
+            self.last_doc = doc_id
+            added = 16 + (4 if self.count else 0)
+        else:
+            if tf > meta[-2]:
+                meta[-2] = tf
+            if length < meta[-1]:
+                meta[-1] = length
+        delta = doc_id - self.last_doc
+        if delta < 0x80:
+            data.append(delta)
+        else:
+            _put_varint(data, delta)
+        if tf < 0x80:
+            data.append(tf)
+        else:
+            _put_varint(data, tf)
+        self.last_doc = doc_id
+        self.count += 1
+        return added + len(data) - size
+
+    def decode_block(self, block: int) -> List[Tuple[int, int]]:
+        data = self.data
+        meta = self.block_meta
+        pos = meta[3 * block]
+        end = meta[3 * block + 3] if block + 1 < len(self.block_docs) else len(data)
+        doc = self.block_docs[block]
+        out = []
+        append = out.append
+        while pos < end:
+            value = data[pos]
+            pos += 1
+            if value >= 0x80:  # multi-byte varint; deltas in dense lists rarely are
+                value &= 0x7F
+                shift = 7
+                while True:
+                    byte = data[pos]
+                    pos += 1
+                    value |= (byte & 0x7F) << shift
+                    if byte < 0x80:
+                        break
+                    shift += 7
+            doc += value
+            tf = data[pos]
+            pos += 1
+            if tf >= 0x80:
+                tf &= 0x7F
+                shift = 7
+                while True:
+                    byte = data[pos]
+                    pos += 1
+                    tf |= (byte & 0x7F) << shift
+                    if byte < 0x80:
+                        break
+                    shift += 7
+            append((doc, tf))
+        return out
+
+    def ranked_blocks(self, bound: Callable[[int, int], float]) -> Iterator[Tuple[float, int]]:
+        """(bound, block) best first; equal bounds newest block first"""
+        last = len(self.block_docs) - 1
+        # The open (newest) block goes first: the sort is stable
+        ranked = [(bound(self.block_meta[-2], self.block_meta[-1]), (last,))]
+        ranked.extend((bound(tf, length), blocks) for (tf, length), blocks in self.classes.items())
+        ranked.sort(key=lambda c: c[0], reverse=True)
+        for value, blocks in ranked:
+            for block in reversed(blocks):
+                yield value, block
+
+    def max_bound(self, bound: Callable[[int, int], float]) -> float:
+        return max(bound(tf, length) for tf, length in
+                   [*self.classes, (self.block_meta[-2], self.block_meta[-1])])
+
+    def nbytes(self) -> int:
+        # block_docs + block_meta + one class entry per closed block
+        return len(self.data) + 4 * (2 * len(self.block_docs) - 1 + len(self.block_meta))
+
+
+class _Lookup:
+    """Random access tf(doc) into a posting list, decoding each block at most once"""
+
+    __slots__ = ("postings", "blocks")
+
+    def __init__(self, postings: PostingList):
+        self.postings = postings
+        self.blocks: Dict[int, Dict[int, int]] = {}
+
+    def tf(self, doc_id: int) -> int:
+        block = bisect_right(self.postings.block_docs, doc_id) - 1
+        if block < 0:
+            return 0
+        decoded = self.blocks.get(block)
+        if decoded is None:
+            decoded = self.blocks[block] = dict(self.postings.decode_block(block))
+        return decoded.get(doc_id, 0)
+
+
+class InvertedIndex:
+    """Terms seen in a single document (most of the vocabulary: ids, typos,
+    rare words) are stored inline as the int doc_id << 16 | tf and only get a
+    PostingList once a second document contains them."""
+
+    def __init__(self, kind: int):
+        self.kind = kind  # tie-breaker between indexes in merged results
+        self.postings: Dict[str, Union[int, PostingList]] = {}
+        self.lengths = array("H")  # document length by doc id
+        self.docs = 0
+        self.total_length = 0
+        self.lists = 0
+        self.list_bytes = 0
+
+    def add(self, doc_id: int, text: str):
+        tokens = tokenize(text)
+        if not tokens:
+            return  # matches no query; not counted, like a removed document
+        missing = doc_id + 1 - len(self.lengths)
+        if missing > 0:
+            self.lengths.frombytes(bytes(missing * self.lengths.itemsize))
+        length = len(tokens)
+        self.lengths[doc_id] = min(length, 0xFFFF)
+        self.docs += 1
+        self.total_length += length
+        postings = self.postings
+        for term, tf in Counter(tokens).items():
+            entry = postings.get(term)
+            if entry is None:
+                postings[term] = doc_id << 16 | min(tf, 0xFFFF)
+            elif isinstance(entry, int):
+                entry = postings[term] = self._expand(entry)
+                self.lists += 1
+                self.list_bytes += entry.nbytes() + entry.append(doc_id, tf, length)
+            else:
+                self.list_bytes += entry.append(doc_id, tf, length)
+
+    def remove(self, doc_id: int, text: str):
+        """Inline terms of the document go right away. Posting lists keep its
+        postings (search skips documents of length 0, and document frequency
+        is the list's count minus `removed`) until half of a list is removed,
+        then the list is rebuilt without them."""
+        if doc_id >= len(self.lengths) or not self.lengths[doc_id]:
+            return
+        tokens = tokenize(text)
+        self.docs -= 1
+        self.total_length -= len(tokens)  # lengths[] is capped at 0xFFFF
+        self.lengths[doc_id] = 0
+        for term in set(tokens):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            if isinstance(entry, int):
+                if entry >> 16 == doc_id:
+                    del self.postings[term]
+            else:
+                entry.removed += 1
+                if entry.removed * 2 > entry.count:
+                    self._compact(term, entry)
+
+    def _compact(self, term: str, entry: PostingList):
+        lengths = self.lengths
+        live = [(doc, tf) for block in range(len(entry.block_docs))
+                for doc, tf in entry.decode_block(block) if lengths[doc]]
+        self.lists -= 1
+        self.list_bytes -= entry.nbytes()
+        if not live:
+            del self.postings[term]
+        elif len(live) == 1:
+            self.postings[term] = live[0][0] << 16 | live[0][1]
+        else:
+            rebuilt = self.postings[term] = PostingList()
+            for doc, tf in live:
+                rebuilt.append(doc, tf, lengths[doc])
+            self.lists += 1
+            self.list_bytes += rebuilt.nbytes()
+
+    def _expand(self, inline: int) -> PostingList:
+        postings = PostingList()
+        postings.append(inline >> 16, inline & 0xFFFF, self.lengths[inline >> 16])
+        return postings
+
+    def _weight(self, tf: int, length: int, avg_length: float) -> float:
+        return tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+    def search(self, terms: List[str], limit: int, after: Optional[Key] = None) -> List[Key]:
+        """Top `limit` (score, kind, doc id) keys below `after`, best first"""
+        lists = []
+        for term in dict.fromkeys(terms):
+            entry = self.postings.get(term)
+            if entry is None:
+                return []
+            lists.append(self._expand(entry) if isinstance(entry, int) else entry)
+        if not lists:
+            return []
+        lists.sort(key=lambda p: p.count)
+        n, avg_length = self.docs, max(self.total_length / max(self.docs, 1), 1.0)
+
+        def scorer(idf: float):
+            return lambda tf, length: idf * self._weight(tf, length, avg_length)
+
+        # Document frequency counts live documents only, so idf stays positive after removals
+        scorers = [scorer(math.log(1 + (n - (p.count - p.removed) + 0.5) / (p.count - p.removed + 0.5)))
+                   for p in lists]
+        driver, driver_score = lists[0], scorers[0]
+        others = [(_Lookup(p), p, f, p.max_bound(f)) for p, f in zip(lists[1:], scorers[1:])]
+        global_rest = sum(o[3] for o in others)
+
+        lengths = self.lengths
+        kind = self.kind
+        heap: List[Key] = []
+        worst: Key = (-1.0, kind, 0)  # k-th best key once the heap is full
+        budget = MAX_BLOCKS
+        for bound, block in driver.ranked_blocks(driver_score):
+            lo = driver.block_docs[block]
+            hi = driver.block_docs[block + 1] if block + 1 < len(driver.block_docs) else driver.last_doc + 1
+            # Later blocks have lower bounds or, at equal bound, lower ids (ties go to higher ids)
+            if (bound + global_rest, kind, hi) <= worst or budget == 0:
+                break
+            # Tighter bound from the other terms' blocks overlapping [lo, hi)
+            rest = 0.0
+            for _, p, f, p_max in others:
+                first = max(bisect_right(p.block_docs, lo) - 1, 0)
+                last = bisect_left(p.block_docs, hi)
+                if first >= last or p.block_docs[first] >= hi or (first == last - 1 and p.last_doc < lo):
+                    rest = -1.0
+                    break
+                if last - first > 16:
+                    rest += p_max
+                else:
+                    meta = p.block_meta
+                    rest += max(f(meta[3 * b + 1], meta[3 * b + 2]) for b in range(first, last))
+            if rest < 0 or (bound + rest, kind, hi) <= worst:
+                continue
+            budget -= 1
+
+            for doc_id, tf in driver.decode_block(block):
+                length = lengths[doc_id]
+                if length == 0:
+                    continue  # removed
+                score = driver_score(tf, length)
+                if (score + rest, kind, doc_id) <= worst:
+                    continue
+                for lookup, _, f, _ in others:
+                    other_tf = lookup.tf(doc_id)
+                    if not other_tf:
+                        break
+                    score += f(other_tf, length)
+                else:
+                    key = (score, kind, doc_id)
+                    if after is not None and key >= after:
+                        continue
+                    if len(heap) < limit:
+                        heapq.heappush(heap, key)
+                    elif key > heap[0]:
+                        heapq.heapreplace(heap, key)
+                    if len(heap) == limit:
+                        worst = heap[0]
+        return sorted(heap, reverse=True)
+
+    def stats(self) -> dict:
+        """O(1): scraped by /metrics"""
+        return {
+            "documents": self.docs,
+            "terms": len(self.postings),
+            "posting_lists": self.lists,
+            "posting_bytes": self.list_bytes + 8 * (len(self.postings) - self.lists)
+                             + len(self.lengths) * self.lengths.itemsize,
+        }
+
+
+def encode_cursor(key: Key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Key:
+    """Raises ValueError for malformed cursors"""
+    try:
+        score, kind, doc_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(score), int(kind), int(doc_id)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+class SearchIndex:
+    """Separate indexes for posts and comments, searchable individually or merged"""
+
+    POST, COMMENT = 1, 0
+
+    def __init__(self):
+        self.posts = InvertedIndex(self.POST)
+        self.comments = InvertedIndex(self.COMMENT)
+
+    def search(self, query: str, kinds: Tuple[int, ...], limit: int,
+               cursor: Optional[str] = None) -> Tuple[List[Key], Optional[str]]:
+        terms = tokenize(query)
+        if not terms:
+            return [], None
+        after = decode_cursor(cursor) if cursor else None
+        indexes = [index for index in (self.posts, self.comments) if index.kind in kinds]
+        # One extra hit tells whether there is a next page
+        hits = heapq.nlargest(limit + 1, (key for index in indexes for key in index.search(terms, limit + 1, after)))
+        next_cursor = encode_cursor(hits[limit - 1]) if len(hits) > limit else None
+        return hits[:limit], next_cursor
+
+    def stats(self) -> dict:
+        return {f"{name}_{key}": value
+                for name, index in (("posts", self.posts), ("comments", self.comments))
+                for key, value in index.stats().items()}
@@ -0,0 +1,53 @@
+import itertools
+import random
+import sys
+import time
+
+from search import SearchIndex
+
+# In-process benchmark of the search index: builds an index over synthetic
+# posts (Zipf-distributed vocabulary, like natural text) and times queries
+# from very common to rare terms, first page and second page.
+
+DOCUMENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+VOCABULARY = 50000
+WORDS_PER_POST = 8
+QUERIES = ["post", "stress post", "w1", "w1 w2", "w50", "w5000", "w100 w200", "w20 w300 w4000"]
+
+def run_search_benchmark():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - SEARCH INDEX BENCHMARK")
+    print("========================================\n")
+
+    words = [f"w{i}" for i in range(VOCABULARY)]
+    cumulative = list(itertools.accumulate(1 / (i + 1) for i in range(VOCABULARY)))
+    random.seed(42)
+    index = SearchIndex()
+
+    print(f"Indexing {DOCUMENTS} posts...")
+    start = time.perf_counter()
+    for doc_id in range(1, DOCUMENTS + 1):
+        text = f"Stress post {doc_id} " + " ".join(random.choices(words, cum_weights=cumulative, k=WORDS_PER_POST))
+        index.posts.add(doc_id, text)
+    elapsed = time.perf_counter() - start
+    stats = index.posts.stats()
+    print(f"  ✓ {elapsed:.1f}s ({DOCUMENTS / elapsed:.0f} posts/sec), {stats['terms']} terms, "
+          f"{stats['posting_bytes'] / 1e6:.1f}MB postings ({stats['posting_bytes'] / DOCUMENTS:.1f} bytes/post)")
+
+    print("\n========================================")
+    print("        QUERY LATENCY (ms, top 20)")
+    print("========================================")
+    print(f"{'Query':<18} {'Hits':>5} {'Page 1':>8} {'Page 2':>8}")
+    for query in QUERIES:
+        start = time.perf_counter()
+        hits, cursor = index.search(query, (SearchIndex.POST,), 20)
+        first = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        if cursor:
+            index.search(query, (SearchIndex.POST,), 20, cursor)
+        second = (time.perf_counter() - start) * 1000
+        print(f"{query:<18} {len(hits):>5} {first:>8.2f} {second:>8.2f}")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    run_search_benchmark()
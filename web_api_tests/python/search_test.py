@@ -0,0 +1,87 @@
+import math
+import random
+import sys
+from collections import Counter
+
+from search import B, K1, InvertedIndex, tokenize
+
+# In-process check of the search index against brute-force BM25 over the
+# live documents, with posts being deleted between queries. Deleted
+# documents keep their postings until a list is compacted, so document
+# frequency and the block bounds must only count live ones.
+
+ROUNDS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+WORDS = ["hello", "world", "there", "stress", "post", "alpha", "beta", "gamma"]
+
+def brute_force(docs, terms, limit):
+    n = len(docs)
+    avg_length = max(sum(len(tokens) for tokens in docs.values()) / max(n, 1), 1.0)
+    df = {term: sum(term in tokens for tokens in docs.values()) for term in terms}
+    hits = []
+    for doc_id, tokens in docs.items():
+        counts = Counter(tokens)
+        if not all(counts[term] for term in terms):
+            continue
+        score = 0.0
+        for term in terms:
+            idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+            tf = counts[term]
+            score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * len(tokens) / avg_length))
+        hits.append((score, doc_id))
+    return sorted(hits, reverse=True)[:limit]
+
+def matches(index, docs, query, limit=10):
+    terms = list(dict.fromkeys(tokenize(query)))
+    got = [(round(score, 9), doc_id) for score, _, doc_id in index.search(terms, limit)]
+    expected = [(round(score, 9), doc_id) for score, doc_id in brute_force(docs, terms, limit)]
+    return got == expected
+
+def run_search_test():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - SEARCH AFTER DELETE TEST")
+    print("========================================\n")
+    failures = []
+
+    # 9 "hello world" posts and one "hello there"; deleting 1-8 used to make
+    # "hello" more frequent than there are documents (negative idf)
+    index, docs = InvertedIndex(1), {}
+    for doc_id in range(1, 11):
+        text = "hello there" if doc_id == 10 else "hello world"
+        index.add(doc_id, text)
+        docs[doc_id] = tokenize(text)
+    index.add(11, "")  # empty documents are not counted
+    index.remove(11, "")
+    for doc_id in range(1, 9):
+        index.remove(doc_id, "hello world")
+        del docs[doc_id]
+    scores = [score for score, _, _ in index.search(["hello"], 10)]
+    if not scores or min(scores) <= 0 or not matches(index, docs, "hello"):
+        failures.append("hello after deletes")
+    if [doc_id for _, _, doc_id in index.search(["hello", "there"], 10)] != [10]:
+        failures.append("hello there after deletes")
+    if index.docs != len(docs):
+        failures.append("document count")
+
+    random.seed(42)
+    checked = 0
+    for _ in range(ROUNDS):
+        index, docs = InvertedIndex(1), {}
+        for doc_id in range(1, random.randint(2, 400)):
+            text = " ".join(random.choices(WORDS, k=random.randint(0, 6)))
+            index.add(doc_id, text)
+            if tokenize(text):
+                docs[doc_id] = tokenize(text)
+        for doc_id in random.sample(list(docs), random.randint(0, len(docs))):
+            index.remove(doc_id, " ".join(docs.pop(doc_id)))
+        for query in (random.choice(WORDS), " ".join(random.sample(WORDS, 2))):
+            checked += 1
+            if not matches(index, docs, query):
+                failures.append(f"random round {checked}")
+    print(f"  {checked} random queries compared against brute-force BM25")
+
+    print("\n========================================")
+    print(f"✗ Search mismatches: {failures[:10]}" if failures else "✓ Search matches BM25 after deletes")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    run_search_test()
@@ -0,0 +1,267 @@
+"""Time/size-segmented storage for posts and comments.
+
+Items go into the newest hot segment, a plain dict. A new segment starts
+after SEGMENT_SECONDS or SEGMENT_MAX_ITEMS items. `maintain()` runs
+periodically. It seals everything but the newest HOT_SEGMENTS segments:
+deleted items are dropped, the rest is serialized as JSON into one file per
+segment, and only compact arrays stay in memory (ids, file offsets and the
+mutable counters such as likeCount). A file is memory-mapped on its first
+read. Segments whose newest item is older than RETENTION_SECONDS are
+dropped entirely (0 keeps everything). Sealing is split into a snapshot
+(`unsealed()`), the JSON and file work (`write_cold()`, which storage.py runs
+on a storage thread) and the swap (`install()`), so only the swap has to
+block readers and writers.
+
+Ids grow with time, so a segment is an id range and a lookup is a bisect over
+segment start ids. Reads of cold items return fresh objects, so counters are
+changed through `add_to()` instead of by mutating the returned item.
+"""
+
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+SEGMENT_SECONDS = float(os.environ.get("SEGMENT_SECONDS", "3600"))
+SEGMENT_MAX_ITEMS = int(os.environ.get("SEGMENT_MAX_ITEMS", "50000"))
+HOT_SEGMENTS = max(int(os.environ.get("HOT_SEGMENTS", "2")), 1)
+RETENTION_SECONDS = float(os.environ.get("RETENTION_SECONDS", "0"))
+SEGMENT_DIR = os.environ.get("SEGMENT_DIR") or None  # default: system temp dir
+
+
+class HotSegment:
+    def __init__(self, start_id: int, now: float):
+        self.start_id = start_id
+        self.created = now
+        self.newest = now
+        self.items: Dict[int, BaseModel] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def full(self, now: float) -> bool:
+        return len(self.items) >= SEGMENT_MAX_ITEMS or now - self.created >= SEGMENT_SECONDS
+
+
+class ColdSegment:
+    def __init__(self, start_id: int, newest: float, path: str, ids: array,
+                 offsets: array, counters: Dict[str, array]):
+        self.start_id = start_id
+        self.newest = newest
+        self.path = path
+        self.ids = ids  # sorted item ids
+        self.offsets = offsets  # byte range of item i: offsets[i]:offsets[i + 1]
+        self.counters = counters  # field -> value per item
+        self.removed = set()
+        self.file = None
+        self.data = None
+        self.opening = threading.Lock()  # reads may run on storage threads (storage.py)
+
+    def __len__(self) -> int:
+        return len(self.ids) - len(self.removed)
+
+    def index(self, item_id: int) -> int:
+        i = bisect_left(self.ids, item_id)
+        if i < len(self.ids) and self.ids[i] == item_id and item_id not in self.removed:
+            return i
+        return -1
+
+    def load(self, i: int, model: Type[BaseModel]) -> BaseModel:
+        if self.data is None:
+            with self.opening:
+                if self.data is None:
+                    self.file = open(self.path, "rb")
+                    self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        item = model.model_validate_json(self.data[self.offsets[i]:self.offsets[i + 1]])
+        for name, values in self.counters.items():
+            setattr(item, name, values[i])
+        return item
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+        os.remove(self.path)
+
+
+class SegmentedStore:
+    """Dict-like store of models with increasing integer `id`s"""
+
+    def __init__(self, name: str, model: Type[BaseModel], counters: Tuple[str, ...] = ()):
+        self.name = name
+        self.model = model
+        self.counters = counters
+        self.segments: List = []  # oldest first; the hot segments are a suffix
+        self.starts: List[int] = []
+        self.count = 0
+        self.directory: Optional[str] = None
+        self.sealed = 0
+        self.expired = 0
+        self.cold_bytes = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, item_id: int) -> bool:
+        segment = self._segment(item_id)
+        if segment is None:
+            return False
+        if type(segment) is HotSegment:
+            return item_id in segment.items
+        return segment.index(item_id) >= 0
+
+    def __getitem__(self, item_id: int) -> BaseModel:
+        item = self.get(item_id)
+        if item is None:
+            raise KeyError(item_id)
+        return item
+
+    def _segment(self, item_id: int):
+        i = bisect_right(self.starts, item_id) - 1
+        return self.segments[i] if i >= 0 else None
+
+    def add(self, item: BaseModel):
+        now = time.time()
+        last = self.segments[-1] if self.segments else None
+        if type(last) is not HotSegment or last.full(now):
+            last = HotSegment(item.id, now)
+            self.segments.append(last)
+            self.starts.append(item.id)
+        last.items[item.id] = item
+        last.newest = now
+        self.count += 1
+
+    def get(self, item_id: int, default=None):
+        segment = self._segment(item_id)
+        if segment is None:
+            return default
+        if type(segment) is HotSegment:
+            return segment.items.get(item_id, default)
+        i = segment.index(item_id)
+        return segment.load(i, self.model) if i >= 0 else default
+
+    def pop(self, item_id: int, default=None):
+        item = self.get(item_id)
+        if item is None:
+            return default
+        segment = self._segment(item_id)
+        if type(segment) is HotSegment:
+            del segment.items[item_id]
+        else:
+            segment.removed.add(item_id)
+        self.count -= 1
+        return item
+
+    def add_to(self, item_id: int, field: str, delta: int) -> Optional[int]:
+        """Change a counter field; returns the new value or None if the item is gone"""
+        segment = self._segment(item_id)
+        if segment is None:
+            return None
+        if type(segment) is HotSegment:
+            item = segment.items.get(item_id)
+            if item is None:
+                return None
+            value = max(getattr(item, field) + delta, 0)
+            setattr(item, field, value)
+            return value
+        i = segment.index(item_id)
+        if i < 0:
+            return None
+        values = segment.counters[field]
+        values[i] = max(values[i] + delta, 0)
+        return values[i]
+
+    def values(self) -> Iterator[BaseModel]:
+        """All items, oldest first"""
+        for segment in list(self.segments):
+            yield from self._items(segment)
+
+    def _items(self, segment) -> Iterator[BaseModel]:
+        if type(segment) is HotSegment:
+            yield from list(segment.items.values())
+        else:
+            for i, item_id in enumerate(segment.ids):
+                if item_id not in segment.removed:
+                    yield segment.load(i, self.model)
+
+    def maintain(self, now: Optional[float] = None) -> List[BaseModel]:
+        """Seal old hot segments and drop expired ones; returns the dropped items"""
+        now = time.time() if now is None else now
+        for segment, items in self.unsealed():
+            self.install(segment, self.write_cold(segment, items))
+        expired: List[BaseModel] = []
+        if RETENTION_SECONDS > 0:
+            # Keep the newest segment: it still takes new items
+            while len(self.segments) > 1 and self.segments[0].newest < now - RETENTION_SECONDS:
+                segment = self.segments.pop(0)
+                self.starts.pop(0)
+                items = list(self._items(segment))
+                expired.extend(items)
+                self.count -= len(items)
+                self.expired += len(items)
+                if type(segment) is ColdSegment:
+                    self.cold_bytes -= segment.offsets[-1]
+                    segment.close()
+        return expired
+
+    def unsealed(self) -> List[Tuple[HotSegment, List[Tuple[int, BaseModel]]]]:
+        """The hot segments due for sealing, each with a snapshot of its items"""
+        hot = [segment for segment in self.segments if type(segment) is HotSegment]
+        return [(segment, list(segment.items.items())) for segment in hot[:-HOT_SEGMENTS]]
+
+    def write_cold(self, segment: HotSegment, items: List[Tuple[int, BaseModel]]) -> ColdSegment:
+        """Write a snapshot to its segment file; does not touch the store, so it may run on a thread.
+        Counters are taken by install(), they may change until then."""
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix=f"{self.name}-segments-", dir=SEGMENT_DIR)
+        ids, offsets = array("I"), array("Q", [0])
+        exclude = set(self.counters)
+        chunks = []
+        for item_id, item in items:
+            raw = item.model_dump_json(exclude=exclude).encode()
+            chunks.append(raw)
+            ids.append(item_id)
+            offsets.append(offsets[-1] + len(raw))
+        path = os.path.join(self.directory, f"{segment.start_id}.seg")
+        with open(path, "wb") as f:
+            f.write(b"".join(chunks) or b" ")  # mmap cannot map an empty file
+        return ColdSegment(segment.start_id, segment.newest, path, ids, offsets, {})
+
+    def install(self, segment: HotSegment, cold: ColdSegment):
+        """Replace the hot segment by its written copy, with the counters and deletions since the snapshot"""
+        i = next((i for i, current in enumerate(self.segments) if current is segment), None)
+        if i is None:  # expired meanwhile
+            cold.close()
+            return
+        current = [segment.items.get(item_id) for item_id in cold.ids]
+        for name in self.counters:
+            cold.counters[name] = array("I", [0 if item is None else getattr(item, name) for item in current])
+        cold.removed.update(item_id for item_id, item in zip(cold.ids, current) if item is None)
+        self.segments[i] = cold
+        self.sealed += 1
+        self.cold_bytes += cold.offsets[-1]
+
+    def stats(self) -> dict:
+        hot = [s for s in self.segments if type(s) is HotSegment]
+        return {
+            "items": self.count,
+            "segments": len(self.segments),
+            "hot_items": sum(len(s) for s in hot),
+            "cold_bytes": self.cold_bytes,
+            "sealed_segments": self.sealed,
+            "expired_items": self.expired,
+        }
+
+    def close(self):
+        for segment in self.segments:
+            if type(segment) is ColdSegment:
+                segment.close()
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,198 @@
+import asyncio
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+import aiohttp
+
+import graph
+from edges import EdgeStore
+from replication_test import start_server, wait_until
+
+# Local check of user sharding (sharding.py): starts NODES instances of
+# main.py as uvicorn processes sharing one SHARD_NODES ring and sends every
+# request to a random node. Checks that
+#   - users, posts and follows spread over the nodes,
+#   - each node forwards requests for ids it does not own,
+#   - cross-node reads (feed, followers, mutuals, suggestions, liked posts,
+#     lookups, listings) match what a single node would answer,
+#   - uniqueness of usernames and emails holds across nodes,
+# and reports the request rate for writes and for feeds.
+
+NODES = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+USERS = 60
+POSTS_PER_USER = 3
+FOLLOWS_PER_USER = 6
+LIKES = 300
+FIRST_PORT = 3401
+
+rng = random.Random(49)
+
+def node_env(nodes, url):
+    return {"SHARD_NODES": ",".join(nodes), "SHARD_SELF": url, "SHARD_TOKEN": "shard-test",
+            "PROCESS_POOL_WORKERS": "0", "ADMISSION_ENABLED": "0"}
+
+async def request(session, nodes, method, path, **kwargs):
+    async with session.request(method, rng.choice(nodes) + path, **kwargs) as resp:
+        return resp.status, await resp.json()
+
+async def gauges(session, node):
+    async with session.get(f"{node}/metrics") as resp:
+        text = await resp.text()
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            values[name] = float(value)
+    return values
+
+async def run_shard_test():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - SHARDING TEST")
+    print("========================================\n")
+
+    nodes = [f"http://127.0.0.1:{FIRST_PORT + i}" for i in range(NODES)]
+    processes = [start_server(FIRST_PORT + i, **node_env(nodes, url)) for i, url in enumerate(nodes)]
+    failures = []
+
+    def check(name, ok):
+        if not ok:
+            failures.append(name)
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            for node in nodes:
+                await wait_until(session, f"{node}/health", lambda status, _: status == 200)
+            print(f"{NODES} nodes on :{FIRST_PORT}-{FIRST_PORT + NODES - 1}, every request sent to a random node\n")
+
+            # Writes
+            start = time.perf_counter()
+            users = []
+            for i in range(USERS):
+                status, user = await request(session, nodes, "POST", "/api/users", json={
+                    "username": f"shard{i}", "email": f"shard{i}@example.com", "displayName": f"Shard {i}"})
+                check("create user", status == 201)
+                users.append(user["id"])
+            posts = {}  # post id -> (createdAt, author)
+            for user_id in users:
+                for i in range(POSTS_PER_USER):
+                    status, post = await request(session, nodes, "POST", "/api/posts",
+                                                 json={"userId": user_id, "content": f"Sharded post {i}"})
+                    check("create post", status == 201)
+                    posts[post["id"]] = (post["createdAt"], user_id)
+            followers = defaultdict(set)
+            following = defaultdict(set)
+            for user_id in users:
+                for other in rng.sample([u for u in users if u != user_id], FOLLOWS_PER_USER):
+                    status, _ = await request(session, nodes, "POST", "/api/follow",
+                                              json={"followerId": user_id, "followingId": other})
+                    check("follow", status == 201)
+                    followers[other].add(user_id)
+                    following[user_id].add(other)
+            unfollower = users[0]
+            unfollowed = next(iter(following[unfollower]))
+            status, _ = await request(session, nodes, "DELETE", "/api/follow",
+                                      json={"followerId": unfollower, "followingId": unfollowed})
+            check("unfollow", status == 200)
+            following[unfollower].discard(unfollowed)
+            followers[unfollowed].discard(unfollower)
+            liked = defaultdict(set)
+            for _ in range(LIKES):
+                user_id, post_id = rng.choice(users), rng.choice(list(posts))
+                if post_id in liked[user_id]:
+                    continue
+                status, _ = await request(session, nodes, "POST", "/api/likes",
+                                          json={"postId": post_id, "userId": user_id})
+                check("like", status == 201)
+                liked[user_id].add(post_id)
+            writes = USERS * (1 + POSTS_PER_USER + FOLLOWS_PER_USER) + 1 + sum(map(len, liked.values()))
+            write_rate = writes / (time.perf_counter() - start)
+
+            # Uniqueness across nodes
+            for node in nodes:
+                async with session.post(f"{node}/api/users", json={
+                        "username": "SHARD7", "email": "new@example.com", "displayName": "Dup"}) as resp:
+                    check("duplicate username", resp.status == 409)
+                async with session.post(f"{node}/api/users", json={
+                        "username": "fresh", "email": "shard7@example.com", "displayName": "Dup"}) as resp:
+                    check("duplicate email", resp.status == 409)
+                # A client cannot pose as a forwarding peer to skip routing
+                async with session.post(f"{node}/api/users", headers={"X-Shard-Forwarded": "1"}, json={
+                        "username": "shard7", "email": "other@example.com", "displayName": "Dup"}) as resp:
+                    check("forged forward", resp.status == 409)
+
+            # Cross-node reads against the expected answers
+            start = time.perf_counter()
+            for user_id in users:
+                authors = followers[user_id] | {user_id}
+                expected = sorted((key for key in posts.items() if key[1][1] in authors),
+                                  key=lambda item: (item[1][0], item[0]), reverse=True)[:20]
+                status, feed = await request(session, nodes, "GET", f"/api/users/{user_id}/feed")
+                check("feed", [post["id"] for post in feed] == [post_id for post_id, _ in expected])
+            feed_rate = USERS / (time.perf_counter() - start)
+
+            for user_id in users:
+                status, user = await request(session, nodes, "GET", f"/api/users/{user_id}")
+                check("counts", (user["followerCount"], user["followingCount"], user["postCount"])
+                      == (len(followers[user_id]), len(following[user_id]), POSTS_PER_USER))
+                status, page = await request(session, nodes, "GET", f"/api/users/{user_id}/followers")
+                check("followers", {u["id"] for u in page} == followers[user_id])
+                status, mutuals = await request(session, nodes, "GET", f"/api/users/{user_id}/mutuals")
+                check("mutuals", mutuals["count"] == len(followers[user_id] & following[user_id]))
+                status, page = await request(session, nodes, "GET", f"/api/users/{user_id}/likes?limit=100")
+                check("liked posts", [p["id"] for p in page["results"]] == sorted(liked[user_id]))
+
+            edges = EdgeStore()
+            for user_id, followed in following.items():
+                for other in followed:
+                    edges.add(user_id, other)
+            for user_id in users[:10]:
+                ranked, _ = graph.suggestions(edges, user_id, 10)
+                status, result = await request(session, nodes, "GET", f"/api/users/{user_id}/suggestions")
+                check("suggestions", [(s["user"]["id"], s["sharedConnections"]) for s in result["results"]] == ranked)
+
+            status, everyone = await request(session, nodes, "GET", "/api/users")
+            check("all users", [u["id"] for u in everyone] == sorted(users))
+            status, found = await request(session, nodes, "GET", "/api/users/lookup?email=SHARD42@example.com")
+            check("lookup", status == 200 and found["id"] == users[42])
+            status, found = await request(session, nodes, "GET", "/api/users/search?prefix=shard1&limit=20")
+            check("user search", [u["username"] for u in found] == sorted(f"shard{i}" for i in range(USERS)
+                                                                          if f"shard{i}".startswith("shard1")))
+            status, degrees = await request(session, nodes, "GET", "/api/graph/degrees")
+            check("degrees", degrees["users"] == USERS and degrees["edges"] == sum(map(len, followers.values())))
+            found, cursor = [], ""
+            while cursor is not None:
+                status, page = await request(session, nodes, "GET", f"/api/search?q=sharded&limit=25{cursor}")
+                found += [hit["post"]["id"] for hit in page["results"]]
+                cursor = page["nextCursor"] and f"&cursor={page['nextCursor']}"
+            check("search pages", sorted(found) == sorted(posts))
+
+            per_node = [await gauges(session, node) for node in nodes]
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(10)
+
+    print("========================================")
+    print("            DATA PER NODE")
+    print("========================================")
+    print(f"{'Node':<24} {'users':>6} {'posts':>6} {'follows':>8} {'forwarded':>10} {'peer calls':>11}")
+    for node, values in zip(nodes, per_node):
+        print(f"{node:<24} {values['db_users']:>6.0f} {values['db_posts']:>6.0f} {values['db_follow_edges']:>8.0f} "
+              f"{values['sharding_forwarded']:>10.0f} {values['sharding_peer_calls']:>11.0f}")
+    print("========================================")
+    print(f"Writes (random node):            {write_rate:.0f} req/s")
+    print(f"Feeds (random node, scattered):  {feed_rate:.0f} req/s")
+    spread = all(values["db_users"] > 0 for values in per_node)
+    print(f"Users on every node:             {'yes' if spread else 'NO'}")
+    print("========================================")
+    if failures or not spread:
+        print(f"✗ Sharding check failed: {dict(Counter(failures))}")
+    else:
+        print("✓ Every node answers for the whole cluster")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    asyncio.run(run_shard_test())
@@ -0,0 +1,378 @@
+"""User sharding over several Python API instances with consistent hashing.
+
+Every node gets the same SHARD_NODES list (base URLs) and its own
+SHARD_SELF. The nodes are placed on a hash ring with SHARD_VNODES points
+each (blake2b of "<url>#<i>"); an id belongs to the first point at or after
+the hash of its decimal string. A node only hands out ids the ring assigns
+to it (Database.owns), so every id routes to the node holding its data with
+no id coordination:
+
+- a user and their posts live on the user's node: POST /api/posts goes to
+  the author's node and gets a post id that node owns,
+- comments and likes live on the post's node,
+- a follow is kept as two halves, the followers half on the followed user's
+  node and the following half on the follower's node,
+- POST /api/users goes to the node owning "username:<name>", so creating
+  the same name twice is decided on one node.
+
+ShardMiddleware forwards a request to the owner of the id in its path
+(/api/users/<id>/..., /api/posts/<id>/...) or body, and answers everything
+else locally. Reads that span nodes are scatter-gather calls on ShardMap:
+user listings, lookups and uniqueness checks, search, trending and the
+leaderboard ask every node and merge; the feed asks each node holding
+followed authors for their newest posts; followers, likers, mutuals and
+suggestions are computed from the owner's edges and hydrated from the users'
+nodes. Nodes call each other on POST /internal/shard/call. SHARD_TOKEN is
+required: it guards that endpoint and marks forwarded requests, which a
+client could otherwise mark itself to skip routing.
+
+Memory backend, one worker per node. The node list is static: adding a node
+moves ids on the ring and needs the data moved by hand (no rebalancing).
+Search ranks with each node's own term statistics, and uniqueness checks
+across nodes are not atomic with the create.
+"""
+
+import asyncio
+import bisect
+import functools
+import hashlib
+import itertools
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from pydantic import TypeAdapter
+
+import graph
+from edges import EdgeStore
+from models import (DegreeBucket, DegreeDistribution, Mutuals, Post, PostPage, SearchResults, Suggestion,
+                    Suggestions, TrendingPost, User, UserPage)
+from replication import _http, proxy, read_body
+from search import SearchIndex, decode_cursor, encode_cursor
+from user_index import normalize
+
+NODES = [url.strip().rstrip("/") for url in os.environ.get("SHARD_NODES", "").split(",") if url.strip()]
+SELF = os.environ.get("SHARD_SELF", "").rstrip("/") or None
+TOKEN = os.environ.get("SHARD_TOKEN")  # shared secret of the nodes, required with SHARD_NODES
+VNODES = int(os.environ.get("SHARD_VNODES", "64"))
+CALL_TIMEOUT = float(os.environ.get("SHARD_CALL_TIMEOUT", "10"))
+THREADS = 32  # calls to peers and forwarded requests
+
+# Storage methods peers may call, with the adapter for their result
+PEER_METHODS: Dict[str, TypeAdapter] = {
+    "get_users": TypeAdapter(List[User]),
+    "get_all_users": TypeAdapter(List[User]),
+    "get_user_by_username": TypeAdapter(Optional[User]),
+    "get_user_by_email": TypeAdapter(Optional[User]),
+    "search_users": TypeAdapter(List[User]),
+    "user_conflict": TypeAdapter(Optional[str]),
+    "newest_posts": TypeAdapter(List[Post]),
+    "following_ids": TypeAdapter(Dict[int, List[int]]),
+    "add_following": TypeAdapter(bool),
+    "remove_following": TypeAdapter(bool),
+    "get_liked_posts": TypeAdapter(PostPage),
+    "degree_distribution": TypeAdapter(DegreeDistribution),
+    "search": TypeAdapter(SearchResults),
+    "trending": TypeAdapter(List[TrendingPost]),
+    "most_liked": TypeAdapter(List[Post]),
+}
+
+# Requests routed by an id in the path, or by a field of the JSON body
+PATH_KEYS = re.compile(r"^/api/(?:users|posts)/(\d+)(?:/|$)")
+BODY_KEYS = {
+    ("POST", "/api/posts"): "userId",
+    ("POST", "/api/comments"): "postId",
+    ("POST", "/api/likes"): "postId",
+    ("DELETE", "/api/likes"): "postId",
+    ("POST", "/api/follow"): "followingId",
+    ("DELETE", "/api/follow"): "followingId",
+}
+FORWARDED_HEADER = b"x-shard-forwarded"
+FORWARDED_VALUE = (TOKEN or "").encode()
+
+
+class ShardError(Exception):
+    """A peer was unreachable or failed a call; answered with 502"""
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes: List[str], vnodes: int = VNODES):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def node(self, key: str) -> str:
+        return self.nodes[bisect.bisect_left(self.hashes, _hash(key)) % len(self.hashes)]
+
+
+class ShardMap:
+    """This node's view of the cluster; the cross-node reads and writes the routes need"""
+
+    def __init__(self, nodes: List[str], self_url: str, storage, vnodes: int = VNODES):
+        if self_url not in nodes:
+            raise ValueError(f"SHARD_SELF {self_url!r} is not in SHARD_NODES")
+        if not TOKEN:
+            raise ValueError("SHARD_NODES needs SHARD_TOKEN (forwarded requests and peer calls are marked with it)")
+        self.nodes = nodes
+        self.self_url = self_url
+        self.ring = HashRing(nodes, vnodes)
+        self.storage = storage
+        self.headers = {"Content-Type": "application/json", "X-Shard-Token": TOKEN}
+        self.executor = ThreadPoolExecutor(THREADS, thread_name_prefix="shard")
+        self.calls: Counter = Counter()
+        self.errors = 0
+        self.forwarded = 0
+
+    def _call(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # Placement
+
+    def owner(self, item_id: int) -> str:
+        return self.ring.node(str(item_id))
+
+    def owns(self, item_id: int) -> bool:
+        return self.owner(item_id) == self.self_url
+
+    def owner_of_username(self, username: str) -> str:
+        return self.ring.node(f"username:{normalize(username)}")
+
+    # Calls between nodes
+
+    async def call(self, node: str, method: str, *args):
+        """`method` of the storage on `node`; this node's own storage is called directly"""
+        if node == self.self_url:
+            return await getattr(self.storage, method)(*args)
+        self.calls[method] += 1
+        body = json.dumps({"method": method, "args": args}).encode()
+        try:
+            status, _, data = await self._call(_http, "POST", f"{node}/internal/shard/call", body, self.headers,
+                                               CALL_TIMEOUT)
+        except OSError as exc:
+            self.errors += 1
+            raise ShardError(f"Shard {node} unreachable: {exc}") from exc
+        if status != 200:
+            self.errors += 1
+            raise ShardError(f"Shard {node} answered {status} to {method}")
+        return PEER_METHODS[method].validate_json(data)
+
+    async def serve(self, method: str, args: list) -> Optional[bytes]:
+        """A peer's call() here; None for methods peers may not call"""
+        adapter = PEER_METHODS.get(method)
+        if adapter is None:
+            return None
+        return adapter.dump_json(await getattr(self.storage, method)(*args))
+
+    async def scatter(self, method: str, *args) -> list:
+        """`method` on every node, results in SHARD_NODES order"""
+        return await asyncio.gather(*(self.call(node, method, *args) for node in self.nodes))
+
+    async def by_owner(self, method: str, ids: List[int], *args) -> list:
+        """`method(ids, *args)` on each node, with the ids that node owns"""
+        groups: Dict[str, List[int]] = defaultdict(list)
+        for item_id in ids:
+            groups[self.owner(item_id)].append(item_id)
+        return await asyncio.gather(*(self.call(node, method, group, *args) for node, group in groups.items()))
+
+    async def users(self, user_ids: List[int]) -> List[User]:
+        """The existing users among `user_ids`, in order, from their nodes"""
+        found = {user.id: user for users in await self.by_owner("get_users", user_ids) for user in users}
+        return [found[user_id] for user_id in user_ids if user_id in found]
+
+    # Reads over all nodes, same signatures as the storage's
+
+    async def get_all_users(self) -> List[User]:
+        return sorted(itertools.chain.from_iterable(await self.scatter("get_all_users")), key=lambda u: u.id)
+
+    async def get_user_by_username(self, username: str) -> Optional[User]:
+        return next(filter(None, await self.scatter("get_user_by_username", username)), None)
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        return next(filter(None, await self.scatter("get_user_by_email", email)), None)
+
+    async def search_users(self, prefix: str, limit: int = 10) -> List[User]:
+        users = itertools.chain.from_iterable(await self.scatter("search_users", prefix, limit))
+        return sorted(users, key=lambda user: normalize(user.username))[:limit]
+
+    async def user_conflict(self, username: Optional[str], email: Optional[str],
+                            user_id: Optional[int] = None) -> Optional[str]:
+        conflicts = await self.scatter("user_conflict", username, email, user_id)
+        return "username" if "username" in conflicts else "email" if "email" in conflicts else None
+
+    async def get_liked_posts(self, user_id: int, limit: int, after: int = 0) -> PostPage:
+        # Likes live with the posts: every node's first page, merged by post id
+        pages = await self.scatter("get_liked_posts", user_id, limit, after)
+        posts = sorted((post for page in pages for post in page.results), key=lambda post: post.id)[:limit]
+        return PostPage(results=posts, nextCursor=str(posts[-1].id) if len(posts) == limit else None)
+
+    async def degree_distribution(self) -> DegreeDistribution:
+        parts = await self.scatter("degree_distribution")
+
+        def merge(buckets) -> List[DegreeBucket]:
+            users: Counter = Counter()
+            for bucket in buckets:
+                users[bucket.min, bucket.max] += bucket.users
+            return [DegreeBucket(min=lo, max=hi, users=n) for (lo, hi), n in sorted(users.items())]
+        return DegreeDistribution(users=sum(part.users for part in parts), edges=sum(part.edges for part in parts),
+                                  followers=merge(b for part in parts for b in part.followers),
+                                  following=merge(b for part in parts for b in part.following))
+
+    async def search(self, query: str, kinds, limit: int, cursor: Optional[str] = None) -> SearchResults:
+        if cursor:
+            decode_cursor(cursor)  # a malformed cursor is a 400 here, not a failed peer call
+
+        def key(hit):
+            return (hit.score, SearchIndex.POST, hit.post.id) if hit.type == "post" \
+                else (hit.score, SearchIndex.COMMENT, hit.comment.id)
+        pages = await self.scatter("search", query, list(kinds), limit, cursor)
+        hits = sorted((hit for page in pages for hit in page.results), key=key, reverse=True)
+        more = len(hits) > limit or any(page.nextCursor for page in pages)
+        hits = hits[:limit]
+        return SearchResults(results=hits, nextCursor=encode_cursor(key(hits[-1])) if more and hits else None)
+
+    async def trending(self, window: str, limit: int) -> List[TrendingPost]:
+        posts = itertools.chain.from_iterable(await self.scatter("trending", window, limit))
+        return sorted(posts, key=lambda item: item.score, reverse=True)[:limit]
+
+    async def most_liked(self, limit: int) -> List[Post]:
+        posts = itertools.chain.from_iterable(await self.scatter("most_liked", limit))
+        return sorted(posts, key=lambda post: post.likeCount, reverse=True)[:limit]
+
+    # Reads on the owner's edges, users hydrated from their nodes
+
+    async def get_feed(self, user_id: int, limit: int = 20) -> List[Post]:
+        authors = await self.storage.follower_ids(user_id)
+        authors.append(user_id)
+        # Ids only grow per node: order the merged posts by time
+        posts = itertools.chain.from_iterable(await self.by_owner("newest_posts", authors, limit))
+        return sorted(posts, key=lambda post: (post.createdAt, post.id), reverse=True)[:limit]
+
+    async def get_followers(self, user_id: int) -> List[User]:
+        return await self.users(await self.storage.follower_ids(user_id))
+
+    async def get_mutuals(self, user_id: int, limit: int) -> Mutuals:
+        ids, truncated = await self.storage.mutual_ids(user_id)
+        return Mutuals(count=len(ids), truncated=truncated, results=await self.users(ids[:limit]))
+
+    async def get_post_likers(self, post_id: int, limit: int, after: int = 0) -> UserPage:
+        user_ids = await self.storage.liker_ids(post_id, limit, after)
+        return UserPage(results=await self.users(user_ids),
+                        nextCursor=str(user_ids[-1]) if len(user_ids) == limit else None)
+
+    async def get_suggestions(self, user_id: int, limit: int) -> Suggestions:
+        # The friends' following lists, fetched from their nodes, capped at
+        # the share of the work graph.suggestions would visit anyway
+        friends = (await self.storage.following_ids([user_id], graph.MAX_WORK))[user_id]
+        share = max(16, graph.MAX_WORK // max(len(friends), 1))
+        following = EdgeStore()
+        for friend in friends:
+            following.add(user_id, friend)
+        for lists in await self.by_owner("following_ids", friends, share):
+            for friend, members in lists.items():
+                for member in members:
+                    following.add(friend, member)
+        ranked, truncated = graph.suggestions(following, user_id, limit)
+        users = {user.id: user for user in await self.users([uid for uid, _ in ranked])}
+        return Suggestions(truncated=truncated, results=[
+            Suggestion(user=users[uid], sharedConnections=shared) for uid, shared in ranked if uid in users])
+
+    # Follows: runs on the followed user's node, the other half goes to the follower's
+
+    async def follow(self, follower_id: int, following_id: int) -> bool:
+        if follower_id == following_id or not await self.storage.add_follower(following_id, follower_id):
+            return False
+        try:
+            await self.call(self.owner(follower_id), "add_following", follower_id, following_id)
+        except ShardError:
+            await self.storage.remove_follower(following_id, follower_id)
+            raise
+        return True
+
+    async def unfollow(self, follower_id: int, following_id: int) -> bool:
+        if not await self.storage.remove_follower(following_id, follower_id):
+            return False
+        try:
+            await self.call(self.owner(follower_id), "remove_following", follower_id, following_id)
+        except ShardError:
+            await self.storage.add_follower(following_id, follower_id)
+            raise
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "nodes": len(self.nodes),
+            "forwarded": self.forwarded,
+            "peer_calls": sum(self.calls.values()),
+            "peer_errors": self.errors,
+        }
+
+
+class ShardMiddleware:
+    """Forwards requests for ids this node does not own to their owner"""
+
+    def __init__(self, app, shards: ShardMap):
+        self.app = app
+        self.shards = shards
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/") or self._forwarded(scope):
+            await self.app(scope, receive, send)
+            return
+
+        owner, body = None, None
+        match = PATH_KEYS.match(scope["path"])
+        if match:
+            owner = self.shards.owner(int(match.group(1)))
+        else:
+            route = (scope["method"], scope["path"])
+            if route in BODY_KEYS or route == ("POST", "/api/users"):
+                body = await read_body(receive)
+                owner = self._body_owner(route, body)
+
+        if owner is None or owner == self.shards.self_url:
+            if body is not None:
+                receive = self._replay(body, receive)
+            await self.app(scope, receive, send)
+            return
+        if body is None:
+            body = await read_body(receive)
+        self.shards.forwarded += 1
+        await proxy(owner, scope, body, send, self.shards._call, {FORWARDED_HEADER.decode(): TOKEN},
+                    unreachable=f"Shard {owner} unreachable")
+
+    @staticmethod
+    def _forwarded(scope) -> bool:
+        """Already sent here by the owner-to-be: answer locally, never forward twice"""
+        return any(name == FORWARDED_HEADER and value == FORWARDED_VALUE for name, value in scope["headers"])
+
+    def _body_owner(self, route, body: bytes) -> Optional[str]:
+        """None when the body is not what the route expects: the route answers with its validation error"""
+        try:
+            payload = json.loads(body)
+            if route == ("POST", "/api/users"):
+                return self.shards.owner_of_username(payload["username"])
+            return self.shards.owner(int(payload[BODY_KEYS[route]]))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return None
+
+    @staticmethod
+    def _replay(body: bytes, receive):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return replay
@@ -0,0 +1,213 @@
+"""Storage interface the routes are written against.
+
+Every backend implements `Storage`. Request-path methods are coroutines, so
+a backend decides per method whether to answer inline, on a thread pool or on
+its own I/O threads, and a slow query never stalls the event loop. The
+housekeeping methods called from background tasks and /metrics
+(record_view, flush_views, close, stats) stay synchronous and must be cheap.
+
+Backends: `MemoryStorage` below (wraps `main.Database`) and
+`storage_sqlite.SQLiteDatabase`.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Protocol, Tuple
+
+from models import (Comment, DegreeDistribution, Mutuals, Post, PostPage, SearchResults, Suggestions,
+                    TrendingPost, User, UserPage)
+
+OFFLOAD_THREADS = int(os.environ.get("STORAGE_OFFLOAD_THREADS", "4"))
+
+
+class Storage(Protocol):
+    # Users
+    async def create_user(self, username: str, email: str, display_name: str) -> User: ...
+    async def user_conflict(self, username: Optional[str], email: Optional[str],
+                            user_id: Optional[int] = None) -> Optional[str]: ...
+    async def get_user(self, user_id: int) -> Optional[User]: ...
+    async def get_user_by_username(self, username: str) -> Optional[User]: ...
+    async def get_user_by_email(self, email: str) -> Optional[User]: ...
+    async def search_users(self, prefix: str, limit: int = 10) -> List[User]: ...
+    async def update_user(self, user_id: int, updates: dict) -> Optional[User]: ...
+    async def get_all_users(self) -> List[User]: ...
+
+    # Posts
+    async def create_post(self, user_id: int, content: str) -> Post: ...
+    async def get_post(self, post_id: int) -> Optional[Post]: ...
+    async def delete_post(self, post_id: int) -> bool: ...
+    async def get_posts_by_user(self, user_id: int) -> List[Post]: ...
+    async def get_feed(self, user_id: int, limit: int = 20) -> List[Post]: ...
+
+    # Comments
+    async def add_comment(self, post_id: int, user_id: int, text: str) -> Comment: ...
+    async def get_comments(self, post_id: int) -> List[Comment]: ...
+
+    # Likes
+    async def like_post(self, post_id: int, user_id: int) -> bool: ...
+    async def unlike_post(self, post_id: int, user_id: int) -> bool: ...
+    async def is_post_liked(self, post_id: int, user_id: int) -> bool: ...
+    async def get_post_likers(self, post_id: int, limit: int, after: int = 0) -> UserPage: ...
+    async def get_liked_posts(self, user_id: int, limit: int, after: int = 0) -> PostPage: ...
+
+    # Follows
+    async def follow(self, follower_id: int, following_id: int) -> bool: ...
+    async def unfollow(self, follower_id: int, following_id: int) -> bool: ...
+    async def get_followers(self, user_id: int) -> List[User]: ...
+    async def get_mutuals(self, user_id: int, limit: int) -> Mutuals: ...
+    async def get_suggestions(self, user_id: int, limit: int) -> Suggestions: ...
+    async def degree_distribution(self) -> DegreeDistribution: ...
+
+    # Search and rankings
+    async def search(self, query: str, kinds: Tuple[int, ...], limit: int,
+                     cursor: Optional[str] = None) -> SearchResults: ...
+    async def trending(self, window: str, limit: int) -> List[TrendingPost]: ...
+    async def most_liked(self, limit: int) -> List[Post]: ...
+
+    # Housekeeping
+    async def maintain(self) -> None: ...
+    def record_view(self, post_id: int) -> None: ...
+    def flush_views(self) -> int: ...
+    def close(self) -> None: ...
+    def stats(self) -> dict: ...
+
+
+class MemoryStorage:
+    """`Storage` over the synchronous in-memory Database
+
+    Point lookups and writes are microseconds and run inline. Methods that
+    scan (feeds, comment lists, graph queries, search) run on a pool of
+    STORAGE_OFFLOAD_THREADS threads; 0 runs everything inline. The Database
+    is not thread-safe, so writes wait until no offloaded read is running,
+    and new offloaded reads wait while a write is waiting. A write itself
+    never awaits once it starts, so inline calls on the loop cannot interleave.
+    """
+
+    OFFLOAD = {"get_all_users", "get_posts_by_user", "get_feed", "get_comments", "get_followers",
+               "get_mutuals", "get_suggestions", "degree_distribution", "search",
+               "get_users", "follower_ids", "mutual_ids", "following_ids", "newest_posts"}
+    WRITES = {"create_user", "update_user", "create_post", "delete_post", "add_comment", "like_post",
+              "unlike_post", "follow", "unfollow", "add_follower", "remove_follower", "add_following",
+              "remove_following"}
+    SYNC = {"close", "stats"}
+
+    def __init__(self, database, threads: int = OFFLOAD_THREADS):
+        self.database = database
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix="storage") if threads else None
+        self.readers = 0  # offloaded reads in flight
+        self.writers = 0  # writes waiting for them
+        self.waiting_writers: List[asyncio.Future] = []
+        self.waiting_readers: List[asyncio.Future] = []
+        self.offloaded = 0
+        self.write_waits = 0
+        self.view_flush: Optional[asyncio.Future] = None
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.database, name)
+        if name in self.SYNC or not callable(attr):
+            return attr
+        if name in self.OFFLOAD and self.pool is not None:
+            method = functools.partial(self._offload, attr)
+        elif name in self.WRITES and self.pool is not None:
+            method = functools.partial(self._write, attr)
+        else:
+            method = functools.partial(self._inline, attr)
+        setattr(self, name, method)  # resolved once per name
+        return method
+
+    @staticmethod
+    async def _inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    @staticmethod
+    async def _wait(waiters: List[asyncio.Future]):
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        await future
+
+    @staticmethod
+    def _wake(waiters: List[asyncio.Future]):
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+        waiters.clear()
+
+    async def _offload(self, fn, *args, **kwargs):
+        while self.writers:
+            await self._wait(self.waiting_readers)
+        # Copy the context so db spans inside the thread land in the request's trace
+        context = contextvars.copy_context()
+        future = self.pool.submit(context.run, fn, *args, **kwargs)
+        self.readers += 1
+        self.offloaded += 1
+        loop = asyncio.get_running_loop()
+        # Counted until the thread is done, even if the awaiting request is cancelled
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._read_done))
+        return await asyncio.wrap_future(future)
+
+    def _read_done(self):
+        self.readers -= 1
+        if not self.readers:
+            self._wake(self.waiting_writers)
+
+    async def _write(self, fn, *args, **kwargs):
+        if self.readers:
+            self.write_waits += 1
+            self.writers += 1
+            try:
+                while self.readers:
+                    await self._wait(self.waiting_writers)
+            finally:
+                self.writers -= 1
+                if not self.writers:
+                    self._wake(self.waiting_readers)
+        return fn(*args, **kwargs)
+
+    def record_view(self, post_id: int, count: int = 1):
+        if self.database.record_view(post_id, count):
+            self.flush_views()
+
+    def flush_views(self) -> int:
+        """Apply the buffered views (counters, rankings) now, or under the write gate while reads are offloaded"""
+        if not self.readers:
+            return self.database.flush_views()
+        if self.view_flush is None or self.view_flush.done():
+            self.view_flush = asyncio.ensure_future(self._write(self.database.flush_views))
+        return 0
+
+    async def maintain(self):
+        """Seal old segments (segments.py) on a storage thread; only their swap and expiry take the write gate"""
+        if self.pool is not None:
+            loop = asyncio.get_running_loop()
+            for store in (self.database.posts, self.database.comments):
+                for segment, items in store.unsealed():
+                    cold = await loop.run_in_executor(self.pool, store.write_cold, segment, items)
+                    await self._write(store.install, segment, cold)
+        return await self._write(self.database.maintain)
+
+    async def exclusive(self, fn, *args):
+        """Run fn on the loop while no offloaded read is in flight (e.g. to fork)"""
+        return await self._write(fn, *args)
+
+    def reset(self, database):
+        """Serve from another database (a replica reloading its snapshot); call through exclusive()"""
+        old, self.database = self.database, database
+        for name in [name for name, value in vars(self).items() if isinstance(value, functools.partial)]:
+            delattr(self, name)  # resolved against the old database
+        return old
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+        self.database.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.database.stats(),
+            "offloaded_reads": self.offloaded,
+            "offloaded_in_flight": self.readers,
+            "write_waits": self.write_waits,
+        }
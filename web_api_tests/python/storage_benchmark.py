@@ -0,0 +1,106 @@
+import asyncio
+import functools
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from main import Database
+from storage import MemoryStorage
+from storage_sqlite import SQLiteDatabase
+
+# In-process comparison of the storage backends under the same concurrent
+# workload: CONCURRENCY tasks issue stress_test.py-style writes (posts,
+# comments, likes, follows), then reads (post, feed, comments). The SQLite
+# backend runs on a file in the temp dir, so the numbers include its disk I/O.
+
+OPERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+USERS = 1000
+CONCURRENCY = 64
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+async def run_phase(operations):
+    """Runs the operations on CONCURRENCY tasks; returns (ops/sec, p50 ms, p99 ms)"""
+    timings = []
+    queue = iter(operations)
+
+    async def worker():
+        for operation in queue:
+            start = time.perf_counter()
+            await operation()
+            timings.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    return (len(timings) / elapsed, *percentiles(timings))
+
+def write_operations(db, count):
+    for i in range(count):
+        user_id = random.randint(1, USERS)
+        kind = i % 4
+        if kind == 0:
+            yield functools.partial(db.create_post, user_id, f"Stress post {i} about storage engines")
+        elif kind == 1:
+            yield functools.partial(db.add_comment, random.randint(1, i // 4 + 1), user_id, f"Comment {i}")
+        elif kind == 2:
+            yield functools.partial(db.like_post, random.randint(1, i // 4 + 1), user_id)
+        else:
+            yield functools.partial(db.follow, user_id, random.randint(1, USERS))
+
+def read_operations(db, count, posts):
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            yield functools.partial(db.get_post, random.randint(1, posts))
+        elif kind == 1:
+            yield functools.partial(db.get_feed, random.randint(1, USERS), 20)
+        else:
+            yield functools.partial(db.get_comments, random.randint(1, posts))
+
+async def benchmark(name, db):
+    random.seed(42)
+    for i in range(USERS):
+        await db.create_user(f"user{i}", f"user{i}@example.com", f"User {i}")
+    writes = await run_phase(write_operations(db, OPERATIONS))
+    reads = await run_phase(read_operations(db, OPERATIONS, db.stats()["posts"]))
+    return name, writes, reads
+
+async def run_storage_benchmark():
+    print("\n========================================")
+    print("  PYTHON/FASTAPI - STORAGE BENCHMARK")
+    print("========================================\n")
+    print(f"{OPERATIONS} writes, then {OPERATIONS} reads, {CONCURRENCY} concurrent tasks, {USERS} users\n")
+
+    directory = tempfile.mkdtemp(prefix="storage-benchmark-")
+    path = os.path.join(directory, "social.db")
+    results = [await benchmark("memory", MemoryStorage(Database()))]
+    sqlite = SQLiteDatabase(path)
+    try:
+        results.append(await benchmark("sqlite", sqlite))
+        stats = sqlite.stats()
+    finally:
+        sqlite.close()
+    size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+    shutil.rmtree(directory, ignore_errors=True)
+
+    print("========================================")
+    print("   THROUGHPUT (ops/sec) / LATENCY (ms)")
+    print("========================================")
+    print(f"{'Backend':<8} {'writes/s':>9} {'p50':>7} {'p99':>7} {'reads/s':>9} {'p50':>7} {'p99':>7}")
+    for name, (write_rate, write_p50, write_p99), (read_rate, read_p50, read_p99) in results:
+        print(f"{name:<8} {write_rate:>9.0f} {write_p50:>7.2f} {write_p99:>7.2f} "
+              f"{read_rate:>9.0f} {read_p50:>7.2f} {read_p99:>7.2f}")
+    print("========================================")
+    print(f"SQLite: {stats['writes']} writes in {stats['write_batches']} transactions "
+          f"({stats['writes'] / max(stats['write_batches'], 1):.1f} per commit), {size / 2**20:.1f} MB on disk")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    asyncio.run(run_storage_benchmark())
@@ -0,0 +1,708 @@
+"""Durable storage on embedded SQLite (STORAGE_BACKEND=sqlite).
+
+- WAL mode, so readers never block the writer or each other.
+- All writes go through one writer thread. It takes everything queued (up to
+  SQLITE_WRITE_BATCH writes) and runs it as one transaction, each write in
+  its own savepoint so a failing write does not take the others down.
+  Callers are answered after COMMIT: a response means the write is on disk.
+- Reads run on a pool of SQLITE_READERS threads with one connection each.
+- All SQL is constant text, so every connection's statement cache
+  (`cached_statements`) prepares each statement once.
+- Search uses FTS5 with bm25. Trending scores stay in memory (rankings.py)
+  as in the in-memory backend and start empty after a restart.
+
+Implements `storage.Storage`: a request waiting for SQLite never blocks the
+event loop.
+"""
+
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import graph
+from graph import DegreeHistogram
+from models import (Comment, ConflictError, DegreeBucket, DegreeDistribution, Mutuals, Post, PostPage,
+                    SearchHit, SearchResults, Suggestion, Suggestions, TrendingPost, User, UserPage)
+from rankings import Rankings
+from search import SearchIndex, decode_cursor, encode_cursor, tokenize
+from user_index import normalize
+
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "social.db")
+READERS = int(os.environ.get("SQLITE_READERS", "4"))
+WRITE_BATCH = int(os.environ.get("SQLITE_WRITE_BATCH", "256"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    email TEXT NOT NULL,
+    username_key TEXT NOT NULL UNIQUE,
+    email_key TEXT NOT NULL UNIQUE,
+    display_name TEXT NOT NULL,
+    bio TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    post_count INTEGER NOT NULL DEFAULT 0,
+    follower_count INTEGER NOT NULL DEFAULT 0,
+    following_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    like_count INTEGER NOT NULL DEFAULT 0,
+    comment_count INTEGER NOT NULL DEFAULT 0,
+    views INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS posts_by_user ON posts (user_id, id);
+CREATE INDEX IF NOT EXISTS posts_by_likes ON posts (like_count, id);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    like_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS comments_by_post ON comments (post_id, id);
+CREATE TABLE IF NOT EXISTS likes (
+    post_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (post_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS likes_by_user ON likes (user_id, post_id);
+CREATE TABLE IF NOT EXISTS follows (
+    following_id INTEGER NOT NULL,
+    follower_id INTEGER NOT NULL,
+    PRIMARY KEY (following_id, follower_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS follows_by_follower ON follows (follower_id, following_id);
+-- Contentless: rows are removed with the 'delete' command and their original text
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5 (content, content='');
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5 (text, content='');
+"""
+
+USER_COLUMNS = ("id, username, email, display_name, bio, created_at, updated_at, "
+                "post_count, follower_count, following_count")
+POST_COLUMNS = "id, user_id, content, created_at, updated_at, like_count, comment_count, views"
+COMMENT_COLUMNS = "id, post_id, user_id, text, created_at, like_count"
+
+# Profile fields PUT /api/users/{id} may change, model name -> column
+USER_UPDATES = {"username": "username", "email": "email", "displayName": "display_name", "bio": "bio"}
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; WAL keeps it consistent
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def _user(row) -> User:
+    return User(id=row[0], username=row[1], email=row[2], displayName=row[3], bio=row[4],
+                createdAt=row[5], updatedAt=row[6], postCount=row[7], followerCount=row[8],
+                followingCount=row[9])
+
+
+def _post(row) -> Post:
+    return Post(id=row[0], userId=row[1], content=row[2], createdAt=row[3], updatedAt=row[4],
+                likeCount=row[5], commentCount=row[6], views=row[7])
+
+
+def _comment(row) -> Comment:
+    return Comment(id=row[0], postId=row[1], userId=row[2], text=row[3], createdAt=row[4], likeCount=row[5])
+
+
+def _conflict(exc: sqlite3.IntegrityError) -> Exception:
+    message = str(exc)
+    if "username_key" in message:
+        return ConflictError("username")
+    if "email_key" in message:
+        return ConflictError("email")
+    return exc
+
+
+class Writer(threading.Thread):
+    """Single writer: batches queued writes into one transaction"""
+
+    def __init__(self, path: str, batch: int = WRITE_BATCH):
+        super().__init__(name="sqlite-writer", daemon=True)
+        self.path = path
+        self.batch = batch
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Run fn(conn, *args) in the next transaction"""
+        future: Future = Future()
+        self.queue.put((fn, args, future))
+        return future
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        conn = connect(self.path)
+        running = True
+        while running:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list):
+        done = []
+        conn.execute("BEGIN IMMEDIATE")
+        for fn, args, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            conn.execute("SAVEPOINT write")
+            try:
+                done.append((future, fn(conn, *args), None))
+                conn.execute("RELEASE write")
+            except Exception as exc:
+                conn.execute("ROLLBACK TO write")
+                conn.execute("RELEASE write")
+                done.append((future, None, exc))
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as exc:
+            conn.execute("ROLLBACK")
+            done = [(future, None, exc) for future, _, _ in done]
+        self.batches += 1
+        self.writes += len(done)
+        for future, result, exc in done:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+# Writes: run on the writer thread inside the batch transaction
+
+def _create_user(conn, username: str, email: str, display_name: str, now: datetime) -> User:
+    try:
+        cursor = conn.execute(
+            "INSERT INTO users (username, email, username_key, email_key, display_name, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (username, email, normalize(username), normalize(email), display_name, now.isoformat(),
+             now.isoformat()))
+    except sqlite3.IntegrityError as exc:
+        raise _conflict(exc) from exc
+    return _user(conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (cursor.lastrowid,)).fetchone())
+
+
+def _update_user(conn, user_id: int, updates: dict, now: datetime) -> Optional[User]:
+    row = conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+    if row is None:
+        return None
+    user = _user(row)
+    for key, value in updates.items():
+        if key in USER_UPDATES and isinstance(value, str):
+            setattr(user, key, value)
+    try:
+        conn.execute(
+            "UPDATE users SET username = ?, email = ?, username_key = ?, email_key = ?, display_name = ?, "
+            "bio = ?, updated_at = ? WHERE id = ?",
+            (user.username, user.email, normalize(user.username), normalize(user.email), user.displayName,
+             user.bio, now.isoformat(), user_id))
+    except sqlite3.IntegrityError as exc:
+        raise _conflict(exc) from exc
+    user.updatedAt = now
+    return user
+
+
+def _create_post(conn, user_id: int, content: str, now: datetime) -> Post:
+    cursor = conn.execute(
+        "INSERT INTO posts (user_id, content, created_at, updated_at) VALUES (?, ?, ?, ?)",
+        (user_id, content, now.isoformat(), now.isoformat()))
+    conn.execute("INSERT INTO posts_fts (rowid, content) VALUES (?, ?)", (cursor.lastrowid, content))
+    conn.execute("UPDATE users SET post_count = post_count + 1 WHERE id = ?", (user_id,))
+    return Post(id=cursor.lastrowid, userId=user_id, content=content, createdAt=now, updatedAt=now)
+
+
+def _delete_post(conn, post_id: int):
+    """Like count of the deleted post plus removed (likes, comments), or None"""
+    row = conn.execute("SELECT user_id, like_count, content FROM posts WHERE id = ?", (post_id,)).fetchone()
+    if row is None:
+        return None
+    likes = conn.execute("DELETE FROM likes WHERE post_id = ?", (post_id,)).rowcount
+    comments = conn.execute("SELECT id, text FROM comments WHERE post_id = ?", (post_id,)).fetchall()
+    conn.executemany("INSERT INTO comments_fts (comments_fts, rowid, text) VALUES ('delete', ?, ?)", comments)
+    conn.execute("DELETE FROM comments WHERE post_id = ?", (post_id,))
+    conn.execute("INSERT INTO posts_fts (posts_fts, rowid, content) VALUES ('delete', ?, ?)", (post_id, row[2]))
+    conn.execute("DELETE FROM posts WHERE id = ?", (post_id,))
+    conn.execute("UPDATE users SET post_count = MAX(post_count - 1, 0) WHERE id = ?", (row[0],))
+    return row[1], likes, len(comments)
+
+
+def _add_comment(conn, post_id: int, user_id: int, text: str, now: datetime):
+    cursor = conn.execute(
+        "INSERT INTO comments (post_id, user_id, text, created_at) VALUES (?, ?, ?, ?)",
+        (post_id, user_id, text, now.isoformat()))
+    conn.execute("INSERT INTO comments_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text))
+    post_found = conn.execute(
+        "UPDATE posts SET comment_count = comment_count + 1 WHERE id = ?", (post_id,)).rowcount > 0
+    return Comment(id=cursor.lastrowid, postId=post_id, userId=user_id, text=text, createdAt=now), post_found
+
+
+def _like(conn, post_id: int, user_id: int):
+    """(added, new like count or None if the post does not exist)"""
+    if not conn.execute("INSERT OR IGNORE INTO likes (post_id, user_id) VALUES (?, ?)",
+                        (post_id, user_id)).rowcount:
+        return False, None
+    row = conn.execute("UPDATE posts SET like_count = like_count + 1 WHERE id = ? RETURNING like_count",
+                       (post_id,)).fetchone()
+    return True, row[0] if row else None
+
+
+def _unlike(conn, post_id: int, user_id: int):
+    if not conn.execute("DELETE FROM likes WHERE post_id = ? AND user_id = ?", (post_id, user_id)).rowcount:
+        return False, None
+    row = conn.execute("UPDATE posts SET like_count = MAX(like_count - 1, 0) WHERE id = ? RETURNING like_count",
+                       (post_id,)).fetchone()
+    return True, row[0] if row else None
+
+
+def _follow(conn, follower_id: int, following_id: int) -> bool:
+    if not conn.execute("INSERT OR IGNORE INTO follows (following_id, follower_id) VALUES (?, ?)",
+                        (following_id, follower_id)).rowcount:
+        return False
+    conn.execute("UPDATE users SET follower_count = follower_count + 1 WHERE id = ?", (following_id,))
+    conn.execute("UPDATE users SET following_count = following_count + 1 WHERE id = ?", (follower_id,))
+    return True
+
+
+def _unfollow(conn, follower_id: int, following_id: int) -> bool:
+    if not conn.execute("DELETE FROM follows WHERE following_id = ? AND follower_id = ?",
+                        (following_id, follower_id)).rowcount:
+        return False
+    conn.execute("UPDATE users SET follower_count = MAX(follower_count - 1, 0) WHERE id = ?", (following_id,))
+    conn.execute("UPDATE users SET following_count = MAX(following_count - 1, 0) WHERE id = ?", (follower_id,))
+    return True
+
+
+def _add_views(conn, views: list):
+    conn.executemany("UPDATE posts SET views = views + ? WHERE id = ?", views)
+
+
+# Reads: run on a reader thread with that thread's connection
+
+def _get_user(conn, user_id: int) -> Optional[User]:
+    row = conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+    return _user(row) if row else None
+
+
+def _get_users(conn, user_ids) -> List[User]:
+    users = [_get_user(conn, user_id) for user_id in user_ids]
+    return [user for user in users if user is not None]
+
+
+def _get_post(conn, post_id: int) -> Optional[Post]:
+    row = conn.execute(f"SELECT {POST_COLUMNS} FROM posts WHERE id = ?", (post_id,)).fetchone()
+    return _post(row) if row else None
+
+
+def _get_posts(conn, post_ids) -> List[Post]:
+    posts = [_get_post(conn, post_id) for post_id in post_ids]
+    return [post for post in posts if post is not None]
+
+
+def _get_comment(conn, comment_id: int) -> Optional[Comment]:
+    row = conn.execute(f"SELECT {COMMENT_COLUMNS} FROM comments WHERE id = ?", (comment_id,)).fetchone()
+    return _comment(row) if row else None
+
+
+def _user_conflict(conn, username, email, user_id) -> Optional[str]:
+    for field, column, value in (("username", "username_key", username), ("email", "email_key", email)):
+        if isinstance(value, str):
+            row = conn.execute(f"SELECT id FROM users WHERE {column} = ?", (normalize(value),)).fetchone()
+            if row and row[0] != user_id:
+                return field
+    return None
+
+
+def _get_user_by_key(conn, column: str, value: str) -> Optional[User]:
+    row = conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE {column} = ?", (normalize(value),)).fetchone()
+    return _user(row) if row else None
+
+
+def _search_users(conn, prefix: str, limit: int) -> List[User]:
+    key = normalize(prefix)
+    rows = conn.execute(
+        f"SELECT {USER_COLUMNS} FROM users WHERE username_key >= ? AND username_key < ? "
+        "ORDER BY username_key LIMIT ?", (key, key + "\U0010ffff", limit))
+    return [_user(row) for row in rows]
+
+
+def _get_all_users(conn) -> List[User]:
+    return [_user(row) for row in conn.execute(f"SELECT {USER_COLUMNS} FROM users ORDER BY id")]
+
+
+def _get_posts_by_user(conn, user_id: int) -> List[Post]:
+    rows = conn.execute(f"SELECT {POST_COLUMNS} FROM posts WHERE user_id = ? ORDER BY id", (user_id,))
+    return [_post(row) for row in rows]
+
+
+def _get_feed(conn, user_id: int, limit: int) -> List[Post]:
+    rows = conn.execute(
+        f"SELECT {POST_COLUMNS} FROM posts WHERE user_id IN "
+        "(SELECT follower_id FROM follows WHERE following_id = ? UNION SELECT ?) ORDER BY id DESC LIMIT ?",
+        (user_id, user_id, limit))
+    return [_post(row) for row in rows]
+
+
+def _get_comments(conn, post_id: int) -> List[Comment]:
+    rows = conn.execute(f"SELECT {COMMENT_COLUMNS} FROM comments WHERE post_id = ? ORDER BY id", (post_id,))
+    return [_comment(row) for row in rows]
+
+
+def _is_post_liked(conn, post_id: int, user_id: int) -> bool:
+    return conn.execute("SELECT 1 FROM likes WHERE post_id = ? AND user_id = ?",
+                        (post_id, user_id)).fetchone() is not None
+
+
+def _get_post_likers(conn, post_id: int, limit: int, after: int) -> UserPage:
+    user_ids = [r[0] for r in conn.execute(
+        "SELECT user_id FROM likes WHERE post_id = ? AND user_id > ? ORDER BY user_id LIMIT ?",
+        (post_id, after, limit))]
+    return UserPage(results=_get_users(conn, user_ids),
+                    nextCursor=str(user_ids[-1]) if len(user_ids) == limit else None)
+
+
+def _get_liked_posts(conn, user_id: int, limit: int, after: int) -> PostPage:
+    post_ids = [r[0] for r in conn.execute(
+        "SELECT post_id FROM likes WHERE user_id = ? AND post_id > ? ORDER BY post_id LIMIT ?",
+        (user_id, after, limit))]
+    return PostPage(results=_get_posts(conn, post_ids),
+                    nextCursor=str(post_ids[-1]) if len(post_ids) == limit else None)
+
+
+def _get_followers(conn, user_id: int) -> List[User]:
+    rows = conn.execute(
+        f"SELECT {USER_COLUMNS} FROM users WHERE id IN "
+        "(SELECT follower_id FROM follows WHERE following_id = ?) ORDER BY id", (user_id,))
+    return [_user(row) for row in rows]
+
+
+def _get_mutuals(conn, user_id: int, limit: int) -> Mutuals:
+    # Same work cap as graph.intersect: at most MAX_WORK followers are checked
+    followers = [r[0] for r in conn.execute(
+        "SELECT follower_id FROM follows WHERE following_id = ? LIMIT ?", (user_id, graph.MAX_WORK + 1))]
+    truncated = len(followers) > graph.MAX_WORK
+    mutual = [follower for follower in followers[:graph.MAX_WORK] if conn.execute(
+        "SELECT 1 FROM follows WHERE following_id = ? AND follower_id = ?", (follower, user_id)).fetchone()]
+    return Mutuals(count=len(mutual), truncated=truncated, results=_get_users(conn, mutual[:limit]))
+
+
+def _get_suggestions(conn, user_id: int, limit: int) -> Suggestions:
+    """Same algorithm and work cap as graph.suggestions"""
+    following = [r[0] for r in conn.execute(
+        "SELECT following_id FROM follows WHERE follower_id = ? ORDER BY following_id", (user_id,))]
+    followed = set(following)
+    share = max(16, graph.MAX_WORK // max(len(following), 1))
+    counts = defaultdict(int)
+    work, truncated = 0, False
+    for friend in following:
+        if work >= graph.MAX_WORK:
+            truncated = True
+            break
+        budget = min(share, graph.MAX_WORK - work)
+        rows = conn.execute("SELECT following_id FROM follows WHERE follower_id = ? ORDER BY following_id LIMIT ?",
+                            (friend, budget + 1)).fetchall()
+        if len(rows) > budget:
+            truncated = True
+            rows = rows[:budget]
+        work += len(rows)
+        for (candidate,) in rows:
+            if candidate != user_id and candidate not in followed:
+                counts[candidate] += 1
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return Suggestions(truncated=truncated, results=[
+        Suggestion(user=user, sharedConnections=counts[user.id])
+        for user in _get_users(conn, [uid for uid, _ in ranked])])
+
+
+def _degree_distribution(conn) -> DegreeDistribution:
+    users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    edges = conn.execute("SELECT COUNT(*) FROM follows").fetchone()[0]
+
+    def buckets(column: str) -> List[DegreeBucket]:
+        histogram = DegreeHistogram()
+        histogram.counts.update(conn.execute(
+            f"SELECT degree, COUNT(*) FROM (SELECT COUNT(*) AS degree FROM follows GROUP BY {column}) "
+            "GROUP BY degree"))
+        return [DegreeBucket(min=lo, max=hi, users=n) for lo, hi, n in histogram.buckets(users)]
+    return DegreeDistribution(users=users, edges=edges, followers=buckets("following_id"),
+                              following=buckets("follower_id"))
+
+
+SEARCH_TABLES = {SearchIndex.POST: "posts_fts", SearchIndex.COMMENT: "comments_fts"}
+
+
+def _search(conn, query: str, kinds, limit: int, cursor: Optional[str]) -> SearchResults:
+    """Same ordering and cursor as the in-memory index: (score, kind, id) descending"""
+    after = decode_cursor(cursor) if cursor else None
+    terms = tokenize(query)
+    if not terms:
+        return SearchResults(results=[])
+    match = " ".join(f'"{term}"' for term in dict.fromkeys(terms))  # \w+ tokens, safe to quote
+    keys = []
+    for kind in kinds:
+        table = SEARCH_TABLES[kind]
+        ranked = f"SELECT rowid AS id, -bm25({table}) AS score FROM {table} WHERE {table} MATCH ?"
+        if after is None:
+            rows = conn.execute(f"SELECT id, score FROM ({ranked}) ORDER BY score DESC, id DESC LIMIT ?",
+                                (match, limit))
+        else:
+            score, after_kind, after_id = after
+            rows = conn.execute(
+                f"SELECT id, score FROM ({ranked}) WHERE score < ? OR (score = ? AND (? < ? OR (? = ? AND id < ?))) "
+                "ORDER BY score DESC, id DESC LIMIT ?",
+                (match, score, score, kind, after_kind, kind, after_kind, after_id, limit))
+        keys.extend((score, kind, doc_id) for doc_id, score in rows)
+    keys = sorted(keys, reverse=True)[:limit]
+    results = []
+    for score, kind, doc_id in keys:
+        if kind == SearchIndex.POST:
+            results.append(SearchHit(type="post", score=score, post=_get_post(conn, doc_id)))
+        else:
+            results.append(SearchHit(type="comment", score=score, comment=_get_comment(conn, doc_id)))
+    return SearchResults(results=results, nextCursor=encode_cursor(keys[-1]) if len(keys) == limit else None)
+
+
+def _most_liked(conn, limit: int) -> List[Post]:
+    rows = conn.execute(f"SELECT {POST_COLUMNS} FROM posts WHERE like_count > 0 "
+                        "ORDER BY like_count DESC, id DESC LIMIT ?", (limit,))
+    return [_post(row) for row in rows]
+
+
+class SQLiteDatabase:
+    def __init__(self, path: str = SQLITE_PATH, readers: int = READERS):
+        self.path = path
+        conn = connect(path)
+        conn.executescript(SCHEMA)
+        # Entity counts for /metrics, kept up to date by the write paths
+        self.counts = {
+            "users": conn.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+            "posts": conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0],
+            "comments": conn.execute("SELECT COUNT(*) FROM comments").fetchone()[0],
+            "likes": conn.execute("SELECT COUNT(*) FROM likes").fetchone()[0],
+            "follow_edges": conn.execute("SELECT COUNT(*) FROM follows").fetchone()[0],
+        }
+        conn.close()
+        self.writer = Writer(path)
+        self.writer.start()
+        self.local = threading.local()
+        self.reader_connections: List[sqlite3.Connection] = []
+        self.readers = ThreadPoolExecutor(readers, thread_name_prefix="sqlite-reader",
+                                          initializer=self._open_reader)
+        self.rankings = Rankings()
+        self.pending_views = defaultdict(int)
+        self.pending_view_total = 0
+        self.view_flush_size = int(os.environ.get("VIEW_FLUSH_SIZE", "1000"))
+        self.views_flushed_at = time.monotonic()
+
+    def _open_reader(self):
+        self.local.conn = connect(self.path)
+        self.reader_connections.append(self.local.conn)
+
+    def _run_read(self, fn: Callable, args: tuple):
+        return fn(self.local.conn, *args)
+
+    async def _read(self, fn: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.readers, self._run_read, fn, args)
+
+    async def _write(self, fn: Callable, *args):
+        return await asyncio.wrap_future(self.writer.submit(fn, *args))
+
+    # Users
+    async def create_user(self, username: str, email: str, display_name: str) -> User:
+        user = await self._write(_create_user, username, email, display_name, datetime.now())
+        self.counts["users"] += 1
+        return user
+
+    async def user_conflict(self, username: Optional[str], email: Optional[str],
+                            user_id: Optional[int] = None) -> Optional[str]:
+        return await self._read(_user_conflict, username, email, user_id)
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        return await self._read(_get_user, user_id)
+
+    async def get_user_by_username(self, username: str) -> Optional[User]:
+        return await self._read(_get_user_by_key, "username_key", username)
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        return await self._read(_get_user_by_key, "email_key", email)
+
+    async def search_users(self, prefix: str, limit: int = 10) -> List[User]:
+        return await self._read(_search_users, prefix, limit)
+
+    async def update_user(self, user_id: int, updates: dict) -> Optional[User]:
+        return await self._write(_update_user, user_id, updates, datetime.now())
+
+    async def get_all_users(self) -> List[User]:
+        return await self._read(_get_all_users)
+
+    # Posts
+    async def create_post(self, user_id: int, content: str) -> Post:
+        post = await self._write(_create_post, user_id, content, datetime.now())
+        self.counts["posts"] += 1
+        return post
+
+    async def get_post(self, post_id: int) -> Optional[Post]:
+        return await self._read(_get_post, post_id)
+
+    def record_view(self, post_id: int):
+        self.pending_views[post_id] += 1
+        self.pending_view_total += 1
+        if self.pending_view_total >= self.view_flush_size:
+            self.flush_views()
+
+    def flush_views(self) -> int:
+        """Queues the buffered views as one write; does not wait for the commit"""
+        pending, self.pending_views = self.pending_views, defaultdict(int)
+        if pending:
+            self.writer.submit(_add_views, [(count, post_id) for post_id, count in pending.items()])
+            for post_id, count in pending.items():
+                self.rankings.record(post_id, "view", count)
+        flushed, self.pending_view_total = self.pending_view_total, 0
+        self.views_flushed_at = time.monotonic()
+        return flushed
+
+    async def delete_post(self, post_id: int) -> bool:
+        deleted = await self._write(_delete_post, post_id)
+        if deleted is None:
+            return False
+        like_count, likes, comments = deleted
+        self.rankings.discard(post_id, like_count)
+        self.pending_view_total -= self.pending_views.pop(post_id, 0)
+        self.counts["posts"] -= 1
+        self.counts["likes"] -= likes
+        self.counts["comments"] -= comments
+        return True
+
+    async def get_posts_by_user(self, user_id: int) -> List[Post]:
+        return await self._read(_get_posts_by_user, user_id)
+
+    async def get_feed(self, user_id: int, limit: int = 20) -> List[Post]:
+        return await self._read(_get_feed, user_id, limit)
+
+    # Comments
+    async def add_comment(self, post_id: int, user_id: int, text: str) -> Comment:
+        comment, post_found = await self._write(_add_comment, post_id, user_id, text, datetime.now())
+        self.counts["comments"] += 1
+        if post_found:
+            self.rankings.record(post_id, "comment")
+        return comment
+
+    async def get_comments(self, post_id: int) -> List[Comment]:
+        return await self._read(_get_comments, post_id)
+
+    # Likes
+    async def like_post(self, post_id: int, user_id: int) -> bool:
+        added, likes = await self._write(_like, post_id, user_id)
+        if added:
+            self.counts["likes"] += 1
+            if likes is not None:
+                self.rankings.like_count_changed(post_id, likes - 1, likes)
+                self.rankings.record(post_id, "like")
+        return added
+
+    async def unlike_post(self, post_id: int, user_id: int) -> bool:
+        removed, likes = await self._write(_unlike, post_id, user_id)
+        if removed:
+            self.counts["likes"] -= 1
+            if likes is not None:
+                self.rankings.like_count_changed(post_id, likes + 1, likes)
+        return removed
+
+    async def is_post_liked(self, post_id: int, user_id: int) -> bool:
+        return await self._read(_is_post_liked, post_id, user_id)
+
+    async def get_post_likers(self, post_id: int, limit: int, after: int = 0) -> UserPage:
+        return await self._read(_get_post_likers, post_id, limit, after)
+
+    async def get_liked_posts(self, user_id: int, limit: int, after: int = 0) -> PostPage:
+        return await self._read(_get_liked_posts, user_id, limit, after)
+
+    # Follows
+    async def follow(self, follower_id: int, following_id: int) -> bool:
+        if follower_id == following_id:
+            return False
+        added = await self._write(_follow, follower_id, following_id)
+        self.counts["follow_edges"] += added
+        return added
+
+    async def unfollow(self, follower_id: int, following_id: int) -> bool:
+        removed = await self._write(_unfollow, follower_id, following_id)
+        self.counts["follow_edges"] -= removed
+        return removed
+
+    async def get_followers(self, user_id: int) -> List[User]:
+        return await self._read(_get_followers, user_id)
+
+    async def get_mutuals(self, user_id: int, limit: int) -> Mutuals:
+        return await self._read(_get_mutuals, user_id, limit)
+
+    async def get_suggestions(self, user_id: int, limit: int) -> Suggestions:
+        return await self._read(_get_suggestions, user_id, limit)
+
+    async def degree_distribution(self) -> DegreeDistribution:
+        return await self._read(_degree_distribution)
+
+    # Search and rankings
+    async def search(self, query: str, kinds, limit: int, cursor: Optional[str] = None) -> SearchResults:
+        return await self._read(_search, query, kinds, limit, cursor)
+
+    async def trending(self, window: str, limit: int) -> List[TrendingPost]:
+        ranked = self.rankings.trending_posts(window, limit)
+        posts = {post.id: post for post in await self._read(_get_posts, [post_id for post_id, _ in ranked])}
+        return [TrendingPost(score=round(score, 4), post=posts[post_id])
+                for post_id, score in ranked if post_id in posts]
+
+    async def most_liked(self, limit: int) -> List[Post]:
+        return await self._read(_most_liked, limit)
+
+    async def maintain(self):
+        """Nothing to do: SQLite checkpoints the WAL itself"""
+
+    def close(self):
+        self.writer.stop()
+        self.readers.shutdown(wait=True)
+        for conn in self.reader_connections:
+            conn.close()
+
+    def stats(self) -> dict:
+        """Entity counts, exported as gauges on /metrics"""
+        return {
+            **self.counts,
+            "pending_views": self.pending_view_total,
+            "write_queue": self.writer.queue.qsize(),
+            "write_batches": self.writer.batches,
+            "writes": self.writer.writes,
+            "view_staleness_seconds": round(time.monotonic() - self.views_flushed_at, 3),
+        }
@@ -1,8 +1,11 @@
 import asyncio
 import aiohttp
 import time
+import uuid
 
 BASE_URL = "http://localhost:3001"
+# Suffix for the stress users' names and emails (unique per server)
+RUN_ID = uuid.uuid4().hex[:6]
 
 async def make_request(session, method, path, json=None):
     async with session.request(method, f"{BASE_URL}{path}", json=json) as resp:
@@ -26,8 +29,8 @@ async def run_stress_test():
         user_ids = []
         for i in range(500):
             res = await make_request(session, "POST", "/api/users", {
-                "username": f"stressuser{i}",
-                "email": f"stressuser{i}@example.com",
+                "username": f"stressuser{i}_{RUN_ID}",
+                "email": f"stressuser{i}_{RUN_ID}@example.com",
                 "displayName": f"Stress User {i}",
             })
             user_ids.append(res["data"]["id"])
@@ -0,0 +1,238 @@
+"""Lightweight per-request tracing with a Server-Timing response header.
+
+Phases of a request (all relative to the outermost middleware):
+
+    middleware     entry -> route matched (CORS, metrics, exception handling, routing)
+    validation     route matched -> endpoint called (query/path parameters,
+                   and the body for routes with a request model)
+    handler        endpoint body, including
+      ingest       body read, JSON decode and validation of the write routes,
+                   which read their body in the handler (ingest.py)
+      db           time spent in Database methods
+    serialization  endpoint returned -> response start (response_model, JSON encoding)
+
+Finished traces go to an in-memory ring buffer (GET /debug/traces) and, when
+TRACE_FILE is set, are appended to that file as JSON lines.
+"""
+
+import functools
+import inspect
+import itertools
+import json
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import List, Optional
+
+from metrics import MetricsRoute, route_label
+
+ENABLED = os.environ.get("TRACING_ENABLED", "1") != "0"
+BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER", "1000"))
+TRACE_FILE = os.environ.get("TRACE_FILE")
+
+PHASES = ("middleware", "validation", "handler", "ingest", "db", "serialization")
+
+
+class Trace:
+    __slots__ = ("id", "method", "path", "route", "status", "start", "marks", "spans", "depth", "ingest", "db",
+                 "total")
+
+    def __init__(self, trace_id: int, method: str, path: str):
+        self.id = trace_id
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.start = time.perf_counter()
+        self.marks = {}    # phase boundary -> perf_counter()
+        self.spans = []    # (name, offset_ms, duration_ms) of outermost spans
+        self.depth = 0
+        self.ingest = 0.0
+        self.db = 0.0
+        self.total = None
+
+    def mark(self, name: str):
+        self.marks.setdefault(name, time.perf_counter())
+
+    def _between(self, a: str, b: str) -> Optional[float]:
+        if a in self.marks and b in self.marks:
+            return (self.marks[b] - self.marks[a]) * 1000
+        return None
+
+    def phases(self) -> dict:
+        """Phase durations in ms; phases that did not happen are omitted"""
+        self.marks.setdefault("entry", self.start)
+        result = {
+            "middleware": self._between("entry", "route"),
+            "validation": self._between("route", "handler_start"),
+            "handler": self._between("handler_start", "handler_end"),
+            "ingest": self.ingest * 1000 if self.ingest else None,
+            "db": self.db * 1000 if self.db else None,
+            "serialization": self._between("handler_end", "response"),
+        }
+        return {k: round(v, 3) for k, v in result.items() if v is not None}
+
+    def server_timing(self) -> str:
+        total = (time.perf_counter() - self.start) * 1000
+        parts = [f"{name};dur={dur:.3f}" for name, dur in self.phases().items()]
+        parts.append(f"total;dur={total:.3f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "method": self.method, "path": self.path, "route": self.route,
+            "status": self.status, "total_ms": self.total, "phases": self.phases(),
+            "spans": [{"name": n, "offset_ms": round(o, 3), "duration_ms": round(d, 3)} for n, o, d in self.spans],
+        }
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+class TraceBuffer:
+    def __init__(self, size: int = BUFFER_SIZE, path: Optional[str] = TRACE_FILE):
+        self.traces = deque(maxlen=size)
+        self.path = path
+        self._file = None
+
+    def add(self, trace: Trace):
+        self.traces.append(trace)
+        if self.path:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1 << 16)
+            self._file.write(json.dumps(trace.to_dict()) + "\n")
+
+    def recent(self, limit: int = 50, route: Optional[str] = None) -> List[dict]:
+        selected = [t for t in reversed(self.traces) if route is None or t.route == route]
+        return [t.to_dict() for t in selected[:limit]]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+buffer = TraceBuffer()
+_ids = itertools.count(1)
+
+
+class span:
+    """Times a block as a span of the current request (no-op outside requests)"""
+
+    __slots__ = ("name", "trace", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = current_trace.get()
+        if self.trace is not None:
+            self.trace.depth += 1
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        trace = self.trace
+        if trace is not None:
+            duration = time.perf_counter() - self.started
+            trace.depth -= 1
+            if trace.depth == 0:
+                trace.spans.append((self.name, (self.started - trace.start) * 1000, duration * 1000))
+                if self.name.startswith("db."):
+                    trace.db += duration
+                elif self.name.startswith("ingest."):
+                    trace.ingest += duration
+        return False
+
+
+def instrument(obj, prefix: str):
+    """Wrap the public methods of `obj` (instance-level) in spans named <prefix>.<method>"""
+    for name, method in inspect.getmembers(obj, inspect.ismethod):
+        if name.startswith("_"):
+            continue
+
+        def make(fn, span_name):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    if current_trace.get() is None:
+                        return await fn(*args, **kwargs)
+                    with span(span_name):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if current_trace.get() is None:
+                    return fn(*args, **kwargs)
+                with span(span_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+
+        setattr(obj, name, make(method, f"{prefix}.{name}"))
+    return obj
+
+
+def _traced_endpoint(endpoint):
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        trace = current_trace.get()
+        if trace is None:
+            return await endpoint(*args, **kwargs)
+        trace.mark("handler_start")
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            trace.mark("handler_end")
+    return wrapper
+
+
+class TracedRoute(MetricsRoute):
+    """Marks the route / endpoint phase boundaries of the current trace"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if ENABLED and inspect.iscoroutinefunction(endpoint):
+            endpoint = _traced_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    async def handle(self, scope, receive, send):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.mark("route")
+            trace.route = self.path
+        await super().handle(scope, receive, send)
+
+
+class TracingMiddleware:
+    """Starts a trace per HTTP request and adds the Server-Timing header"""
+
+    def __init__(self, app, buffer: TraceBuffer = buffer):
+        self.app = app
+        self.buffer = buffer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(next(_ids), scope["method"], scope["path"])
+        token = current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.mark("response")
+                trace.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
+            trace.total = round((time.perf_counter() - trace.start) * 1000, 3)
+            if trace.route is None:
+                trace.route = route_label(scope)
+            self.buffer.add(trace)
@@ -0,0 +1,82 @@
+"""Sorted string index for username typeahead.
+
+A single sorted Python list would make every insert an O(n) memmove (8 MB
+at 1M users). `SortedKeyIndex` keeps the keys in sorted chunks of at most
+2 * CHUNK entries plus a list of each chunk's largest key, so inserts and
+removals touch one small chunk and a prefix scan is two bisects followed by
+a sequential read.
+"""
+
+from bisect import bisect_left, insort
+from typing import List
+
+
+def normalize(value: str) -> str:
+    """Usernames and emails are unique and matched case-insensitively"""
+    return value.casefold()
+
+
+class SortedKeyIndex:
+    CHUNK = 512
+
+    def __init__(self):
+        self.chunks: List[List[str]] = []
+        self.maxes: List[str] = []
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, key: str):
+        self.size += 1
+        if not self.maxes:
+            self.chunks.append([key])
+            self.maxes.append(key)
+            return
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            i -= 1
+            self.chunks[i].append(key)
+            self.maxes[i] = key
+        else:
+            insort(self.chunks[i], key)
+        chunk = self.chunks[i]
+        if len(chunk) > 2 * self.CHUNK:
+            self.chunks[i:i + 1] = [chunk[:self.CHUNK], chunk[self.CHUNK:]]
+            self.maxes[i:i + 1] = [chunk[self.CHUNK - 1], chunk[-1]]
+
+    def remove(self, key: str) -> bool:
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return False
+        chunk = self.chunks[i]
+        j = bisect_left(chunk, key)
+        if j == len(chunk) or chunk[j] != key:
+            return False
+        del chunk[j]
+        self.size -= 1
+        if chunk:
+            self.maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i]
+            del self.maxes[i]
+        return True
+
+    def prefix(self, prefix: str, limit: int) -> List[str]:
+        """Up to `limit` keys starting with `prefix`, in sorted order"""
+        result: List[str] = []
+        i = bisect_left(self.maxes, prefix)
+        if i == len(self.maxes):
+            return result
+        j = bisect_left(self.chunks[i], prefix)
+        while i < len(self.chunks):
+            chunk = self.chunks[i]
+            while j < len(chunk):
+                key = chunk[j]
+                if not key.startswith(prefix) or len(result) == limit:
+                    return result
+                result.append(key)
+                j += 1
+            i += 1
+            j = 0
+        return result
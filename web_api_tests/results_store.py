@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Benchmark Results Store
+Persists benchmark runs (commit, machine, config, latency histograms) in a
+local SQLite database and compares runs for statistically significant
+throughput / p99 regressions.
+
+Usage:
+    python results_store.py list
+    python results_store.py show <run>
+    python results_store.py compare <baseline> <candidate> [--threshold 0.05]
+
+<run> is a run id, "latest", "previous" or a commit hash prefix (latest run
+of that commit). `compare` exits with status 1 when a regression is found,
+so CI can gate merges on it.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_DB = Path(os.environ.get("BENCH_DB", Path(__file__).resolve().parent / "benchmark_results.db"))
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram (~2.5% relative precision)
+
+    Buckets are sparse, so a histogram with a few thousand samples stays a
+    few hundred bytes when stored as JSON.
+    """
+
+    GROWTH = 1.05
+
+    def __init__(self, buckets: Optional[Dict[int, int]] = None):
+        self.buckets: Dict[int, int] = dict(buckets or {})
+        self.count = sum(self.buckets.values())
+        self.total_ms = 0.0
+
+    def record(self, ms: float):
+        us = max(ms * 1000, 1.0)
+        idx = int(math.log(us, self.GROWTH))
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total_ms += ms
+
+    def merge(self, other: "LatencyHistogram"):
+        for idx, n in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.count += other.count
+        self.total_ms += other.total_ms
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Latency (ms) below which p% of the samples fall (bucket midpoint)"""
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                return self.GROWTH ** (idx + 0.5) / 1000
+        return self.GROWTH ** (max(self.buckets) + 0.5) / 1000
+
+    def to_dict(self) -> dict:
+        return {"growth": self.GROWTH, "buckets": {str(k): v for k, v in sorted(self.buckets.items())}}
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "LatencyHistogram":
+        if not data:
+            return cls()
+        return cls({int(k): v for k, v in data.get("buckets", {}).items()})
+
+
+def git_info(cwd: Path = Path(__file__).resolve().parent) -> dict:
+    """Commit hash, branch and dirty flag of the working tree"""
+    def git(*args):
+        try:
+            out = subprocess.run(["git", *args], cwd=str(cwd), capture_output=True, text=True, timeout=10)
+            return out.stdout.strip() if out.returncode == 0 else None
+        except Exception:
+            return None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "branch": git("rev-parse", "--abbrev-ref", "HEAD"),
+        "dirty": bool(git("status", "--porcelain")),
+    }
+
+
+def machine_info() -> dict:
+    return {
+        "hostname": socket.gethostname(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+class ResultsStore:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        source TEXT NOT NULL,
+        git_commit TEXT,
+        git_branch TEXT,
+        git_dirty INTEGER,
+        machine TEXT NOT NULL,
+        config TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id INTEGER NOT NULL REFERENCES runs(id),
+        framework TEXT NOT NULL,
+        test_type TEXT NOT NULL,
+        trial INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL,
+        total_ms REAL,
+        requests INTEGER,
+        requests_per_sec REAL,
+        p50_ms REAL,
+        p99_ms REAL,
+        startup_ms REAL,
+        histogram TEXT,
+        extra TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_results_run ON results(run_id);
+    CREATE INDEX IF NOT EXISTS idx_runs_commit ON runs(git_commit);
+    """
+
+    def __init__(self, path: Path = DEFAULT_DB):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(self.SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def save_run(self, results: Iterable[dict], config: dict, source: str = "orchestrator") -> int:
+        """Store one run; each result is a dict with at least framework/test_type/status"""
+        git = git_info()
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (created_at, source, git_commit, git_branch, git_dirty, machine, config) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec="seconds"), source, git["commit"], git["branch"],
+                 int(git["dirty"]), json.dumps(machine_info()), json.dumps(config, default=str)),
+            )
+            run_id = cur.lastrowid
+            known = {"framework", "test_type", "trial", "status", "total_ms", "requests",
+                     "requests_per_sec", "p50_ms", "p99_ms", "startup_ms", "histogram"}
+            for r in results:
+                extra = {k: v for k, v in r.items() if k not in known and k != "output"}
+                self.conn.execute(
+                    "INSERT INTO results (run_id, framework, test_type, trial, status, total_ms, requests, "
+                    "requests_per_sec, p50_ms, p99_ms, startup_ms, histogram, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, r["framework"], r["test_type"], r.get("trial", 0), r["status"],
+                     r.get("total_ms"), r.get("requests"), r.get("requests_per_sec"),
+                     r.get("p50_ms"), r.get("p99_ms"), r.get("startup_ms"),
+                     json.dumps(r["histogram"]) if r.get("histogram") else None,
+                     json.dumps(extra, default=str) if extra else None),
+                )
+        return run_id
+
+    def resolve(self, ref: str) -> Optional[int]:
+        """Run id for an id, "latest", "previous" or a commit prefix"""
+        if ref in ("latest", "previous"):
+            rows = self.conn.execute("SELECT id FROM runs ORDER BY id DESC LIMIT 2").fetchall()
+            idx = 0 if ref == "latest" else 1
+            return rows[idx]["id"] if len(rows) > idx else None
+        if ref.isdigit():
+            row = self.conn.execute("SELECT id FROM runs WHERE id = ?", (int(ref),)).fetchone()
+            if row:
+                return row["id"]
+        row = self.conn.execute(
+            "SELECT id FROM runs WHERE git_commit LIKE ? ORDER BY id DESC LIMIT 1", (ref + "%",)
+        ).fetchone()
+        return row["id"] if row else None
+
+    def list_runs(self, limit: int = 20) -> List[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT r.*, COUNT(x.id) AS n_results FROM runs r LEFT JOIN results x ON x.run_id = r.id "
+            "GROUP BY r.id ORDER BY r.id DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+    def run_results(self, run_id: int) -> List[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM results WHERE run_id = ? ORDER BY framework, test_type, trial", (run_id,)
+        ).fetchall()
+
+    def samples(self, run_id: int) -> Dict[Tuple[str, str], Dict[str, List[float]]]:
+        """Per (framework, test_type): lists of per-trial throughput and p99"""
+        grouped: Dict[Tuple[str, str], Dict[str, List[float]]] = {}
+        for r in self.run_results(run_id):
+            if r["total_ms"] is None:
+                continue
+            g = grouped.setdefault((r["framework"], r["test_type"]), {"rps": [], "p99": []})
+            if r["requests_per_sec"]:
+                g["rps"].append(r["requests_per_sec"])
+            if r["p99_ms"]:
+                g["p99"].append(r["p99_ms"])
+        return grouped
+
+
+# Statistics
+
+def t_quantile(p: float, df: float) -> float:
+    """Student t quantile: Cornish-Fisher expansion for df >= 3, below that the
+    CDF inverted by bisection (the expansion is far off there, e.g. 11.3
+    instead of 12.7 for the 97.5% quantile at df = 1)"""
+    z = statistics.NormalDist().inv_cdf(p)
+    if math.isinf(df):
+        return z
+    if df < 3:
+        if p < 0.5:
+            return -t_quantile(1 - p, df)
+        low, high = 0.0, 1.0
+        while t_cdf(high, df) < p:
+            low, high = high, high * 2
+        for _ in range(100):
+            mid = (low + high) / 2
+            low, high = (mid, high) if t_cdf(mid, df) < p else (low, mid)
+        return (low + high) / 2
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def t_cdf(t: float, df: float) -> float:
+    """Student t CDF, through the regularized incomplete beta function"""
+    tail = _incomplete_beta(df / 2, 0.5, df / (df + t * t)) / 2
+    return 1 - tail if t > 0 else tail
+
+
+def _incomplete_beta(a: float, b: float, x: float) -> float:
+    """I_x(a, b) by its continued fraction (modified Lentz)"""
+    if x <= 0 or x >= 1:
+        return 0.0 if x <= 0 else 1.0
+    if x > (a + 1) / (a + b + 2):
+        return 1 - _incomplete_beta(b, a, 1 - x)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x))
+    tiny = 1e-300
+    c, d = 1.0, 1 - (a + b) * x / (a + 1)
+    d = 1 / (d if abs(d) > tiny else tiny)
+    result = d
+    for m in range(1, 200):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1 + numerator * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            result *= c * d
+        if abs(c * d - 1) < 1e-15:
+            break
+    return front * result / a
+
+
+def welch_interval(base: List[float], cand: List[float], confidence: float = 0.95
+                   ) -> Optional[Tuple[float, float, float]]:
+    """(diff, low, high) confidence interval of mean(cand) - mean(base)
+
+    Returns None when either side has fewer than two trials.
+    """
+    if len(base) < 2 or len(cand) < 2:
+        return None
+    mb, mc = statistics.fmean(base), statistics.fmean(cand)
+    vb, vc = statistics.variance(base) / len(base), statistics.variance(cand) / len(cand)
+    diff = mc - mb
+    se = math.sqrt(vb + vc)
+    if se == 0:
+        return diff, diff, diff
+    df = (vb + vc) ** 2 / ((vb ** 2 / (len(base) - 1)) + (vc ** 2 / (len(cand) - 1)))
+    t = t_quantile(1 - (1 - confidence) / 2, df)
+    return diff, diff - t * se, diff + t * se
+
+
+def compare_runs(store: ResultsStore, baseline: int, candidate: int,
+                 threshold: float = 0.05, confidence: float = 0.95) -> List[dict]:
+    """Compare two runs; a metric regresses when the confidence interval of
+    the change lies entirely on the bad side and the mean moved by more
+    than `threshold` (relative)."""
+    base, cand = store.samples(baseline), store.samples(candidate)
+    rows = []
+    for key in sorted(set(base) & set(cand)):
+        for metric, higher_is_better in (("rps", True), ("p99", False)):
+            b, c = base[key][metric], cand[key][metric]
+            if not b or not c:
+                continue
+            mean_b, mean_c = statistics.fmean(b), statistics.fmean(c)
+            change = (mean_c - mean_b) / mean_b if mean_b else 0.0
+            interval = welch_interval(b, c, confidence)
+            if interval is None:
+                verdict = "n/a (need >= 2 trials)"
+            else:
+                _, low, high = interval
+                worse = high < 0 if higher_is_better else low > 0
+                better = low > 0 if higher_is_better else high < 0
+                if worse and abs(change) > threshold:
+                    verdict = "REGRESSION"
+                elif better and abs(change) > threshold:
+                    verdict = "improvement"
+                else:
+                    verdict = "no significant change"
+            rows.append({
+                "framework": key[0], "test_type": key[1], "metric": metric,
+                "baseline": mean_b, "candidate": mean_c, "change": change,
+                "interval": interval, "verdict": verdict,
+            })
+    return rows
+
+
+# CLI
+
+def _cmd_list(store: ResultsStore, args):
+    print(f"{'Run':<6} {'Created':<21} {'Source':<14} {'Commit':<10} {'Dirty':<6} {'Results':<8}")
+    print("-" * 70)
+    for r in store.list_runs(args.limit):
+        commit = (r["git_commit"] or "n/a")[:8]
+        print(f"{r['id']:<6} {r['created_at']:<21} {r['source']:<14} {commit:<10} "
+              f"{'yes' if r['git_dirty'] else 'no':<6} {r['n_results']:<8}")
+
+
+def _cmd_show(store: ResultsStore, args):
+    run_id = store.resolve(args.run)
+    if run_id is None:
+        sys.exit(f"Unknown run: {args.run}")
+    print(f"{'Framework':<20} {'Test Type':<12} {'Trial':<6} {'Status':<10} {'Total (ms)':<12} "
+          f"{'Req/sec':<10} {'p50 (ms)':<10} {'p99 (ms)':<10}")
+    print("-" * 100)
+    fmt = lambda v, spec: format(v, spec) if v is not None else "n/a"
+    for r in store.run_results(run_id):
+        print(f"{r['framework']:<20} {r['test_type']:<12} {r['trial']:<6} {r['status']:<10} "
+              f"{fmt(r['total_ms'], '.1f'):<12} {fmt(r['requests_per_sec'], '.0f'):<10} "
+              f"{fmt(r['p50_ms'], '.2f'):<10} {fmt(r['p99_ms'], '.2f'):<10}")
+
+
+def _cmd_compare(store: ResultsStore, args) -> int:
+    baseline, candidate = store.resolve(args.baseline), store.resolve(args.candidate)
+    if baseline is None or candidate is None:
+        sys.exit(f"Unknown run: {args.baseline if baseline is None else args.candidate}")
+
+    rows = compare_runs(store, baseline, candidate, args.threshold, args.confidence)
+    print(f"\nBaseline run {baseline} vs candidate run {candidate} "
+          f"({args.confidence:.0%} CI, threshold {args.threshold:.0%})\n")
+    print(f"{'Framework':<20} {'Test Type':<12} {'Metric':<8} {'Baseline':<12} {'Candidate':<12} "
+          f"{'Change':<9} {'CI of diff':<24} {'Verdict'}")
+    print("-" * 120)
+    for r in rows:
+        ci = f"[{r['interval'][1]:.1f}, {r['interval'][2]:.1f}]" if r["interval"] else "n/a"
+        print(f"{r['framework']:<20} {r['test_type']:<12} {r['metric']:<8} {r['baseline']:<12.1f} "
+              f"{r['candidate']:<12.1f} {r['change']:<+9.1%} {ci:<24} {r['verdict']}")
+
+    regressions = [r for r in rows if r["verdict"] == "REGRESSION"]
+    print(f"\n{len(regressions)} regression(s) found")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and compare stored benchmark runs")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB, help=f"Results database (default: {DEFAULT_DB})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_list = sub.add_parser("list", help="List stored runs")
+    p_list.add_argument("--limit", type=int, default=20)
+
+    p_show = sub.add_parser("show", help="Show the results of one run")
+    p_show.add_argument("run")
+
+    p_cmp = sub.add_parser("compare", help="Flag regressions of a candidate run against a baseline")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("candidate", nargs="?", default="latest")
+    p_cmp.add_argument("--threshold", type=float, default=0.05,
+                       help="Minimum relative change to count as regression (default: 0.05)")
+    p_cmp.add_argument("--confidence", type=float, default=0.95)
+
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.db)
+    try:
+        if args.command == "list":
+            _cmd_list(store, args)
+        elif args.command == "show":
+            _cmd_show(store, args)
+        else:
+            return _cmd_compare(store, args)
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
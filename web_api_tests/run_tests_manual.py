@@ -8,6 +8,13 @@ import asyncio
 import aiohttp
 import time
 import sys
+import uuid
+
+from results_store import LatencyHistogram, ResultsStore
+from test_orchestrator import latency_trace_config
+
+# Per-run suffix: the APIs are already running and may hold users from a previous run
+RUN_ID = uuid.uuid4().hex[:6]
 
 try:
     import tkinter as tk
@@ -40,17 +47,19 @@ class ManualTester:
     async def run_test(self, port, name):
         """Run quick test against API"""
         base_url = f"http://localhost:{port}"
+        histogram = LatencyHistogram()
+        trace = [latency_trace_config(histogram)]
         
         try:
             start = time.time()
             
             # Create users
             user_ids = []
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(trace_configs=trace) as session:
                 for i in range(20):
                     async with session.post(f"{base_url}/api/users", json={
-                        "username": f"user{i}",
-                        "email": f"user{i}@example.com",
+                        "username": f"user{i}_{RUN_ID}",
+                        "email": f"user{i}_{RUN_ID}@example.com",
                         "displayName": f"User {i}",
                     }) as resp:
                         if resp.status == 201:
@@ -59,7 +68,7 @@ class ManualTester:
             
             # Create posts
             post_ids = []
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(trace_configs=trace) as session:
                 for i in range(50):
                     async with session.post(f"{base_url}/api/posts", json={
                         "userId": user_ids[i % len(user_ids)],
@@ -70,7 +79,7 @@ class ManualTester:
                             post_ids.append(data["id"])
             
             # Add comments
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(trace_configs=trace) as session:
                 for i in range(100):
                     async with session.post(f"{base_url}/api/comments", json={
                         "postId": post_ids[i % len(post_ids)],
@@ -80,7 +89,7 @@ class ManualTester:
                         pass
             
             # Like posts
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(trace_configs=trace) as session:
                 for i in range(100):
                     async with session.post(f"{base_url}/api/likes", json={
                         "postId": post_ids[i % len(post_ids)],
@@ -89,13 +98,13 @@ class ManualTester:
                         pass
             
             # Get feeds
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(trace_configs=trace) as session:
                 for uid in user_ids:
                     async with session.get(f"{base_url}/api/users/{uid}/feed") as resp:
                         pass
             
             total_ms = (time.time() - start) * 1000
-            return {"status": "✓ OK", "time": total_ms, "error": None}
+            return {"status": "✓ OK", "time": total_ms, "error": None, "histogram": histogram}
             
         except Exception as e:
             return {"status": "✗ FAIL", "time": None, "error": str(e)}
@@ -131,7 +140,8 @@ class ManualTester:
                 "name": name,
                 "status": result["status"],
                 "time": result["time"],
-                "error": result["error"]
+                "error": result["error"],
+                "histogram": result.get("histogram"),
             })
             
             if result["status"] == "✓ OK":
@@ -140,6 +150,7 @@ class ManualTester:
                 print(f"  ✗ Test failed: {result['error']}")
         
         self.print_report()
+        self.save_results()
         
         if HAS_GUI:
             self.render_gui()
@@ -164,6 +175,28 @@ class ManualTester:
         
         print("="*80 + "\n")
 
+    def save_results(self):
+        """Persist this run in the benchmark results database"""
+        rows = []
+        for r in self.results:
+            hist = r.get("histogram")
+            rows.append({
+                "framework": r["name"],
+                "test_type": "manual",
+                "status": r["status"],
+                "total_ms": r["time"],
+                "requests": hist.count if hist else None,
+                "requests_per_sec": hist.count * 1000 / r["time"] if hist and r["time"] else None,
+                "p50_ms": hist.percentile(50) if hist else None,
+                "p99_ms": hist.percentile(99) if hist else None,
+                "histogram": hist.to_dict() if hist else None,
+                "error": r["error"],
+            })
+        store = ResultsStore()
+        run_id = store.save_run(rows, {"apis": [a["name"] for a in self.apis]}, source="manual")
+        store.close()
+        print(f"Saved as run {run_id} in {store.path}\n")
+
     def render_gui(self):
         """Render GUI with results"""
         root = tk.Tk()
@@ -8,6 +8,10 @@ import sys
 import asyncio
 import aiohttp
 import time
+import uuid
+
+# Per-run suffix for the test users, as the server rejects taken usernames/emails
+RUN_ID = uuid.uuid4().hex[:6]
 
 async def test_api(port, framework):
     base_url = f"http://localhost:{port}"
@@ -38,8 +42,8 @@ async def test_api(port, framework):
     async with aiohttp.ClientSession() as session:
         for i in range(10):
             async with session.post(f"{base_url}/api/users", json={
-                "username": f"testuser{i}",
-                "email": f"test{i}@example.com",
+                "username": f"testuser{i}_{RUN_ID}",
+                "email": f"test{i}_{RUN_ID}@example.com",
                 "displayName": f"Test User {i}",
             }) as resp:
                 if resp.status == 201:
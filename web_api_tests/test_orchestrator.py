@@ -7,14 +7,24 @@ Tests multiple Social Media API implementations across different frameworks/lang
 import subprocess
 import asyncio
 import aiohttp
+import argparse
 import time
 import json
+import os
+import shutil
+import signal
 import sys
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from dataclasses import dataclass
-from typing import Optional, Dict, List
+from dataclasses import asdict, dataclass
+from typing import Optional, Dict, List, Set, Tuple
 from datetime import datetime
 
+from results_store import DEFAULT_DB, LatencyHistogram, ResultsStore
+
 try:
     import tkinter as tk
     from tkinter import ttk
@@ -24,7 +34,115 @@ try:
 except ImportError:
     HAS_GUI = False
 
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
 ROOT = Path(__file__).resolve().parent.parent
+PROFILE_DIR = ROOT / "web_api_tests" / "profiles"
+
+HAS_AFFINITY = hasattr(os, "sched_setaffinity")
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on"""
+    if HAS_AFFINITY:
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pin_process(cpus: Optional[Set[int]], pid: int = 0):
+    """Pin a process (default: the current one) to a CPU set, where supported"""
+    if cpus and HAS_AFFINITY:
+        os.sched_setaffinity(pid, cpus)
+
+
+def format_cpus(cpus: Optional[Set[int]]) -> str:
+    return ",".join(str(c) for c in sorted(cpus)) if cpus else "all"
+
+
+def plan_cpu_sets(groups: int, client_cpus: int = 1) -> Tuple[List[Optional[Set[int]]], List[Optional[Set[int]]]]:
+    """Split the available CPUs into disjoint (server, client) sets per group
+
+    Every group gets its own client CPUs and its own server CPUs so that
+    neither the load generator nor a neighbouring framework competes with
+    the server under test. Returns ([None], [None]) style plans when there
+    are not enough cores (or no affinity support) to isolate anything.
+    """
+    cpus = available_cpus()
+    per_group = len(cpus) // groups if groups else 0
+    if not HAS_AFFINITY or per_group < client_cpus + 1:
+        return [None] * groups, [None] * groups
+
+    server_sets, client_sets = [], []
+    for g in range(groups):
+        chunk = cpus[g * per_group:(g + 1) * per_group]
+        client_sets.append(set(chunk[:client_cpus]))
+        server_sets.append(set(chunk[client_cpus:]))
+    return server_sets, client_sets
+
+
+def runtime_delta(before: dict, after: dict) -> dict:
+    """GC / loop-lag activity between two /debug/runtime snapshots"""
+    gc_b, gc_a = before["gc"], after["gc"]
+    loop_b, loop_a = before["loop"], after["loop"]
+    samples = loop_a["samples"] - loop_b["samples"]
+    return {
+        "gc_collections": [a - b for a, b in zip(gc_a["collections"], gc_b["collections"])],
+        "gc_pause_ms_total": gc_a["pause_ms_total"] - gc_b["pause_ms_total"],
+        "gc_pause_ms_max": gc_a["pause_ms_max"],
+        "loop_lag_ms_mean": (loop_a["lag_ms_total"] - loop_b["lag_ms_total"]) / samples if samples else 0.0,
+        "loop_lag_ms_max": loop_a["lag_ms_max"],
+    }
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """{"db": 0.12, ...} from a `Server-Timing: db;dur=0.12, ...` header"""
+    phases = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "dur":
+                try:
+                    phases[name] = float(value)
+                except ValueError:
+                    pass
+    return phases
+
+
+def mean_phases(phases: Dict[str, float]) -> Optional[Dict[str, float]]:
+    n = phases.get("_requests")
+    if not n:
+        return None
+    return {name: total / n for name, total in phases.items() if name != "_requests"}
+
+
+def latency_trace_config(histogram: LatencyHistogram,
+                         phases: Optional[Dict[str, float]] = None) -> aiohttp.TraceConfig:
+    """aiohttp hook recording the latency of every request into `histogram`
+
+    If `phases` is given, Server-Timing durations are summed into it, with
+    the number of timed responses under "_requests".
+    """
+    async def on_request_start(session, ctx, params):
+        ctx.start = time.perf_counter()
+
+    async def on_request_end(session, ctx, params):
+        histogram.record((time.perf_counter() - ctx.start) * 1000)
+        if phases is not None:
+            header = params.response.headers.get("Server-Timing")
+            if header:
+                phases["_requests"] = phases.get("_requests", 0) + 1
+                for name, dur in parse_server_timing(header).items():
+                    phases[name] = phases.get(name, 0.0) + dur
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    return trace
 
 
 @dataclass
@@ -35,109 +153,289 @@ class APITestResult:
     status: str
     output: str
     requests_per_sec: Optional[float] = None
+    startup_ms: Optional[float] = None  # cold start of the server process the test ran against
+    trial: int = 0
+    requests: Optional[int] = None
+    p50_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+    histogram: Optional[dict] = None  # LatencyHistogram.to_dict()
+    server_timing: Optional[dict] = None  # mean server-side ms per phase (Server-Timing header)
+    resources: Optional[dict] = None  # ResourceSampler.summary() (+ "runtime" for Python)
+
+
+class ResourceSampler:
+    """Samples CPU, RSS, threads and open FDs of a server process tree
+
+    Runs in a thread so the sampling does not perturb the client's event
+    loop. Children are included because `dotnet run` and `cargo run` serve
+    from a child process.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.root = psutil.Process(pid)
+        self.interval = interval
+        self.samples: List[dict] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._start_time = 0.0
+        self._start_cpu = 0.0
+
+    def _tree(self) -> List["psutil.Process"]:
+        try:
+            return [self.root] + self.root.children(recursive=True)
+        except psutil.Error:
+            return []
+
+    def _cpu_seconds(self, procs) -> float:
+        total = 0.0
+        for p in procs:
+            try:
+                t = p.cpu_times()
+                total += t.user + t.system
+            except psutil.Error:
+                pass
+        return total
+
+    def _sample(self) -> dict:
+        procs = self._tree()
+        rss = threads = fds = 0
+        for p in procs:
+            try:
+                with p.oneshot():
+                    rss += p.memory_info().rss
+                    threads += p.num_threads()
+                    fds += p.num_fds() if hasattr(p, "num_fds") else p.num_handles()
+            except psutil.Error:
+                pass
+        return {"t": time.perf_counter(), "cpu_s": self._cpu_seconds(procs),
+                "rss": rss, "threads": threads, "fds": fds}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.samples.append(self._sample())
+
+    def start(self):
+        self.samples.append(self._sample())
+        self._thread.start()
+
+    def stop(self) -> dict:
+        if self._stop.is_set():
+            return self.summary()
+        self._stop.set()
+        self._thread.join()
+        self.samples.append(self._sample())
+        return self.summary()
+
+    def summary(self) -> dict:
+        first, last = self.samples[0], self.samples[-1]
+        wall = max(last["t"] - first["t"], 1e-9)
+        cpu_s = last["cpu_s"] - first["cpu_s"]
+        peak_cpu = 0.0
+        for a, b in zip(self.samples, self.samples[1:]):
+            if b["t"] > a["t"]:
+                peak_cpu = max(peak_cpu, (b["cpu_s"] - a["cpu_s"]) / (b["t"] - a["t"]) * 100)
+        return {
+            "cpu_seconds": cpu_s,
+            "cpu_avg_pct": cpu_s / wall * 100,
+            "cpu_peak_pct": peak_cpu,
+            "rss_start_mb": first["rss"] / 2**20,
+            "rss_peak_mb": max(s["rss"] for s in self.samples) / 2**20,
+            "rss_end_mb": last["rss"] / 2**20,
+            "threads_max": max(s["threads"] for s in self.samples),
+            "fds_max": max(s["fds"] for s in self.samples),
+            "samples": len(self.samples),
+        }
 
 
 class APITester:
-    def __init__(self):
+    def __init__(self, profile: bool = False):
         self.results: List[APITestResult] = []
+        self.profile = profile  # capture a sampling profile during stress phases
         self.servers = [
-            {"name": "Node.js/Express", "port": 3000, "dir": ROOT / "web_api_tests" / "nodejs"},
-            {"name": "Python/FastAPI", "port": 3001, "dir": ROOT / "web_api_tests" / "python"},
-            {"name": "C#/.NET", "port": 3002, "dir": ROOT / "web_api_tests" / "csharp"},
-            {"name": "Rust/Actix", "port": 3003, "dir": ROOT / "web_api_tests" / "rust"},
+            {"name": "Node.js/Express", "port": 3000, "dir": ROOT / "web_api_tests" / "nodejs",
+             "cmd": ["node", "src/server.js"], "startup_timeout": 30},
+            {"name": "Python/FastAPI", "port": 3001, "dir": ROOT / "web_api_tests" / "python",
+             "cmd": [sys.executable, "main.py"], "startup_timeout": 30,
+             "runtime_stats": "/debug/runtime", "profile": "/admin/profile"},
+            # Same app on the durable SQLite backend; every start gets a new database file
+            {"name": "Python/FastAPI (SQLite)", "key": "python-sqlite", "port": 3004,
+             "dir": ROOT / "web_api_tests" / "python", "cmd": [sys.executable, "main.py"], "startup_timeout": 30,
+             "env": {"STORAGE_BACKEND": "sqlite", "PORT": "3004"}, "fresh_db_env": "SQLITE_PATH",
+             "runtime_stats": "/debug/runtime", "profile": "/admin/profile"},
+            {"name": "C#/.NET", "port": 3002, "dir": ROOT / "web_api_tests" / "csharp",
+             "cmd": ["dotnet", "run", "-c", "Release"], "startup_timeout": 180},
+            # Rust - Optional (kann fehlen, ist ok)
+            {"name": "Rust/Actix", "port": 3003, "dir": ROOT / "web_api_tests" / "rust",
+             "cmd": ["cargo", "run", "--release", "--bin", "server"],
+             # First `cargo run --release` compiles the whole crate graph
+             "startup_timeout": 900, "optional": True},
         ]
+        self.test_types = ["load", "stress", "concurrent"]
         self.processes = {}
-
-    def start_servers(self):
-        """Start all API servers"""
-        print("\n" + "=" * 80)
-        print("STARTING API SERVERS".center(80))
-        print("=" * 80 + "\n")
-
-        # Node.js
-        print("[1/4] Starting Node.js/Express server...")
-        try:
-            proc = subprocess.Popen(
-                ["node", "src/server.js"],
-                cwd=str(self.servers[0]["dir"]),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == "win32" else 0,
-            )
-            self.processes["Node.js"] = proc
-            print("  ✓ Node.js running on port 3000")
-            time.sleep(2)
-        except Exception as e:
-            print(f"  ✗ Failed: {e}")
-
-        # Python
-        print("[2/4] Starting Python/FastAPI server...")
+        self.startup_ms: Dict[str, Optional[float]] = {}
+        self.scratch_dirs: Dict[str, str] = {}
+
+    @staticmethod
+    def server_key(server: dict) -> str:
+        """Short name of a server entry: its "key", else its directory name (e.g. "python")"""
+        return server.get("key", server["dir"].name)
+
+    def get_server(self, key: str) -> dict:
+        """Find a server entry by name or short name"""
+        for server in self.servers:
+            if key.lower() in (server["name"].lower(), self.server_key(server).lower()):
+                return server
+        raise KeyError(f"Unknown framework: {key}")
+
+    async def wait_until_healthy(self, port: int, timeout: float,
+                                 proc: Optional[subprocess.Popen] = None) -> bool:
+        """Poll /health with exponential backoff until it answers 200
+
+        Gives up after `timeout` seconds, or immediately if `proc` exits.
+        """
+        url = f"http://localhost:{port}/health"
+        deadline = time.perf_counter() + timeout
+        delay = 0.01
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as session:
+            while time.perf_counter() < deadline:
+                try:
+                    async with session.get(url) as resp:
+                        if resp.status == 200:
+                            return True
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                if proc is not None and proc.poll() is not None:
+                    return False
+                await asyncio.sleep(min(delay, max(deadline - time.perf_counter(), 0)))
+                delay = min(delay * 2, 0.5)
+        return False
+
+    async def start_server(self, server: dict, cpus: Optional[Set[int]] = None) -> bool:
+        """Spawn a single API server and wait until it is healthy
+
+        The time from spawn to the first healthy response is recorded as the
+        framework's cold-start time.
+        """
+        name = server["name"]
+        pin = f" on CPUs {format_cpus(cpus)}" if cpus else ""
+        self.startup_ms[name] = None
+        env = dict(os.environ, **server.get("env", {}))
+        if server.get("fresh_db_env"):
+            # New database file per start, so each isolated run begins empty like the in-memory servers
+            self.scratch_dirs[name] = tempfile.mkdtemp(prefix=f"{self.server_key(server)}-")
+            env[server["fresh_db_env"]] = os.path.join(self.scratch_dirs[name], "social.db")
+        if self.profile and server.get("profile"):
+            env["PROFILER_ENABLED"] = "1"
         try:
+            spawned = time.perf_counter()
             proc = subprocess.Popen(
-                [sys.executable, "main.py"],
-                cwd=str(self.servers[1]["dir"]),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                server["cmd"],
+                cwd=str(server["dir"]),
+                env=env,
+                # Server logs are not read; a filled PIPE would stall the server mid-benchmark
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
                 creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == "win32" else 0,
+                # Own session so `dotnet run` / `cargo run` children die with the group
+                start_new_session=sys.platform != "win32",
+                preexec_fn=(lambda: pin_process(cpus)) if cpus and HAS_AFFINITY else None,
             )
-            self.processes["Python"] = proc
-            print("  ✓ Python running on port 3001")
-            time.sleep(3)
         except Exception as e:
-            print(f"  ✗ Failed: {e}")
+            if server.get("optional"):
+                print(f"  ⚠ {name} startup skipped (optional): {e}")
+            else:
+                print(f"  ✗ {name} failed: {e}")
+            return False
+
+        self.processes[name] = proc
+        if not await self.wait_until_healthy(server["port"], server["startup_timeout"], proc):
+            reason = "exited" if proc.poll() is not None else f"not healthy after {server['startup_timeout']}s"
+            print(f"  ✗ {name} {reason}")
+            self.stop_server(server)
+            return False
+
+        startup_ms = (time.perf_counter() - spawned) * 1000
+        self.startup_ms[name] = startup_ms
+        print(f"  ✓ {name} running on port {server['port']}{pin} (ready after {startup_ms:.0f}ms)")
+        return True
+
+    def stop_server(self, server: dict):
+        """Stop a single API server and wait until it has exited"""
+        proc = self.processes.pop(server["name"], None)
+        if proc is not None:
+            try:
+                if sys.platform == "win32":
+                    proc.terminate()
+                else:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait(timeout=10)
+            except Exception:
+                pass
+        scratch = self.scratch_dirs.pop(server["name"], None)
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
 
-        # C#
-        print("[3/4] Starting C#/.NET server...")
-        try:
-            proc = subprocess.Popen(
-                ["dotnet", "run", "-c", "Release"],
-                cwd=str(self.servers[2]["dir"]),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == "win32" else 0,
-            )
-            self.processes["C#"] = proc
-            print("  ✓ C# running on port 3002")
-            time.sleep(3)
-        except Exception as e:
-            print(f"  ✗ Failed: {e}")
+    async def start_servers(self):
+        """Start all API servers concurrently"""
+        print("\n" + "=" * 80)
+        print("STARTING API SERVERS".center(80))
+        print("=" * 80 + "\n")
 
-        # Rust - Optional (kann fehlen, ist ok)
-        print("[4/4] Starting Rust/Actix server (optional)...")
-        try:
-            proc = subprocess.Popen(
-                ["cargo", "run", "--release", "--bin", "server"],
-                cwd=str(self.servers[3]["dir"]),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == "win32" else 0,
-            )
-            self.processes["Rust"] = proc
-            print("  ✓ Rust running on port 3003")
-            time.sleep(3)
-        except Exception as e:
-            print(f"  ⚠ Rust startup skipped (optional): {e}")
+        print(f"Starting {len(self.servers)} servers...")
+        await asyncio.gather(*(self.start_server(server) for server in self.servers))
+
+    async def run_isolated(self, server: dict, cpus: Optional[Set[int]] = None,
+                           test_types: Optional[List[str]] = None, trials: int = 1):
+        """Run each test type against a freshly started server
+
+        Restarting per test type guarantees an empty Database, so e.g. the
+        stress numbers no longer include the data left over by the load test.
+        """
+        for trial in range(trials):
+            for test_type in test_types or self.test_types:
+                if not await self.start_server(server, cpus):
+                    self.results.append(APITestResult(
+                        framework=server["name"],
+                        test_type=test_type,
+                        total_ms=None,
+                        status="✗ FAIL",
+                        output="Server did not become healthy",
+                        trial=trial,
+                    ))
+                    continue
+                try:
+                    await self.run_test(server["name"], server["port"], test_type, trial)
+                finally:
+                    self.stop_server(server)
 
-    async def run_test(self, framework: str, port: int, test_type: str):
+    async def run_test(self, framework: str, port: int, test_type: str, trial: int = 0):
         """Run a test against an API server"""
         base_url = f"http://localhost:{port}"
-        max_retries = 5
-        
-        # Wait for server to be ready
-        for attempt in range(max_retries):
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(f"{base_url}/health", timeout=aiohttp.ClientTimeout(total=5)) as resp:
-                        if resp.status == 200:
-                            break
-            except:
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(1)
-                    continue
-        
+        startup_ms = self.startup_ms.get(framework)
+
+        if not await self.wait_until_healthy(port, timeout=5):
+            self.results.append(APITestResult(
+                framework=framework,
+                test_type=test_type,
+                total_ms=None,
+                status="✗ FAIL",
+                output="Server not healthy",
+                startup_ms=startup_ms,
+                trial=trial,
+            ))
+            return
+
+        histogram = LatencyHistogram()
+        phases: Dict[str, float] = {}
+        sampler = self._start_sampler(framework)
+        runtime_before = await self._runtime_stats(framework, port)
+        profile_task = None
+        if self.profile and test_type == "stress":
+            profile_task = self._start_profile(framework, port)
         try:
             timeout = aiohttp.ClientTimeout(total=60)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with aiohttp.ClientSession(timeout=timeout,
+                                             trace_configs=[latency_trace_config(histogram, phases)]) as session:
                 start = time.time()
 
                 if test_type == "load":
@@ -148,9 +446,16 @@ class APITester:
                     await self._concurrent_test(session, base_url, framework)
 
                 total_ms = (time.time() - start) * 1000
+                if profile_task is not None:
+                    await self._finish_profile(framework, port, profile_task, f"{test_type}-trial{trial}")
+                    profile_task = None
+                resources = self._resource_summary(sampler, histogram.count)
+                runtime_after = await self._runtime_stats(framework, port)
+                if runtime_before and runtime_after and resources is not None:
+                    resources["runtime"] = runtime_delta(runtime_before, runtime_after)
                 status = "✓ OK"
                 output = f"{framework} {test_type} test completed"
-                rps = (5000 * 1000 / total_ms) if total_ms > 0 else 0
+                rps = (histogram.count * 1000 / total_ms) if total_ms > 0 else 0
 
                 result = APITestResult(
                     framework=framework,
@@ -159,28 +464,112 @@ class APITester:
                     status=status,
                     output=output,
                     requests_per_sec=rps,
+                    startup_ms=startup_ms,
+                    trial=trial,
+                    requests=histogram.count,
+                    p50_ms=histogram.percentile(50),
+                    p99_ms=histogram.percentile(99),
+                    histogram=histogram.to_dict(),
+                    resources=resources,
+                    server_timing=mean_phases(phases),
                 )
                 self.results.append(result)
 
         except Exception as e:
+            if sampler is not None:
+                sampler.stop()
+            if profile_task is not None:
+                profile_task.cancel()
             result = APITestResult(
                 framework=framework,
                 test_type=test_type,
                 total_ms=None,
                 status="✗ FAIL",
                 output=str(e),
+                startup_ms=startup_ms,
+                trial=trial,
             )
             self.results.append(result)
 
+    def _start_profile(self, framework: str, port: int) -> Optional[asyncio.Task]:
+        """Ask a server with a profiling endpoint to start sampling itself"""
+        server = next((s for s in self.servers if s["name"] == framework), None)
+        if not server or not server.get("profile"):
+            return None
+
+        async def capture():
+            url = f"http://localhost:{port}{server['profile']}"
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=330)) as session:
+                async with session.post(url, params={"seconds": "300", "format": "speedscope"}) as resp:
+                    return await resp.read() if resp.status == 200 else None
+
+        return asyncio.ensure_future(capture())
+
+    async def _finish_profile(self, framework: str, port: int, task: asyncio.Task, label: str):
+        """Stop the running profile and save it as speedscope JSON"""
+        server = next(s for s in self.servers if s["name"] == framework)
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+                async with session.post(f"http://localhost:{port}{server['profile']}/stop"):
+                    pass
+            body = await asyncio.wait_for(task, timeout=10)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            body = None
+        if not body:
+            print(f"  ⚠ No profile captured for {framework}")
+            return
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        slug = self.server_key(server)
+        path = PROFILE_DIR / f"{slug}-{label}-{datetime.now():%Y%m%d-%H%M%S}.speedscope.json"
+        path.write_bytes(body)
+        print(f"  ✓ Profile saved: {path} (open at https://www.speedscope.app)")
+
+    def _start_sampler(self, framework: str) -> Optional[ResourceSampler]:
+        """Start sampling the server process of `framework`, if we spawned it"""
+        proc = self.processes.get(framework)
+        if not HAS_PSUTIL or proc is None:
+            return None
+        try:
+            sampler = ResourceSampler(proc.pid)
+            sampler.start()
+            return sampler
+        except psutil.Error:
+            return None
+
+    def _resource_summary(self, sampler: Optional[ResourceSampler], requests: int) -> Optional[dict]:
+        """Stop the sampler and derive per-request efficiency figures"""
+        if sampler is None:
+            return None
+        summary = sampler.stop()
+        if requests:
+            summary["cpu_ms_per_request"] = summary["cpu_seconds"] * 1000 / requests
+            growth = (summary["rss_end_mb"] - summary["rss_start_mb"]) * 2**20
+            summary["rss_bytes_per_request"] = growth / requests
+        return summary
+
+    async def _runtime_stats(self, framework: str, port: int) -> Optional[dict]:
+        """GC / event-loop stats of servers that expose them (resets the maxima)"""
+        server = next((s for s in self.servers if s["name"] == framework), None)
+        if not server or not server.get("runtime_stats"):
+            return None
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+                async with session.get(f"http://localhost:{port}{server['runtime_stats']}",
+                                       params={"reset": "true"}) as resp:
+                    return await resp.json() if resp.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
     async def _load_test(self, session, base_url, framework):
         """Simulate load test: 100 users, 500 posts, 1000 comments, 2000 likes"""
+        run_id = uuid.uuid4().hex[:6]  # unique usernames across trials on a shared server
         user_ids = []
         for i in range(100):
             async with session.post(
                 f"{base_url}/api/users",
                 json={
-                    "username": f"user{i}",
-                    "email": f"user{i}@example.com",
+                    "username": f"user{i}_{run_id}",
+                    "email": f"user{i}_{run_id}@example.com",
                     "displayName": f"User {i}",
                 },
             ) as resp:
@@ -219,13 +608,14 @@ class APITester:
 
     async def _stress_test(self, session, base_url, framework):
         """Stress test: Rapid operations"""
+        run_id = uuid.uuid4().hex[:6]  # unique usernames across trials on a shared server
         user_ids = []
         for i in range(100):
             async with session.post(
                 f"{base_url}/api/users",
                 json={
-                    "username": f"stress{i}",
-                    "email": f"stress{i}@example.com",
+                    "username": f"stress{i}_{run_id}",
+                    "email": f"stress{i}_{run_id}@example.com",
                     "displayName": f"Stress {i}",
                 },
             ) as resp:
@@ -257,14 +647,15 @@ class APITester:
 
     async def _concurrent_test(self, session, base_url, framework):
         """Concurrent test: Parallel operations"""
+        run_id = uuid.uuid4().hex[:6]  # unique usernames across trials on a shared server
         user_ids = []
         tasks = []
         for i in range(50):
             task = session.post(
                 f"{base_url}/api/users",
                 json={
-                    "username": f"concurrent{i}",
-                    "email": f"concurrent{i}@example.com",
+                    "username": f"concurrent{i}_{run_id}",
+                    "email": f"concurrent{i}_{run_id}@example.com",
                     "displayName": f"Concurrent {i}",
                 },
             )
@@ -296,29 +687,28 @@ class APITester:
         print("\n" + "=" * 80)
         print("STOPPING API SERVERS".center(80))
         print("=" * 80 + "\n")
-        
-        for name, proc in self.processes.items():
-            try:
-                if sys.platform == "win32":
-                    proc.terminate()
-                else:
-                    proc.kill()
-                print(f"  ✓ Stopped {name}")
-            except:
-                pass
+
+        for server in self.servers:
+            if server["name"] in self.processes:
+                self.stop_server(server)
+                print(f"  ✓ Stopped {server['name']}")
 
     def print_report(self):
         """Print test results to console"""
         print("\n" + "=" * 100)
         print("API PERFORMANCE TEST RESULTS".center(100))
         print("=" * 100)
-        print(f"\n{'Framework':<20} {'Test Type':<15} {'Status':<12} {'Total (ms)':<15} {'Req/sec':<15}")
+        print(f"\n{'Framework':<20} {'Test Type':<15} {'Status':<12} {'Total (ms)':<15} {'Req/sec':<10} "
+              f"{'p99 (ms)':<10} {'Startup (ms)':<15}")
         print("-" * 100)
 
         for r in self.results:
             time_str = f"{r.total_ms:.1f}" if r.total_ms else "n/a"
             rps_str = f"{r.requests_per_sec:.0f}" if r.requests_per_sec else "n/a"
-            print(f"{r.framework:<20} {r.test_type:<15} {r.status:<12} {time_str:<15} {rps_str:<15}")
+            p99_str = f"{r.p99_ms:.2f}" if r.p99_ms else "n/a"
+            startup_str = f"{r.startup_ms:.0f}" if r.startup_ms else "n/a"
+            print(f"{r.framework:<20} {r.test_type:<15} {r.status:<12} {time_str:<15} {rps_str:<10} "
+                  f"{p99_str:<10} {startup_str:<15}")
 
         # Summary by framework
         print("\n" + "=" * 100)
@@ -336,6 +726,69 @@ class APITester:
         for fw, total in sorted(framework_totals.items(), key=lambda x: x[1]):
             print(f"{fw:<20} {total:<15.1f}")
 
+        # Cold start: spawn until first healthy /health response
+        print("\n" + "=" * 100)
+        print("COLD START TIME (SPAWN -> FIRST HEALTHY RESPONSE)".center(100))
+        print("=" * 100)
+
+        startups: Dict[str, List[float]] = {}
+        for r in self.results:
+            if r.startup_ms:
+                startups.setdefault(r.framework, []).append(r.startup_ms)
+
+        print(f"\n{'Framework':<20} {'Mean (ms)':<15} {'Min (ms)':<15} {'Max (ms)':<15} {'Samples':<10}")
+        print("-" * 100)
+        for fw, samples in sorted(startups.items(), key=lambda x: sum(x[1]) / len(x[1])):
+            mean = sum(samples) / len(samples)
+            print(f"{fw:<20} {mean:<15.0f} {min(samples):<15.0f} {max(samples):<15.0f} {len(samples):<10}")
+
+    def print_resource_report(self):
+        """Print server resource usage next to throughput"""
+        rows = [r for r in self.results if r.resources]
+        if not rows:
+            if not HAS_PSUTIL:
+                print("\n(psutil not installed - no server resource sampling)")
+            return
+
+        print("\n" + "=" * 130)
+        print("SERVER RESOURCES PER TEST (CPU / MEMORY EFFICIENCY)".center(130))
+        print("=" * 130)
+        print(f"\n{'Framework':<20} {'Test Type':<12} {'Req/sec':<9} {'CPU avg%':<9} {'CPU ms/req':<11} "
+              f"{'RSS peak MB':<12} {'RSS B/req':<10} {'Threads':<8} {'FDs':<6} {'GC (0/1/2)':<12} "
+              f"{'GC ms':<7} {'Lag max ms':<10}")
+        print("-" * 130)
+        for r in rows:
+            res = r.resources
+            rps = f"{r.requests_per_sec:.0f}" if r.requests_per_sec else "n/a"
+            cpu_req = f"{res['cpu_ms_per_request']:.3f}" if "cpu_ms_per_request" in res else "n/a"
+            rss_req = f"{res['rss_bytes_per_request']:.0f}" if "rss_bytes_per_request" in res else "n/a"
+            rt = res.get("runtime")
+            gc_str = "/".join(str(n) for n in rt["gc_collections"]) if rt else "n/a"
+            gc_ms = f"{rt['gc_pause_ms_total']:.1f}" if rt else "n/a"
+            lag = f"{rt['loop_lag_ms_max']:.1f}" if rt else "n/a"
+            print(f"{r.framework:<20} {r.test_type:<12} {rps:<9} {res['cpu_avg_pct']:<9.0f} {cpu_req:<11} "
+                  f"{res['rss_peak_mb']:<12.1f} {rss_req:<10} {res['threads_max']:<8} {res['fds_max']:<6} "
+                  f"{gc_str:<12} {gc_ms:<7} {lag:<10}")
+
+    def print_phase_report(self):
+        """Print the server-side latency breakdown for servers sending Server-Timing"""
+        rows = [r for r in self.results if r.server_timing]
+        if not rows:
+            return
+        phases = []
+        for r in rows:
+            phases += [p for p in r.server_timing if p not in phases]
+
+        print("\n" + "=" * 100)
+        print("SERVER-SIDE LATENCY BY PHASE (MEAN MS PER REQUEST, FROM SERVER-TIMING)".center(100))
+        print("=" * 100)
+        print(f"\n{'Framework':<20} {'Test Type':<12} " + " ".join(f"{p:<14}" for p in phases))
+        print("-" * 100)
+        for r in rows:
+            cells = " ".join(f"{r.server_timing[p]:<14.3f}" if p in r.server_timing else f"{'n/a':<14}"
+                             for p in phases)
+            print(f"{r.framework:<20} {r.test_type:<12} {cells}")
+
     def render_gui(self):
         """Render GUI with results"""
         if not HAS_GUI:
@@ -351,7 +804,7 @@ class APITester:
 
         ttk.Label(frame_left, text="Test Results", font=("Arial", 12, "bold")).pack(anchor=tk.W)
 
-        cols = ("Framework", "Type", "Status", "Time (ms)", "Req/sec")
+        cols = ("Framework", "Type", "Status", "Time (ms)", "Req/sec", "Startup (ms)")
         tree = ttk.Treeview(frame_left, columns=cols, show="headings", height=15)
         for c in cols:
             tree.heading(c, text=c)
@@ -361,7 +814,8 @@ class APITester:
         for r in self.results:
             time_val = f"{r.total_ms:.1f}" if r.total_ms else "n/a"
             rps_val = f"{r.requests_per_sec:.0f}" if r.requests_per_sec else "n/a"
-            tree.insert("", tk.END, values=(r.framework, r.test_type, r.status, time_val, rps_val))
+            startup_val = f"{r.startup_ms:.0f}" if r.startup_ms else "n/a"
+            tree.insert("", tk.END, values=(r.framework, r.test_type, r.status, time_val, rps_val, startup_val))
 
         # Chart
         frame_right = ttk.Frame(root)
@@ -394,48 +848,109 @@ class APITester:
         root.mainloop()
 
 
-async def main():
-    tester = APITester()
-    
+def run_framework_worker(key: str, test_types: List[str],
+                         server_cpus: Optional[Set[int]],
+                         client_cpus: Optional[Set[int]],
+                         trials: int = 1, profile: bool = False) -> List[APITestResult]:
+    """Entry point for --parallel: one isolated framework run per process"""
+    pin_process(client_cpus)
+    tester = APITester(profile)
+    server = tester.get_server(key)
     try:
-        # Start servers
-        tester.start_servers()
-        time.sleep(2)
+        asyncio.run(tester.run_isolated(server, server_cpus, test_types, trials))
+    finally:
+        tester.stop_servers()
+    return tester.results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API benchmarks against all frameworks")
+    parser.add_argument("--frameworks", nargs="+", default=None,
+                        help="Subset to run, e.g. nodejs python python-sqlite csharp rust (default: all)")
+    parser.add_argument("--tests", nargs="+", default=None, choices=["load", "stress", "concurrent"],
+                        help="Test types to run (default: all)")
+    parser.add_argument("--shared", action="store_true",
+                        help="Legacy mode: start every server once and run all tests against it")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Run independent frameworks at the same time on disjoint CPU sets")
+    parser.add_argument("--client-cpus", type=int, default=1,
+                        help="CPUs reserved for the load generator of each framework (default: 1)")
+    parser.add_argument("--trials", type=int, default=1,
+                        help="Repetitions of every test, needed for regression statistics (default: 1)")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB,
+                        help=f"Results database (default: {DEFAULT_DB})")
+    parser.add_argument("--no-save", action="store_true", help="Do not persist this run")
+    parser.add_argument("--profile", action="store_true",
+                        help="Capture a sampling profile during each stress phase (servers that support it)")
+    parser.add_argument("--no-gui", action="store_true", help="Skip the Tk result window")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    tester = APITester(args.profile)
+    servers = [tester.get_server(k) for k in args.frameworks] if args.frameworks else tester.servers
+    test_types = args.tests or tester.test_types
 
-        # Run tests
+    try:
         print("\n" + "=" * 80)
         print("RUNNING API TESTS".center(80))
         print("=" * 80 + "\n")
 
-        # Node.js tests
-        print("Testing Node.js/Express...")
-        await tester.run_test("Node.js/Express", 3000, "load")
-        await tester.run_test("Node.js/Express", 3000, "stress")
-        await tester.run_test("Node.js/Express", 3000, "concurrent")
-
-        # Python tests
-        print("Testing Python/FastAPI...")
-        await tester.run_test("Python/FastAPI", 3001, "load")
-        await tester.run_test("Python/FastAPI", 3001, "stress")
-        await tester.run_test("Python/FastAPI", 3001, "concurrent")
-
-        # C# tests
-        print("Testing C#/.NET...")
-        await tester.run_test("C#/.NET", 3002, "load")
-        await tester.run_test("C#/.NET", 3002, "stress")
-        await tester.run_test("C#/.NET", 3002, "concurrent")
-
-        # Rust tests
-        print("Testing Rust/Actix...")
-        await tester.run_test("Rust/Actix", 3003, "load")
-        await tester.run_test("Rust/Actix", 3003, "stress")
-        await tester.run_test("Rust/Actix", 3003, "concurrent")
+        if args.shared:
+            # Start servers
+            tester.servers = servers
+            await tester.start_servers()
+            for server in servers:
+                print(f"Testing {server['name']}...")
+                for trial in range(args.trials):
+                    for test_type in test_types:
+                        await tester.run_test(server["name"], server["port"], test_type, trial)
+
+        elif args.parallel:
+            server_sets, client_sets = plan_cpu_sets(len(servers), args.client_cpus)
+            if server_sets[0] is None:
+                print("  ⚠ Not enough CPUs to isolate frameworks, runs will share cores")
+            loop = asyncio.get_running_loop()
+            with ProcessPoolExecutor(max_workers=len(servers)) as pool:
+                futures = [
+                    loop.run_in_executor(pool, run_framework_worker, tester.server_key(server),
+                                         test_types, server_sets[i], client_sets[i], args.trials,
+                                         args.profile)
+                    for i, server in enumerate(servers)
+                ]
+                for results in await asyncio.gather(*futures):
+                    tester.results.extend(results)
+
+        else:
+            # One framework at a time: it may use every core except the client's
+            server_sets, client_sets = plan_cpu_sets(1, args.client_cpus)
+            pin_process(client_sets[0])
+            for server in servers:
+                print(f"Testing {server['name']}...")
+                await tester.run_isolated(server, server_sets[0], test_types, args.trials)
 
         # Print results
         tester.print_report()
+        tester.print_resource_report()
+        tester.print_phase_report()
+
+        if not args.no_save:
+            store = ResultsStore(args.db)
+            config = {
+                "frameworks": [s["name"] for s in servers],
+                "tests": test_types,
+                "trials": args.trials,
+                "mode": "shared" if args.shared else "parallel" if args.parallel else "isolated",
+                "client_cpus": args.client_cpus,
+            }
+            run_id = store.save_run([asdict(r) for r in tester.results], config)
+            store.close()
+            print(f"\nSaved as run {run_id} in {args.db} "
+                  f"(compare with: python results_store.py compare <baseline> {run_id})")
 
         # Show GUI
-        if HAS_GUI:
+        if HAS_GUI and not args.no_gui:
             print("\nLaunching GUI...")
             tester.render_gui()
 